@@ -1,28 +1,77 @@
 from django.contrib import admin
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
 from .models import (
     BudgetYear, Plan, Project, Category, BudgetItem,
     MonthlyPlan, File, Image, TypeInvoice, Invoice
 )
 from image_uploader_widget.admin import ImageUploaderInline, OrderedImageUploaderInline
-from . import forms
+from . import analytics, audit, forms, tasks
+from .autocomplete import ScopedAutocompleteMixin
+from .deletion import BulkDeleteMixin
+from .exports import StreamingExportMixin
+from .pagination import KeysetPaginationMixin
+from .search import FullTextSearchMixin
 
 @admin.register(BudgetYear)
-class BudgetYearAdmin(admin.ModelAdmin):
+class BudgetYearAdmin(BulkDeleteMixin, admin.ModelAdmin):
     list_display = ('fiscal_year', 'department', 'office', 'allocated_budget', 'created_at', 'updated_at')
     search_fields = ('fiscal_year', 'department', 'section', 'office')
     list_filter = ('fiscal_year', 'department')
+    actions = ['audit_budget', 'bulk_delete_tree']
+    bulk_delete_root = 'budget_years'
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('<path:object_id>/audit/', self.admin_site.admin_view(self.audit_view), name='%s_%s_audit' % info),
+        ] + super().get_urls()
+
+    def audit_view(self, request, object_id):
+        year = self.get_object(request, unquote(object_id))
+        if year is None or not self.has_view_permission(request, year):
+            raise PermissionDenied
+        return self.render_audit(request, [year])
+
+    @admin.action(description="ตรวจสอบงบประมาณ")
+    def audit_budget(self, request, queryset):
+        return self.render_audit(request, list(queryset))
+
+    def render_audit(self, request, years):
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "ตรวจสอบงบประมาณ",
+            'years': years,
+            'issues': audit.audit(years),
+        }
+        return TemplateResponse(request, 'admin/app_budget/budgetyear/audit.html', context)
 
 @admin.register(Plan)
-class PlanAdmin(admin.ModelAdmin):
+class PlanAdmin(ScopedAutocompleteMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('plan_name', 'plan_code', 'fiscal_year', 'allocated_budget', 'created_at', 'updated_at')
+    list_select_related = ('fiscal_year',)
     search_fields = ('plan_name', 'plan_code')
     list_filter = ('fiscal_year',)
+    ordering = ('sort_order', 'id')
+    autocomplete_fields = ('fiscal_year',)
+    autocomplete_filters = {'fiscal_year': 'fiscal_year_id'}
+    autocomplete_search_fields = ('plan_name', 'plan_code')
 
 @admin.register(Project)
-class ProjectAdmin(admin.ModelAdmin):
+class ProjectAdmin(BulkDeleteMixin, ScopedAutocompleteMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('project_name', 'project_code', 'fiscal_year', 'plan', 'project_status', 'created_at', 'updated_at')
+    list_select_related = ('fiscal_year', 'plan')
     search_fields = ('project_name', 'project_code')
-    list_filter = ('fiscal_year', 'project_status')
+    list_filter = ('fiscal_year', 'plan', 'project_status')
+    ordering = ('sort_order', 'id')
+    autocomplete_fields = ('fiscal_year', 'plan')
+    autocomplete_scopes = {'plan': 'fiscal_year'}
+    autocomplete_search_fields = ('project_name', 'project_code')
+    actions = ['bulk_delete_tree']
+    bulk_delete_root = 'projects'
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -30,14 +79,52 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ('category_name',)
 
 @admin.register(BudgetItem)
-class BudgetItemAdmin(admin.ModelAdmin):
-    list_display = ('budget_item_name', 'project', 'allocated_budget', 'category', 'created_at', 'updated_at')
+class BudgetItemAdmin(ScopedAutocompleteMixin, FullTextSearchMixin, admin.ModelAdmin):
+    list_display = (
+        'budget_item_name', 'project', 'allocated_budget', 'category', 'variance', 'burn_rate_percent',
+        'projected_year_end', 'created_at', 'updated_at',
+    )
+    list_select_related = ('project', 'category')
     search_fields = ('budget_item_name', 'project__project_name')
     list_filter = ('project', 'category')
+    autocomplete_fields = ('project', 'main_budget_item', 'category')
+    autocomplete_scopes = {'main_budget_item': 'project'}
+    autocomplete_filters = {'project': 'project_id', 'fiscal_year': 'project__plan__fiscal_year_id'}
+    autocomplete_search_fields = ('budget_item_name', 'sort_number')
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        # Burn-rate metrics for the whole page in one query
+        items = changelist.result_list
+        metrics = analytics.item_metrics(
+            MonthlyPlan.objects.filter(budget_item__in=[item.pk for item in items]), analytics.default_as_of(),
+        )
+        for item in items:
+            item.analytics = metrics.get(item.pk, {})
+        return changelist
+
+    @admin.display(description="ผลต่างผล-แผน")
+    def variance(self, obj):
+        return getattr(obj, 'analytics', {}).get('variance')
+
+    @admin.display(description="อัตราการเบิกจ่าย (%)")
+    def burn_rate_percent(self, obj):
+        return getattr(obj, 'analytics', {}).get('burn_rate_percent')
+
+    @admin.display(description="คาดการณ์ผลสิ้นปี")
+    def projected_year_end(self, obj):
+        return getattr(obj, 'analytics', {}).get('projected_year_end')
 
 @admin.register(MonthlyPlan)
-class MonthlyPlanAdmin(admin.ModelAdmin):
+class MonthlyPlanAdmin(FullTextSearchMixin, KeysetPaginationMixin, StreamingExportMixin, admin.ModelAdmin):
     list_display = ('budget_item', 'month', 'year', 'planned_amount', 'actual_amount', 'created_at', 'updated_at')
+    list_select_related = ('budget_item',)
+    autocomplete_fields = ('budget_item',)
+    export_fields = (
+        'budget_item__project__fiscal_year__fiscal_year', 'budget_item__project__project_code',
+        'budget_item__sort_number', 'budget_item__budget_item_name', 'year', 'month',
+        'planned_amount', 'actual_amount', 'updated_at',
+    )
     search_fields = ('budget_item__budget_item_name',)
     list_filter = ('month', 'year')
 
@@ -48,10 +135,17 @@ class MonthlyPlanAdmin(admin.ModelAdmin):
 
 @admin.register(Image)
 class ImageAdmin(admin.ModelAdmin):
-    fields = ('invoice', 'file_original', 'file_name_original', 'file_type', 'file_size', 'created_at',)
-    readonly_fields = ('file_name_original', 'file_type', 'file_size', 'created_at')
-    list_display = ('file_name_original', 'file_type', 'file_size', 'created_at')
-    search_fields = ('file_name_original',)
+    fields = ('invoice', 'file_original', 'file_name_original', 'file_type', 'file_size', 'processing_status', 'processing_error', 'created_at',)
+    readonly_fields = ('file_name_original', 'file_type', 'file_size', 'processing_status', 'processing_error', 'created_at')
+    list_display = ('file_name_original', 'file_type', 'file_size', 'processing_status', 'created_at')
+    list_filter = ('processing_status',)
+    search_fields = ('^file_name_original',)
+    actions = ['retry_processing']
+
+    @admin.action(description="ประมวลผลรูปภาพใหม่อีกครั้ง")
+    def retry_processing(self, request, queryset):
+        count = tasks.retry_images(queryset)
+        self.message_user(request, f"Queued {count} images for processing")
 
 @admin.register(TypeInvoice)
 class TypeInvoiceAdmin(admin.ModelAdmin):
@@ -78,8 +172,16 @@ class ImageInline(OrderedImageUploaderInline):
 
     
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(ScopedAutocompleteMixin, FullTextSearchMixin, KeysetPaginationMixin, StreamingExportMixin, admin.ModelAdmin):
     list_display = ('invoice_number', 'fiscal_year', 'invoice_type', 'total_amount_due', 'approval_date', 'created_at', 'updated_at')
+    list_select_related = ('fiscal_year', 'invoice_type')
+    autocomplete_fields = ('fiscal_year', 'budget_item')
+    autocomplete_scopes = {'budget_item': 'fiscal_year'}
+    export_fields = (
+        'invoice_number', 'fiscal_year__fiscal_year', 'invoice_type__invoice_type_name',
+        'budget_item__budget_item_name', 'invoice_date', 'invoice_month', 'invoice_year', 'total_amount_due',
+        'approval_date', 'approver_name', 'contractor_name', 'details', 'created_at', 'updated_at',
+    )
     search_fields = ('invoice_number', 'fiscal_year__fiscal_year', 'contractor_name')
     list_filter = ('fiscal_year', 'invoice_type')
     
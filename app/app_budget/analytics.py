@@ -0,0 +1,137 @@
+from decimal import Decimal
+
+import numpy as np
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+
+from .caching import cached
+from .models import MonthlyPlan
+
+# Burn-rate analytics over MonthlyPlan, computed for every budget item at once.
+#
+# Amounts are loaded as integer satang (1/100 baht) into items x months matrices, so all
+# arithmetic is exact integer math. The only rounding is the final division of each
+# ratio, rounded half away from zero to match Decimal's ROUND_HALF_UP.
+#
+# Each item's months are laid out from its own first MonthlyPlan row. The year-end is 12
+# months after that (or the item's last row if it spans longer), and months up to and
+# including `as_of` count as elapsed. `as_of` defaults to the latest month with spending in
+# any MonthlyPlan row, so an item's metrics do not depend on the page or filter it is
+# listed under.
+
+MONTHS_PER_YEAR = 12
+BASIS_POINTS = 10000
+CENT = Decimal('0.01')
+
+SATANG_COLUMNS = (
+    'planned_total', 'actual_total', 'variance', 'planned_to_date', 'actual_to_date',
+    'monthly_run_rate', 'projected_year_end', 'projected_variance',
+)
+
+
+def period(year, month):
+    return year * MONTHS_PER_YEAR + month - 1
+
+
+def period_label(value):
+    year, month = divmod(int(value), MONTHS_PER_YEAR)
+    return f"{year}-{month + 1:02d}"
+
+
+def load(monthly_plans):
+    # One query; the database turns the Decimal columns into satang integers
+    rows = monthly_plans.annotate(
+        planned_satang=Cast(Round(F('planned_amount') * 100), BigIntegerField()),
+        actual_satang=Cast(Round(F('actual_amount') * 100), BigIntegerField()),
+    ).values_list('budget_item_id', 'year', 'month', 'planned_satang', 'actual_satang')
+    return np.array(list(rows), dtype=np.int64).reshape(-1, 5)
+
+
+def divide_round(numerator, denominator):
+    # Integer division rounded half away from zero; the caller masks out zero denominators
+    denominator = np.where(denominator == 0, 1, denominator)
+    quotient = (2 * abs(numerator) + abs(denominator)) // (2 * abs(denominator))
+    return np.where((numerator < 0) != (denominator < 0), -quotient, quotient)
+
+
+def default_as_of():
+    def compute():
+        latest = MonthlyPlan.objects.exclude(actual_amount=0).order_by('-year', '-month').values_list('year', 'month').first()
+        return period(*latest) if latest else None
+    return cached("burn_rate_as_of", [MonthlyPlan], compute)
+
+
+def compute(monthly_plans, as_of=None):
+    """Return one numpy array per metric, aligned with the sorted `item_ids` array.
+
+    Satang columns are listed in SATANG_COLUMNS; `burn_rate` is in basis points of the
+    plan to date. `has_plan` and `has_elapsed` flag the rows where the ratios are defined.
+    """
+    data = load(monthly_plans)
+    item_ids, item_index = np.unique(data[:, 0], return_inverse=True)
+    periods = period(data[:, 1], data[:, 2])
+    if as_of is None:
+        as_of = default_as_of()
+
+    start = np.full(len(item_ids), np.iinfo(np.int64).max)
+    end = np.full(len(item_ids), np.iinfo(np.int64).min)
+    np.minimum.at(start, item_index, periods)
+    np.maximum.at(end, item_index, periods)
+    horizon = np.maximum(MONTHS_PER_YEAR, end - start + 1)
+    width = int(horizon.max()) if len(item_ids) else MONTHS_PER_YEAR
+
+    # Fall back to Python integers if basis-point products could overflow int64
+    dtype = np.int64
+    if len(data) and int(np.abs(data[:, 3:]).sum()) * max(BASIS_POINTS, width) >= 2 ** 63:
+        dtype = object
+    planned = np.zeros((len(item_ids), width), dtype=dtype)
+    actual = np.zeros((len(item_ids), width), dtype=dtype)
+    offset = periods - start[item_index]
+    np.add.at(planned, (item_index, offset), data[:, 3].astype(dtype))
+    np.add.at(actual, (item_index, offset), data[:, 4].astype(dtype))
+
+    if as_of is None:
+        elapsed = np.zeros(len(item_ids), dtype=np.int64)
+    else:
+        elapsed = np.clip(as_of - start + 1, 0, horizon)
+    to_date = np.arange(width) < elapsed[:, None]
+    planned_to_date = np.where(to_date, planned, 0).sum(axis=1)
+    actual_to_date = np.where(to_date, actual, 0).sum(axis=1)
+    planned_total = planned.sum(axis=1)
+    actual_total = actual.sum(axis=1)
+
+    has_elapsed = elapsed > 0
+    projected = actual_to_date + divide_round(actual_to_date * (horizon - elapsed), elapsed)
+    return {
+        'item_ids': item_ids,
+        'as_of': as_of,
+        'start': start,
+        'horizon': horizon,
+        'elapsed_months': elapsed,
+        'planned_total': planned_total,
+        'actual_total': actual_total,
+        'variance': actual_total - planned_total,
+        'planned_to_date': planned_to_date,
+        'actual_to_date': actual_to_date,
+        'has_plan': planned_to_date != 0,
+        'burn_rate': divide_round(actual_to_date * BASIS_POINTS, planned_to_date),
+        'has_elapsed': has_elapsed,
+        'monthly_run_rate': divide_round(actual_to_date, elapsed),
+        'projected_year_end': projected,
+        'projected_variance': projected - planned_total,
+    }
+
+
+def item_metrics(monthly_plans, as_of=None):
+    """Metrics per budget item id as Decimal baht, for the admin and the API."""
+    columns = compute(monthly_plans, as_of)
+    metrics = {}
+    for row, item_id in enumerate(columns['item_ids'].tolist()):
+        values = {name: int(columns[name][row]) * CENT for name in SATANG_COLUMNS}
+        if not columns['has_elapsed'][row]:
+            values.update(monthly_run_rate=None, projected_year_end=None, projected_variance=None)
+        values['burn_rate_percent'] = int(columns['burn_rate'][row]) * CENT if columns['has_plan'][row] else None
+        values['elapsed_months'] = int(columns['elapsed_months'][row])
+        values['start'] = period_label(columns['start'][row])
+        metrics[item_id] = values
+    return metrics
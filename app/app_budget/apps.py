@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppBudgetConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_budget'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,179 @@
+import json
+import lzma
+from decimal import Decimal
+
+from django.core import serializers
+from django.db import transaction
+
+from . import deletion, rollup, search
+from .caching import bump_versions, cached
+from .models import BudgetYear, FiscalYearArchive
+
+# Archival of closed fiscal years.
+#
+# archive_year() writes every Plan -> Project -> BudgetItem -> MonthlyPlan / Invoice ->
+# File / Image row of a year into one LZMA-compressed JSON fixture on a FiscalYearArchive
+# and deletes them from the hot tables. The BudgetYear row, its BudgetRollup rows and the
+# stored blobs stay, so year totals keep working and restore_year() can put the rows back
+# under their original ids.
+#
+# reports.plan_vs_actual() reads archived years through monthly_plans() below, which
+# decodes an archive once and keeps its MonthlyPlan rows in the cache.
+
+# Parents first: the order rows are written back in (and, reversed, deleted in)
+ARCHIVED_MODELS = deletion.TREE_MODELS[1:]
+BATCH_SIZE = 1000
+# reports.PLAN_VS_ACTUAL_FILTERS, as keys of the rows returned by monthly_plans()
+ROW_FILTERS = {
+    'fiscal_year': 'fiscal_year_id',
+    'plan': 'plan_id',
+    'project': 'project_id',
+    'budget_item': 'budget_item_id',
+    'year': 'year',
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class CompressedWriter:
+    # The serializer's output stream; deliberately no getvalue(), which it would call on its own
+    def __init__(self):
+        self.compressor = lzma.LZMACompressor()
+        self.chunks = []
+
+    def write(self, text):
+        self.chunks.append(self.compressor.compress(text.encode()))
+
+    def finish(self):
+        self.chunks.append(self.compressor.flush())
+        return b''.join(self.chunks)
+
+
+def batches(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+@transaction.atomic
+def archive_year(budget_year, user=None):
+    """Move the fiscal year's rows into a FiscalYearArchive and return it."""
+    # Locking the year also blocks new plans/projects/invoices from being attached to it
+    budget_year = BudgetYear.objects.select_for_update().get(pk=getattr(budget_year, 'pk', budget_year))
+    if FiscalYearArchive.objects.filter(budget_year=budget_year).exists():
+        raise ArchiveError(f"Fiscal year {budget_year} is already archived")
+
+    ids = {model: [] for model in ARCHIVED_MODELS}
+    blob_ids = set()
+
+    def rows():
+        for model, queryset in deletion.tree_rows([budget_year.pk]).items():
+            for obj in queryset.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+                ids[model].append(obj.pk)
+                if getattr(obj, 'blob_id', None):
+                    blob_ids.add(obj.blob_id)
+                yield obj
+
+    writer = CompressedWriter()
+    serializers.serialize('json', rows(), stream=writer)
+    archive = FiscalYearArchive.objects.create(
+        budget_year=budget_year,
+        data=writer.finish(),
+        row_counts={model._meta.label_lower: len(ids[model]) for model in ARCHIVED_MODELS},
+        created_by=user,
+    )
+    archive.blobs.set(blob_ids)
+
+    # Straight DELETEs: the per-row signals would rebuild rollups and log history for
+    # rows that are only moving. The rollup rows are kept on purpose (see above).
+    for model in reversed(ARCHIVED_MODELS):
+        for batch in batches(ids[model]):
+            model._default_manager.filter(pk__in=batch)._raw_delete(model._default_manager.db)
+        if model in search.SEARCH_INDEX:
+            for batch in batches(ids[model]):
+                search.remove(model, batch)
+    transaction.on_commit(lambda: bump_versions(*ARCHIVED_MODELS))
+    return archive
+
+
+@transaction.atomic
+def restore_year(budget_year):
+    """Write an archived fiscal year's rows back under their original ids."""
+    budget_year_id = getattr(budget_year, 'pk', budget_year)
+    archive = FiscalYearArchive.objects.select_for_update().filter(budget_year_id=budget_year_id).first()
+    if archive is None:
+        raise ArchiveError(f"Fiscal year {budget_year} is not archived")
+
+    objects = {model: [] for model in ARCHIVED_MODELS}
+    for deserialized in serializers.deserialize('json', lzma.decompress(archive.data)):
+        objects[type(deserialized.object)].append(deserialized.object)
+    for model in ARCHIVED_MODELS:
+        model._default_manager.bulk_create(objects[model], batch_size=BATCH_SIZE)
+    archive.delete()
+
+    # bulk_create bypasses the signals, so refresh the derived data for the year once
+    rollup.rebuild([budget_year_id])
+    search.reindex_years([budget_year_id])
+    transaction.on_commit(lambda: bump_versions(*ARCHIVED_MODELS))
+    return {model._meta.label_lower: len(objects[model]) for model in ARCHIVED_MODELS}
+
+
+def archived_years():
+    """{BudgetYear id: FiscalYearArchive id} of every archived year."""
+    return cached(
+        "archived_years", [FiscalYearArchive],
+        lambda: dict(FiscalYearArchive.objects.values_list('budget_year_id', 'pk')),
+    )
+
+
+def decode_monthly_plans(archive_id):
+    data, budget_year_id, fiscal_year = (
+        FiscalYearArchive.objects.filter(pk=archive_id).values_list('data', 'budget_year_id', 'budget_year__fiscal_year').get()
+    )
+    plans, projects, items, monthly_plans = {}, {}, {}, []
+    # Read the fixture directly; building model instances would be far slower
+    for entry in json.loads(lzma.decompress(data)):
+        fields = entry['fields']
+        if entry['model'] == 'app_budget.plan':
+            plans[entry['pk']] = fields['plan_name']
+        elif entry['model'] == 'app_budget.project':
+            projects[entry['pk']] = (fields['plan'], fields['project_name'])
+        elif entry['model'] == 'app_budget.budgetitem':
+            items[entry['pk']] = (fields['project'], fields['budget_item_name'])
+        elif entry['model'] == 'app_budget.monthlyplan':
+            monthly_plans.append(fields)
+
+    rows = []
+    for fields in monthly_plans:
+        project_id, budget_item_name = items[fields['budget_item']]
+        # An item hanging off this year's tree from another year's project (see deletion.tree_rows)
+        plan_id, project_name = projects.get(project_id, (None, None))
+        rows.append({
+            'fiscal_year_id': budget_year_id,
+            'fiscal_year': fiscal_year,
+            'plan_id': plan_id,
+            'plan_name': plans.get(plan_id),
+            'project_id': project_id,
+            'project_name': project_name,
+            'budget_item_id': fields['budget_item'],
+            'budget_item_name': budget_item_name,
+            'year': fields['year'],
+            'month': fields['month'],
+            'planned_amount': Decimal(fields['planned_amount']),
+            'actual_amount': Decimal(fields['actual_amount']),
+        })
+    return rows
+
+
+def monthly_plans(filters):
+    """The archived MonthlyPlan rows matching reports.PLAN_VS_ACTUAL_FILTERS-style `filters`."""
+    years = archived_years()
+    if 'fiscal_year' in filters:
+        years = {filters['fiscal_year']: years[filters['fiscal_year']]} if filters['fiscal_year'] in years else {}
+    rows = []
+    for archive_id in years.values():
+        decoded = cached(f"archived_monthly_plans:{archive_id}", [FiscalYearArchive], lambda: decode_monthly_plans(archive_id))
+        rows.extend(row for row in decoded if all(row[ROW_FILTERS[name]] == value for name, value in filters.items()))
+    return rows
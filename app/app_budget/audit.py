@@ -0,0 +1,125 @@
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from .models import BudgetYear, Plan, Project, BudgetItem, Invoice
+
+# Consistency audit of the BudgetYear -> Plan -> Project -> BudgetItem tree.
+# A whole set of fiscal years is loaded in six queries and checked in one pass
+# over the nodes, so the cost does not depend on how deep or wide the tree is.
+
+ZERO = Decimal('0')
+BUDGET_FIELDS = ('allocated_budget', 'operating_budget', 'procurement_budget')
+PATH_SEPARATOR = ' > '
+
+
+def load(years):
+    year_ids = [year['pk'] for year in years]
+    nodes = {}
+    parents = {}
+    for year in years:
+        nodes[('budget_year', year['pk'])] = dict(year, label=year['fiscal_year'])
+    for plan in Plan.objects.filter(fiscal_year_id__in=year_ids).values('pk', 'fiscal_year_id', 'plan_code', 'plan_name', *BUDGET_FIELDS):
+        key = ('plan', plan['pk'])
+        nodes[key] = dict(plan, label=f"{plan['plan_code']} {plan['plan_name']}")
+        parents[key] = ('budget_year', plan['fiscal_year_id'])
+    projects = Project.objects.filter(plan__fiscal_year_id__in=year_ids).values(
+        'pk', 'plan_id', 'project_code', 'project_name', *BUDGET_FIELDS
+    )
+    for project in projects:
+        key = ('project', project['pk'])
+        nodes[key] = dict(project, label=f"{project['project_code']} {project['project_name']}")
+        parents[key] = ('plan', project['plan_id'])
+    items = BudgetItem.objects.filter(project__plan__fiscal_year_id__in=year_ids).values(
+        'pk', 'project_id', 'main_budget_item_id', 'sort_number', 'budget_item_name', *BUDGET_FIELDS
+    )
+    for item in items:
+        key = ('budget_item', item['pk'])
+        nodes[key] = dict(item, label=f"{item['sort_number']} {item['budget_item_name']}")
+        if item['main_budget_item_id'] and item['main_budget_item_id'] != item['pk']:
+            parents[key] = ('budget_item', item['main_budget_item_id'])
+        else:
+            parents[key] = ('project', item['project_id'])
+
+    invoiced = {}
+    item_ids = [key[1] for key in nodes if key[0] == 'budget_item']
+    for entry in Invoice.objects.filter(budget_item_id__in=item_ids).values('budget_item_id').annotate(total=Sum('total_amount_due')):
+        invoiced[('budget_item', entry['budget_item_id'])] = Decimal(entry['total'] or 0)
+    for entry in (Invoice.objects.filter(fiscal_year_id__in=year_ids, budget_item__isnull=True)
+                  .values('fiscal_year_id').annotate(total=Sum('total_amount_due'))):
+        invoiced[('budget_year', entry['fiscal_year_id'])] = Decimal(entry['total'] or 0)
+    return nodes, parents, invoiced
+
+
+def issue(check, key, paths, **details):
+    return {'check': check, 'level': key[0], 'object_id': key[1], 'path': paths[key], **details}
+
+
+def audit(fiscal_years=None):
+    """Check every sum constraint of the given fiscal years and return the violations.
+
+    Children must not be allocated more than their parent (per budget field), invoices
+    below a node must not exceed its allocation, and every node must hang off the tree.
+    """
+    years = BudgetYear.objects.order_by('fiscal_year', 'pk')
+    if fiscal_years is not None:
+        years = years.filter(pk__in=[getattr(year, 'pk', year) for year in fiscal_years])
+    nodes, parents, invoiced = load(list(years.values('pk', 'fiscal_year', *BUDGET_FIELDS)))
+
+    children = {key: [] for key in nodes}
+    for key, parent in parents.items():
+        children.get(parent, []).append(key)
+
+    # Top-down: paths, and the order for the bottom-up sums
+    paths = {}
+    ordered = []
+    frontier = [key for key in nodes if key[0] == 'budget_year']
+    for key in frontier:
+        paths[key] = nodes[key]['label']
+    while frontier:
+        ordered.extend(frontier)
+        next_frontier = []
+        for key in frontier:
+            for child in children[key]:
+                paths[child] = paths[key] + PATH_SEPARATOR + nodes[child]['label']
+                next_frontier.append(child)
+        frontier = next_frontier
+
+    issues = []
+    for key in nodes:
+        if key not in paths:
+            # A main_budget_item cycle (or a parent outside these years) never reaches a root
+            paths[key] = nodes[key]['label']
+            issues.append(issue('detached', key, paths, parent=parents.get(key)))
+
+    # Bottom-up: each node adds its invoiced total to its parent exactly once
+    totals = dict(invoiced)
+    for key in reversed(ordered):
+        parent = parents.get(key)
+        if parent is not None:
+            totals[parent] = totals.get(parent, ZERO) + totals.get(key, ZERO)
+
+    for key in ordered:
+        node = nodes[key]
+        for field in BUDGET_FIELDS:
+            allocated = sum((nodes[child][field] for child in children[key]), ZERO)
+            if allocated > node[field]:
+                issues.append(issue(
+                    'over_allocated', key, paths, field=field,
+                    limit=node[field], total=allocated, excess=allocated - node[field],
+                ))
+        total = totals.get(key, ZERO)
+        if total > node['allocated_budget']:
+            issues.append(issue(
+                'over_invoiced', key, paths, field='allocated_budget',
+                limit=node['allocated_budget'], total=total, excess=total - node['allocated_budget'],
+            ))
+    return issues
+
+
+def describe(entry):
+    if entry['check'] == 'detached':
+        return f"{entry['path']}: not connected to its fiscal year (parent {entry['parent']})"
+    what = "children" if entry['check'] == 'over_allocated' else "invoices"
+    return (f"{entry['path']}: {what} total {entry['total']} of {entry['field']} "
+            f"exceeds {entry['limit']} by {entry['excess']}")
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .caching import current_versions, version_key
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that resolves the logged-in user from the cache on every request.
+
+    Entries are keyed by the user's own version counter, which signals.py bumps whenever
+    that user, their groups or their permissions change, so a deactivated user or a new
+    password (and with it the session hash) takes effect on the next request. The User
+    model counter is in the key too, for changes that reach users in bulk.
+    """
+
+    def get_user(self, user_id):
+        model = get_user_model()
+        versions = current_versions([version_key(model), version_key(model, user_id)])
+        key = f"app_budget:user:{user_id}:{'.'.join(str(version) for version in versions)}"
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
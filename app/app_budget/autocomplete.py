@@ -0,0 +1,61 @@
+from functools import reduce
+from operator import or_
+
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models import Q
+
+
+class ScopedAutocompleteMixin:
+    """Autocomplete FK inputs narrowed by another field on the same form.
+
+    On the form side, `autocomplete_scopes` maps an autocomplete field to the form field
+    that scopes it, e.g. {'main_budget_item': 'project'}; scoped_autocomplete.js sends that
+    field's current value along with the search term.
+
+    On the target side, `autocomplete_filters` maps the parameters this admin accepts to
+    lookups, e.g. {'project': 'project_id'}, and `autocomplete_search_fields` replaces
+    `search_fields` with fields matched by case-insensitive prefix. Unlike the admin's own
+    search the term is not split into words, so "Bridge Con" is one prefix; the models'
+    UPPER(column) pattern indexes serve it.
+    """
+
+    autocomplete_scopes = {}
+    autocomplete_filters = {}
+    autocomplete_search_fields = None
+
+    class Media:
+        js = ('app_budget/admin/scoped_autocomplete.js',)
+
+    def is_autocomplete(self, request):
+        match = getattr(request, 'resolver_match', None)
+        return match is not None and match.url_name == 'autocomplete'
+
+    def get_search_fields(self, request):
+        if self.autocomplete_search_fields and self.is_autocomplete(request):
+            return self.autocomplete_search_fields
+        return super().get_search_fields(request)
+
+    def get_search_results(self, request, queryset, search_term):
+        if self.is_autocomplete(request):
+            for param, lookup in self.autocomplete_filters.items():
+                value = request.GET.get(param)
+                if value and value.isdigit():
+                    queryset = queryset.filter(**{lookup: value})
+            if self.autocomplete_search_fields:
+                # Stable order for the paginated results
+                queryset = queryset.order_by(self.autocomplete_search_fields[0], 'pk')
+                term = search_term.strip()
+                if term:
+                    queryset = queryset.filter(reduce(or_, (
+                        Q(**{f'{name}__istartswith': term}) for name in self.autocomplete_search_fields
+                    )))
+                return queryset, False
+        return super().get_search_results(request, queryset, search_term)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        scope = self.autocomplete_scopes.get(db_field.name)
+        widget = getattr(formfield.widget, 'widget', formfield.widget) if formfield else None
+        if scope and isinstance(widget, AutocompleteSelect):
+            widget.attrs.update({'data-scope-param': scope, 'data-scope-source': f'id_{scope}'})
+        return formfield
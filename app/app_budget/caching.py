@@ -0,0 +1,63 @@
+import time
+
+from django.core.cache import cache
+
+# Cached values are keyed by a version counter per model. Saving or deleting a row
+# bumps its model's counter (see signals.py), which orphans every key built from the
+# old value; nothing is ever flushed or deleted explicitly.
+
+VERSION_KEY = 'app_budget:version:%s'
+# Derived and bookkeeping tables: rollup.py bumps BudgetRollup once per refresh instead of
+# per row, and nothing is cached from the others
+UNVERSIONED_MODELS = ('budgetrollup', 'searchdocument', 'changelogentry', 'resumableupload')
+
+
+def version_key(model, pk=None):
+    # With a pk, the counter of that one row rather than of the whole model
+    label = model._meta.label_lower if pk is None else f"{model._meta.label_lower}:{pk}"
+    return VERSION_KEY % label
+
+
+def versioned_models(app_config):
+    return [model for model in app_config.get_models() if model._meta.model_name not in UNVERSIONED_MODELS]
+
+
+def current_versions(keys):
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        # Start from the clock so a counter evicted from the cache never repeats an old value
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def model_versions(*models):
+    return current_versions([version_key(model) for model in models])
+
+
+def bump_keys(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_versions(*models):
+    bump_keys([version_key(model) for model in models])
+
+
+def bump_row_versions(model, pks):
+    bump_keys([version_key(model, pk) for pk in pks])
+
+
+def cached(name, models, compute, timeout=None):
+    """Return compute() from the cache, under a key that changes whenever any of `models` changes."""
+    versions = '.'.join(str(version) for version in model_versions(*models))
+    key = f"app_budget:{name}:{versions}"
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
@@ -0,0 +1,215 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChangeLogEntry
+
+# Field-level change history for the app_budget models.
+#
+# Each instance remembers the values it was loaded with (post_init), so a save can be
+# diffed without reading the row again. Every entry is handed over by its own
+# transaction.on_commit() callback, so a rolled-back transaction or savepoint drops
+# exactly the entries made inside it. Inside batch() (every request, through
+# ChangeLogMiddleware, and every acting_as() block) the committed entries are
+# collected and written with one bulk INSERT at the end; elsewhere each is written
+# as it commits.
+#
+# Like the other signal-driven tables here, QuerySet.update() and bulk_create() are
+# not recorded.
+
+UNTRACKED_MODELS = ('blob', 'budgetrollup', 'searchdocument', 'changelogentry', 'resumableupload')
+# Who-touched-it bookkeeping; the entry's `user` already says that
+UNTRACKED_FIELDS = ('created_by', 'updated_by')
+BATCH_SIZE = 500
+
+current_user = ContextVar('app_budget_changelog_user', default=None)
+current_batch = ContextVar('app_budget_changelog_batch', default=None)
+_tracked_fields = {}
+
+
+def tracked_fields(model):
+    """{attname: field} of every field whose changes are recorded; empty for an untracked model."""
+    try:
+        return _tracked_fields[model]
+    except KeyError:
+        pass
+    fields = {}
+    if model._meta.app_label == 'app_budget' and model._meta.model_name not in UNTRACKED_MODELS:
+        # Non-editable fields are timestamps and values derived from the others (tree_path, blob)
+        fields = {
+            field.attname: field for field in model._meta.concrete_fields
+            if field.editable and not field.primary_key and field.name not in UNTRACKED_FIELDS
+        }
+    _tracked_fields[model] = fields
+    return fields
+
+
+def tracked_models(app_config):
+    return [model for model in app_config.get_models() if tracked_fields(model)]
+
+
+def value_of(instance, attname):
+    value = instance.__dict__[attname]
+    if isinstance(value, File):
+        # FileField values are recorded as the stored name
+        return value.name or None
+    return value
+
+
+def normalize(field, value):
+    # 1000 assigned in code and Decimal('1000.00') read back are the same value
+    try:
+        return field.to_python(value)
+    except ValidationError:
+        return value
+
+
+def snapshot(instance):
+    # Deferred fields are left out and so never show up as changed
+    values = instance.__dict__
+    instance._changelog_snapshot = {
+        attname: value_of(instance, attname) for attname in tracked_fields(type(instance)) if attname in values
+    }
+
+
+def diff(instance, created):
+    old = getattr(instance, '_changelog_snapshot', {})
+    changes = {}
+    for attname, field in tracked_fields(type(instance)).items():
+        if attname not in instance.__dict__ or (not created and attname not in old):
+            continue
+        new = normalize(field, value_of(instance, attname))
+        before = None if created else normalize(field, old[attname])
+        if new != before:
+            changes[attname] = [before, new]
+    return changes
+
+
+def acting_user_id(instance, action):
+    user = current_user.get()
+    if callable(user):
+        user = user()
+    if user is not None and user.is_authenticated:
+        return user.pk
+    if action == 'update':
+        return getattr(instance, 'updated_by_id', None)
+    if action == 'create':
+        return getattr(instance, 'created_by_id', None)
+    return None
+
+
+@contextmanager
+def acting_as(user):
+    """Attribute the changes made inside the block to `user` (e.g. in a management command).
+
+    `user` may also be a function returning the user, called once something is recorded.
+    """
+    token = current_user.set(user)
+    try:
+        with batch():
+            yield
+    finally:
+        current_user.reset(token)
+
+
+@contextmanager
+def batch():
+    """Write the entries committed inside the block with one bulk INSERT when it ends."""
+    if current_batch.get() is not None:
+        # The outermost block writes for the nested ones
+        yield
+        return
+    token = current_batch.set([])
+    try:
+        yield
+    finally:
+        entries = current_batch.get()
+        current_batch.reset(token)
+        write(entries)
+
+
+def write(entries):
+    by_alias = defaultdict(list)
+    for using, entry in entries:
+        by_alias[using].append(entry)
+    for using, entries in by_alias.items():
+        ChangeLogEntry.objects.using(using).bulk_create(entries, batch_size=BATCH_SIZE)
+
+
+def committed(entry, using):
+    entries = current_batch.get()
+    if entries is None:
+        entry.save(using=using)
+    else:
+        entries.append((using, entry))
+
+
+class ChangeLogMiddleware:
+    """Attribute the changes made while handling a request to the logged-in user."""
+
+    # Both, so async views under ASGI are not pushed through a thread just for this
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with acting_as(self.request_user(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # The batch is written from a thread, not on the event loop
+        token = current_user.set(self.request_user(request))
+        batch_token = current_batch.set([])
+        try:
+            return await self.get_response(request)
+        finally:
+            entries = current_batch.get()
+            current_batch.reset(batch_token)
+            current_user.reset(token)
+            if entries:
+                await sync_to_async(write)(entries)
+
+    @staticmethod
+    def request_user(request):
+        # Not request.user itself: it stays lazy until something is actually recorded, and
+        # asgiref compares the context variables it carries into sync_to_async() threads,
+        # which would load it on the event loop
+        return lambda: getattr(request, 'user', None)
+
+
+def record(instance, action, using):
+    if action == 'delete':
+        values = instance.__dict__
+        changes = {
+            attname: [normalize(field, value_of(instance, attname)), None]
+            for attname, field in tracked_fields(type(instance)).items() if attname in values
+        }
+    else:
+        changes = diff(instance, action == 'create')
+        snapshot(instance)
+        if not changes:
+            return None
+    entry = ChangeLogEntry(
+        model=instance._meta.label_lower,
+        object_id=instance.pk,
+        action=action,
+        changes=changes,
+        user_id=acting_user_id(instance, action),
+        changed_at=timezone.now(),
+    )
+    # Runs straight away outside a transaction
+    transaction.on_commit(partial(committed, entry, using), using=using)
+    return entry
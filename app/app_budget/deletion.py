@@ -0,0 +1,170 @@
+import time
+
+from django.contrib import admin
+from django.contrib.admin import helpers
+from django.db import transaction
+from django.db.models import Q
+from django.template.response import TemplateResponse
+
+from . import changelog, rollup, search, tasks
+from .caching import bump_versions
+from .models import (
+    BudgetYear, Plan, Project, BudgetItem, MonthlyPlan, Invoice, File, Image, BudgetRollup, SearchDocument,
+    FiscalYearArchive,
+)
+
+# Set-based deletion of whole BudgetYear / Project trees.
+#
+# Django's collector loads every row below the deleted objects and fires per-row signals,
+# which for a full year means hundreds of thousands of objects and as many rollup, search
+# and history updates. delete_trees() issues one DELETE ... WHERE ... IN (subquery) per
+# table instead, children first, and cleans up the derived tables the same way. Files are
+# removed from storage by a queued job once the transaction has committed.
+
+# Parents first; deleted in reverse
+TREE_MODELS = (BudgetYear, Plan, Project, BudgetItem, MonthlyPlan, Invoice, File, Image)
+
+
+def cross_tree_items(projects):
+    # Items elsewhere whose main_budget_item chain leads into `projects` (CASCADE takes them too)
+    ids = []
+    frontier = BudgetItem.objects.filter(main_budget_item__project__in=projects).exclude(project__in=projects)
+    while True:
+        found = list(frontier.values_list('pk', flat=True))
+        if not found:
+            return ids
+        ids.extend(found)
+        frontier = BudgetItem.objects.filter(main_budget_item__in=found).exclude(project__in=projects).exclude(pk__in=ids)
+
+
+def tree_rows(budget_year_ids=(), project_ids=()):
+    """{model: queryset} of the rows below these years and projects, in TREE_MODELS order.
+
+    The querysets are lazy subqueries of each other, so delete them children first.
+    """
+    budget_year_ids = list(budget_year_ids)
+    projects = Project.objects.filter(
+        Q(pk__in=project_ids) | Q(fiscal_year_id__in=budget_year_ids) | Q(plan__fiscal_year_id__in=budget_year_ids)
+    )
+    items = BudgetItem.objects.filter(Q(project__in=projects) | Q(pk__in=cross_tree_items(projects)))
+    invoices = Invoice.objects.filter(Q(fiscal_year_id__in=budget_year_ids) | Q(budget_item__in=items))
+    return {
+        Plan: Plan.objects.filter(fiscal_year_id__in=budget_year_ids),
+        Project: projects,
+        BudgetItem: items,
+        MonthlyPlan: MonthlyPlan.objects.filter(budget_item__in=items),
+        Invoice: invoices,
+        File: File.objects.filter(invoice__in=invoices),
+        Image: Image.objects.filter(invoice__in=invoices),
+    }
+
+
+def media_to_clean(rows):
+    # Blob-backed files are shared, so only their blob ids; other files by name
+    names = [name for name in rows[File].filter(blob__isnull=True).values_list('file', flat=True) if name]
+    for original, processed in rows[Image].filter(blob__isnull=True).values_list('file_original', 'file'):
+        names.extend(name for name in (original, processed) if name)
+    blob_ids = {
+        *rows[File].filter(blob__isnull=False).values_list('blob_id', flat=True),
+        *rows[Image].filter(blob__isnull=False).values_list('blob_id', flat=True),
+    }
+    return names, sorted(blob_ids)
+
+
+@transaction.atomic
+def delete_trees(budget_years=(), projects=()):
+    """Delete fiscal years and/or projects with everything below them.
+
+    Returns {'tables': [{'table', 'rows', 'seconds'}, ...], 'files', 'blobs', 'seconds'}.
+    """
+    started = time.monotonic()
+    year_ids = [getattr(year, 'pk', year) for year in budget_years]
+    project_ids = [getattr(project, 'pk', project) for project in projects]
+    roots = [
+        *BudgetYear.objects.select_for_update().filter(pk__in=year_ids),
+        *Project.objects.select_for_update().filter(pk__in=project_ids),
+    ]
+    rows = {BudgetYear: BudgetYear.objects.filter(pk__in=year_ids), **tree_rows(year_ids, project_ids)}
+    using = BudgetYear.objects.db
+
+    # Plans that keep existing but lose projects need their rollup re-summed afterwards
+    surviving_plans = set(
+        rows[Project].exclude(plan__fiscal_year_id__in=year_ids).values_list('plan_id', flat=True)
+    )
+    names, blob_ids = media_to_clean(rows)
+    # An archived year's rows live in its FiscalYearArchive, whose blobs go the same way
+    archives = FiscalYearArchive.objects.filter(budget_year_id__in=year_ids)
+    archive_blobs = FiscalYearArchive.blobs.through.objects.filter(fiscalyeararchive__in=archives)
+    blob_ids = sorted({*blob_ids, *archive_blobs.values_list('blob_id', flat=True)})
+
+    # Derived rows first, while the subqueries they are selected by still match
+    for model in search.SEARCH_INDEX:
+        SearchDocument.objects.filter(
+            model=search.document_label(model), object_id__in=rows[model].values('pk'),
+        )._raw_delete(using)
+    BudgetRollup.objects.filter(
+        Q(level='budget_year', object_id__in=year_ids)
+        # An archived year keeps rollup rows for plans and projects no longer in the tables
+        | Q(fiscal_year_id__in=year_ids)
+        | Q(level='plan', object_id__in=rows[Plan].values('pk'))
+        | Q(level='project', object_id__in=rows[Project].values('pk'))
+        | Q(level='budget_item', object_id__in=rows[BudgetItem].values('pk'))
+    )._raw_delete(using)
+    archive_blobs._raw_delete(using)
+    archives._raw_delete(using)
+
+    tables = []
+    for model in reversed(TREE_MODELS):
+        table_started = time.monotonic()
+        count = rows[model]._raw_delete(using)
+        tables.append({'table': model._meta.db_table, 'rows': count, 'seconds': time.monotonic() - table_started})
+
+    for plan_id in surviving_plans:
+        rollup.refresh_node('plan', plan_id)
+    # One history entry per deleted root rather than per row
+    for root in roots:
+        changelog.record(root, 'delete', using)
+    transaction.on_commit(lambda: bump_versions(*TREE_MODELS, BudgetRollup))
+    transaction.on_commit(lambda: tasks.enqueue_media_cleanup(names, blob_ids))
+    return {'tables': tables, 'files': len(names), 'blobs': len(blob_ids), 'seconds': time.monotonic() - started}
+
+
+def describe(report):
+    tables = ", ".join(f"{table['table']} {table['rows']} ({table['seconds']:.2f}s)" for table in report['tables'])
+    return (f"Deleted {tables} in {report['seconds']:.2f}s; "
+            f"queued {report['files']} files and {report['blobs']} blobs for cleanup")
+
+
+class BulkDeleteMixin:
+    """Admin action that deletes the selected BudgetYears or Projects through delete_trees().
+
+    Add 'bulk_delete_tree' to `actions`; `bulk_delete_root` is the delete_trees() argument
+    ('budget_years' or 'projects') the selected objects are passed as.
+    """
+
+    bulk_delete_root = None
+
+    @admin.action(description="ลบพร้อมข้อมูลทั้งหมดในลำดับชั้น (แบบรวดเร็ว)", permissions=['delete'])
+    def bulk_delete_tree(self, request, queryset):
+        roots = list(queryset)
+        if request.POST.get('post') == 'yes':
+            report = delete_trees(**{self.bulk_delete_root: roots})
+            self.message_user(request, describe(report))
+            return None
+
+        # Confirmation page: counts only, nothing is loaded row by row
+        ids = [root.pk for root in roots]
+        if self.bulk_delete_root == 'budget_years':
+            rows = {BudgetYear: queryset, **tree_rows(budget_year_ids=ids)}
+        else:
+            rows = tree_rows(project_ids=ids)
+        counts = [(model._meta.verbose_name_plural, rows[model].count()) for model in TREE_MODELS if model in rows]
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "ยืนยันการลบ",
+            'roots': roots,
+            'counts': counts,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/app_budget/bulk_delete_confirmation.html', context)
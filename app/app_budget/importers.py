@@ -0,0 +1,424 @@
+import csv
+import os
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import rollup, search
+from .caching import bump_versions
+from .models import (
+    BudgetYear, Plan, Project, Category, BudgetItem, MonthlyPlan,
+    tree_path_segment
+)
+
+# Dependency order: every kind only refers to kinds listed before it
+KINDS = ('plans', 'projects', 'budget_items', 'monthly_plans')
+
+BUDGET_FIELDS = ('allocated_budget', 'operating_budget', 'procurement_budget')
+PLAN_FIELDS = ('plan_name', *BUDGET_FIELDS, 'contract_sign_date', 'contract_end_date', 'sort_order')
+PROJECT_FIELDS = ('plan_id', 'project_name', *BUDGET_FIELDS, 'contract_sign_date', 'contract_end_date',
+                  'project_status', 'sort_order')
+BUDGET_ITEM_FIELDS = ('budget_item_name', *BUDGET_FIELDS, 'contract_sign_date', 'contract_end_date', 'category_id',
+                      'main_budget_item_id', 'item_type', 'sub_item_type')
+MONTHLY_PLAN_FIELDS = ('planned_amount', 'actual_amount')
+
+
+class ImportRowError(Exception):
+    pass
+
+
+def read_rows(path):
+    """Yield (kind, line_number, row) from a CSV file named after its kind, or from every sheet of an XLSX workbook."""
+    name, extension = os.path.splitext(os.path.basename(path))
+    if extension.lower() == '.xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for kind in KINDS:
+                if kind not in workbook.sheetnames:
+                    continue
+                rows = workbook[kind].iter_rows(values_only=True)
+                header = [str(cell or '').strip().lower() for cell in next(rows, ())]
+                for line, values in enumerate(rows, start=2):
+                    if any(value not in (None, '') for value in values):
+                        yield kind, line, dict(zip(header, values))
+        finally:
+            workbook.close()
+    else:
+        if name not in KINDS:
+            raise ImportRowError(f"{path}: CSV files must be named one of {', '.join(KINDS)}")
+        with open(path, newline='', encoding='utf-8-sig') as handle:
+            reader = csv.DictReader(handle)
+            reader.fieldnames = [field.strip().lower() for field in reader.fieldnames or []]
+            for row in reader:
+                if any(row.values()):
+                    yield name, reader.line_num, row
+
+
+def source_order(path):
+    name, extension = os.path.splitext(os.path.basename(path))
+    if extension.lower() == '.xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            return min((KINDS.index(sheet) for sheet in workbook.sheetnames if sheet in KINDS), default=len(KINDS))
+        finally:
+            workbook.close()
+    return KINDS.index(name) if name in KINDS else len(KINDS)
+
+
+def iter_batches(paths, batch_size):
+    # Walk the files in dependency order, streaming each one in fixed-size batches
+    for path in sorted(paths, key=source_order):
+        batch, batch_kind = [], None
+        for kind, line, row in read_rows(path):
+            if batch and (kind != batch_kind or len(batch) >= batch_size):
+                yield batch_kind, batch
+                batch = []
+            batch_kind = kind
+            batch.append((line, row))
+        if batch:
+            yield batch_kind, batch
+
+
+def text(row, column, required=True):
+    value = row.get(column)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ImportRowError(f"'{column}' is required")
+    return value
+
+
+def decimal(row, column):
+    value = text(row, column, required=False).replace(',', '')
+    if not value:
+        return Decimal('0')
+    try:
+        return Decimal(value).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ImportRowError(f"'{column}' is not a number: {value!r}")
+
+
+def integer(row, column, default):
+    value = text(row, column, required=False)
+    if not value:
+        return default
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ImportRowError(f"'{column}' is not a whole number: {value!r}")
+    # "12.0" from a spreadsheet cell is fine; "12.5" is not silently cut to 12
+    if not number.is_finite() or number != number.to_integral_value():
+        raise ImportRowError(f"'{column}' is not a whole number: {value!r}")
+    return int(number)
+
+
+def parse_date(row, column):
+    value = row.get(column)
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = text(row, column)
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        raise ImportRowError(f"'{column}' is not a YYYY-MM-DD date: {value!r}")
+
+
+def choice(row, column, choices, default):
+    value = text(row, column, required=False) or default
+    if value not in dict(choices):
+        raise ImportRowError(f"'{column}' must be one of {', '.join(dict(choices))}")
+    return value
+
+
+class BudgetImporter:
+    """Upserts spreadsheet rows with bulk writes, resolving references through in-memory maps."""
+
+    def __init__(self, batch_size=1000, user=None):
+        self.batch_size = batch_size
+        self.user = user
+        self.errors = []
+        self.years = {}
+        for pk, fiscal_year in BudgetYear.objects.values_list('pk', 'fiscal_year'):
+            self.years.setdefault(fiscal_year, []).append(pk)
+        self.categories = dict(Category.objects.values_list('category_name', 'pk'))
+        self.plans = {}
+        self.projects = {}
+        self.items = {}
+        self.monthly_plans = {}
+        self.slugs = {}
+        self.loaded_years = set()
+        self.touched_years = set()
+        self.moved_items = False
+        # Budget items (new or existing) whose main_sort_number has not been seen yet; retried on every later batch
+        self.deferred_items = {}
+
+    def error(self, kind, line, message):
+        self.errors.append((kind, line, str(message)))
+
+    def year_id(self, row):
+        fiscal_year = text(row, 'fiscal_year')
+        ids = self.years.get(fiscal_year, [])
+        if len(ids) != 1:
+            raise ImportRowError(f"fiscal year {fiscal_year!r} matches {len(ids)} BudgetYear rows")
+        year_id = ids[0]
+        if year_id not in self.loaded_years:
+            self.load_year(year_id)
+        return year_id
+
+    def load_year(self, year_id):
+        # One query per model per fiscal year, on first use
+        self.loaded_years.add(year_id)
+        for pk, code in Plan.objects.filter(fiscal_year_id=year_id).values_list('pk', 'plan_code'):
+            self.plans[(year_id, code)] = pk
+        for pk, code in Project.objects.filter(fiscal_year_id=year_id).values_list('pk', 'project_code'):
+            self.projects[(year_id, code)] = pk
+        items = BudgetItem.objects.filter(project__fiscal_year_id=year_id).values_list(
+            'pk', 'project_id', 'sort_number', 'tree_path', 'main_budget_item_id'
+        )
+        for pk, project_id, sort_number, tree_path, parent_id in items:
+            self.items[(project_id, sort_number)] = (pk, tree_path, parent_id)
+        monthly_plans = MonthlyPlan.objects.filter(budget_item__project__fiscal_year_id=year_id).values_list(
+            'pk', 'budget_item_id', 'year', 'month'
+        )
+        for pk, item_id, year, month in monthly_plans:
+            self.monthly_plans[(item_id, year, month)] = pk
+
+    def unique_slug(self, model, *parts):
+        if model not in self.slugs:
+            self.slugs[model] = set(model.objects.values_list('slug', flat=True))
+        taken = self.slugs[model]
+        base = slugify('-'.join(str(part) for part in parts))[:40] or model._meta.model_name
+        slug, n = base, 1
+        while slug in taken:
+            n += 1
+            slug = f"{base}-{n}"
+        taken.add(slug)
+        return slug
+
+    def stamp(self, obj, created):
+        if self.user is not None:
+            if created:
+                obj.created_by = self.user
+            obj.updated_by = self.user
+        # bulk_update() skips auto_now, and updated_at feeds ETags and incremental sync
+        obj.updated_at = timezone.now()
+
+    def write(self, model, creates, updates, fields):
+        if creates:
+            model.objects.bulk_create(creates, batch_size=self.batch_size)
+        if updates:
+            user_fields = ('updated_by',) if self.user is not None else ()
+            model.objects.bulk_update(updates, [*fields, *user_fields, 'updated_at'], batch_size=self.batch_size)
+
+    def import_batch(self, kind, rows):
+        if kind != 'budget_items':
+            self.report_deferred()
+        started = time.monotonic()
+        created, updated = getattr(self, f"import_{kind}")(kind, rows)
+        return {
+            'kind': kind,
+            'rows': len(rows),
+            'created': created,
+            'updated': updated,
+            'seconds': time.monotonic() - started,
+        }
+
+    def import_plans(self, kind, rows):
+        creates, updates = {}, {}
+        for line, row in rows:
+            try:
+                year_id = self.year_id(row)
+                code = text(row, 'plan_code')
+                values = {
+                    'plan_name': text(row, 'plan_name'),
+                    **{field: decimal(row, field) for field in BUDGET_FIELDS},
+                    'contract_sign_date': parse_date(row, 'contract_sign_date'),
+                    'contract_end_date': parse_date(row, 'contract_end_date'),
+                    'sort_order': integer(row, 'sort_order', 500),
+                }
+            except ImportRowError as e:
+                self.error(kind, line, e)
+                continue
+            key = (year_id, code)
+            pk = self.plans.get(key)
+            if pk:
+                updates[key] = Plan(pk=pk, fiscal_year_id=year_id, plan_code=code, **values)
+                self.stamp(updates[key], created=False)
+            else:
+                plan = creates.get(key) or Plan(fiscal_year_id=year_id, plan_code=code, slug=self.unique_slug(Plan, text(row, 'fiscal_year'), code))
+                for field, value in values.items():
+                    setattr(plan, field, value)
+                self.stamp(plan, created=True)
+                creates[key] = plan
+            self.touched_years.add(year_id)
+        self.write(Plan, list(creates.values()), list(updates.values()), PLAN_FIELDS)
+        for key, plan in creates.items():
+            self.plans[key] = plan.pk
+        return len(creates), len(updates)
+
+    def import_projects(self, kind, rows):
+        creates, updates = {}, {}
+        for line, row in rows:
+            try:
+                year_id = self.year_id(row)
+                plan_id = self.plans.get((year_id, text(row, 'plan_code')))
+                if plan_id is None:
+                    raise ImportRowError(f"unknown plan_code {text(row, 'plan_code')!r}")
+                code = text(row, 'project_code')
+                values = {
+                    'plan_id': plan_id,
+                    'project_name': text(row, 'project_name'),
+                    **{field: decimal(row, field) for field in BUDGET_FIELDS},
+                    'contract_sign_date': parse_date(row, 'contract_sign_date'),
+                    'contract_end_date': parse_date(row, 'contract_end_date'),
+                    'project_status': choice(row, 'project_status', Project.STATUS_CHOICES, 'planning'),
+                    'sort_order': integer(row, 'sort_order', 500),
+                }
+            except ImportRowError as e:
+                self.error(kind, line, e)
+                continue
+            key = (year_id, code)
+            pk = self.projects.get(key)
+            if pk:
+                updates[key] = Project(pk=pk, fiscal_year_id=year_id, project_code=code, **values)
+                self.stamp(updates[key], created=False)
+            else:
+                project = creates.get(key) or Project(fiscal_year_id=year_id, project_code=code, slug=self.unique_slug(Project, text(row, 'fiscal_year'), code))
+                for field, value in values.items():
+                    setattr(project, field, value)
+                self.stamp(project, created=True)
+                creates[key] = project
+            self.touched_years.add(year_id)
+        self.write(Project, list(creates.values()), list(updates.values()), PROJECT_FIELDS)
+        for key, project in creates.items():
+            self.projects[key] = project.pk
+        return len(creates), len(updates)
+
+    def ensure_categories(self, names):
+        missing = [Category(category_name=name) for name in sorted(set(names) - self.categories.keys())]
+        for category in missing:
+            self.stamp(category, created=True)
+        Category.objects.bulk_create(missing)
+        self.categories.update((category.category_name, category.pk) for category in missing)
+
+    def import_budget_items(self, kind, rows):
+        pending = self.deferred_items
+        self.deferred_items = {}
+        parsed = []
+        for line, row in rows:
+            try:
+                year_id = self.year_id(row)
+                project_id = self.projects.get((year_id, text(row, 'project_code')))
+                if project_id is None:
+                    raise ImportRowError(f"unknown project_code {text(row, 'project_code')!r}")
+                values = {
+                    'budget_item_name': text(row, 'budget_item_name'),
+                    **{field: decimal(row, field) for field in BUDGET_FIELDS},
+                    'contract_sign_date': parse_date(row, 'contract_sign_date'),
+                    'contract_end_date': parse_date(row, 'contract_end_date'),
+                    'item_type': choice(row, 'item_type', BudgetItem.ITEM_TYPE_CHOICES, 'main_item'),
+                    'sub_item_type': choice(row, 'sub_item_type', BudgetItem.SUB_ITEM_CHOICES, 'none'),
+                }
+                parsed.append((line, year_id, project_id, text(row, 'sort_number'), text(row, 'main_sort_number', required=False),
+                               text(row, 'category', required=False), values))
+            except ImportRowError as e:
+                self.error(kind, line, e)
+        self.ensure_categories(entry[5] for entry in parsed if entry[5])
+
+        for line, year_id, project_id, sort_number, main_sort_number, category, values in parsed:
+            key = (project_id, sort_number)
+            parent_key = (project_id, main_sort_number) if main_sort_number else None
+            item = BudgetItem(project_id=project_id, sort_number=sort_number, category_id=self.categories.get(category), **values)
+            existing = self.items.get(key)
+            if existing:
+                item.pk = existing[0]
+            self.stamp(item, created=not existing)
+            pending[key] = (line, item, parent_key)
+            self.touched_years.add(year_id)
+
+        # Parents may arrive in the same batch or a later one: resolve level by level so children
+        # can point at their pks, and leave the rest for the next batch
+        created, updates = 0, []
+        while pending:
+            ready = {key: entry for key, entry in pending.items() if entry[2] is None or entry[2] in self.items}
+            if not ready:
+                self.deferred_items = pending
+                break
+            level = []
+            for key, (line, item, parent_key) in ready.items():
+                item.main_budget_item_id = self.items[parent_key][0] if parent_key else None
+                del pending[key]
+                if key in self.items:
+                    if item.main_budget_item_id != self.items[key][2]:
+                        self.moved_items = True
+                    updates.append(item)
+                else:
+                    level.append((key, item, parent_key))
+            BudgetItem.objects.bulk_create([item for key, item, parent_key in level], batch_size=self.batch_size)
+            for key, item, parent_key in level:
+                parent_path = self.items[parent_key][1] if parent_key else ''
+                item.tree_path = parent_path + tree_path_segment(item.pk)
+                item.tree_depth = item.tree_path.count('/') - 1
+                self.items[key] = (item.pk, item.tree_path, item.main_budget_item_id)
+            BudgetItem.objects.bulk_update([item for key, item, parent_key in level], ['tree_path', 'tree_depth'], batch_size=self.batch_size)
+            created += len(level)
+
+        self.write(BudgetItem, [], updates, BUDGET_ITEM_FIELDS)
+        return created, len(updates)
+
+    def import_monthly_plans(self, kind, rows):
+        creates, updates = {}, {}
+        for line, row in rows:
+            try:
+                year_id = self.year_id(row)
+                project_id = self.projects.get((year_id, text(row, 'project_code')))
+                item = self.items.get((project_id, text(row, 'sort_number')))
+                if item is None:
+                    raise ImportRowError(f"unknown budget item {text(row, 'project_code')}/{text(row, 'sort_number')}")
+                month = integer(row, 'month', None)
+                if month not in range(1, 13):
+                    raise ImportRowError("'month' must be 1-12")
+                year = integer(row, 'year', None)
+                if year is None:
+                    raise ImportRowError("'year' is required")
+                values = {field: decimal(row, field) for field in MONTHLY_PLAN_FIELDS}
+            except ImportRowError as e:
+                self.error(kind, line, e)
+                continue
+            key = (item[0], year, month)
+            monthly_plan = MonthlyPlan(pk=self.monthly_plans.get(key), budget_item_id=item[0], year=year, month=month, **values)
+            self.stamp(monthly_plan, created=monthly_plan.pk is None)
+            if monthly_plan.pk:
+                updates[key] = monthly_plan
+            else:
+                creates[key] = monthly_plan
+        self.write(MonthlyPlan, list(creates.values()), list(updates.values()), MONTHLY_PLAN_FIELDS)
+        for key, monthly_plan in creates.items():
+            self.monthly_plans[key] = monthly_plan.pk
+        return len(creates), len(updates)
+
+    def report_deferred(self):
+        for key, (line, item, parent_key) in self.deferred_items.items():
+            self.error('budget_items', line, f"unknown main_sort_number {parent_key[1]!r}")
+        self.deferred_items = {}
+
+    def finish(self):
+        self.report_deferred()
+        if self.errors:
+            return
+        # bulk writes bypass the save()/signal maintenance, so refresh the derived data once
+        transaction.on_commit(lambda: bump_versions(Plan, Project, Category, BudgetItem, MonthlyPlan))
+        if self.moved_items:
+            BudgetItem.objects.rebuild_tree()
+        if self.touched_years:
+            rollup.rebuild(self.touched_years)
+            search.reindex_years(self.touched_years)
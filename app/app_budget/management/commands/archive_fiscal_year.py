@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_budget import archive
+from app_budget.models import BudgetYear
+
+
+class Command(BaseCommand):
+    help = "Move a closed fiscal year's plans, projects, budget items, monthly plans and invoices into a compressed archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('fiscal_year', type=int, help="BudgetYear id")
+        parser.add_argument('--restore', action='store_true', help="Put an archived year's rows back into the tables")
+
+    def handle(self, *args, **options):
+        budget_year = BudgetYear.objects.filter(pk=options['fiscal_year']).first()
+        if budget_year is None:
+            raise CommandError(f"BudgetYear {options['fiscal_year']} does not exist")
+        try:
+            if options['restore']:
+                counts = archive.restore_year(budget_year)
+            else:
+                year_archive = archive.archive_year(budget_year)
+                counts = year_archive.row_counts
+        except archive.ArchiveError as error:
+            raise CommandError(str(error))
+        for label, count in counts.items():
+            self.stdout.write(f"{label}: {count}")
+        if options['restore']:
+            self.stdout.write(self.style.SUCCESS(f"Restored fiscal year {budget_year}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Archived fiscal year {budget_year} ({len(year_archive.data)} bytes compressed)"
+            ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_budget import audit
+
+
+class Command(BaseCommand):
+    help = "Check that budgets add up down the BudgetYear -> Plan -> Project -> BudgetItem tree and invoices stay within allocation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fiscal-year', type=int, action='append', dest='fiscal_years',
+                            help="BudgetYear id to audit (repeatable). Defaults to every year.")
+        parser.add_argument('--fail-on-issues', action='store_true',
+                            help="Exit with an error status when any issue is found")
+
+    def handle(self, *args, **options):
+        issues = audit.audit(options['fiscal_years'])
+        for entry in issues:
+            self.stdout.write(audit.describe(entry))
+        if not issues:
+            self.stdout.write(self.style.SUCCESS("No issues found"))
+        elif options['fail_on_issues']:
+            raise CommandError(f"{len(issues)} issues found")
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(issues)} issues found"))
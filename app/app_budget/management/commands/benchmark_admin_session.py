@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.crypto import get_random_string
+
+from app_budget.caching import bump_versions
+
+CONFIGURATIONS = {
+    'database': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    },
+    'cached': {},
+}
+
+
+class Command(BaseCommand):
+    help = "Compare per-request queries and latency of an admin page with database vs cache-backed sessions and users"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/admin/')
+        parser.add_argument('--requests', type=int, default=50)
+
+    def handle(self, *args, **options):
+        host = next((host for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost').lstrip('.')
+        results = {}
+        # Everything, including the throwaway superuser and its sessions, is rolled back afterwards
+        with transaction.atomic():
+            user = User.objects.create_superuser(f"benchmark-{get_random_string(8)}", None, None)
+            for name, overrides in CONFIGURATIONS.items():
+                with override_settings(**overrides):
+                    client = Client(HTTP_HOST=host)
+                    client.force_login(user)
+                    client.get(options['url'])
+                    queries = elapsed = 0
+                    for _ in range(options['requests']):
+                        with CaptureQueriesContext(connection) as context:
+                            started = time.perf_counter()
+                            response = client.get(options['url'])
+                            elapsed += time.perf_counter() - started
+                        queries += len(context.captured_queries)
+                    results[name] = (queries / options['requests'], elapsed / options['requests'] * 1000, response.status_code)
+            transaction.set_rollback(True)
+        # The rolled-back user id may be handed out again; drop its cached copy
+        bump_versions(User)
+
+        for name, (queries, milliseconds, status) in results.items():
+            self.stdout.write(f"{name:>8}: {queries:.1f} queries/request, {milliseconds:.2f} ms/request (HTTP {status})")
+        saved = results['database'][0] - results['cached'][0]
+        self.stdout.write(self.style.SUCCESS(f"Cache-backed sessions and users remove {saved:.1f} queries per request"))
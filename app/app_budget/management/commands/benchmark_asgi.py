@@ -0,0 +1,127 @@
+import asyncio
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from app_budget.caching import bump_versions
+from app_budget.models import BudgetYear
+
+SERVERS = ('asgi', 'wsgi')
+
+
+def percentile(sorted_values, percent):
+    return sorted_values[min(len(sorted_values) - 1, round(percent / 100 * (len(sorted_values) - 1)))]
+
+
+async def fetch(host, port, request, timeout):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(request)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        # Connection: close, so the body ends with the connection
+        await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return int(status_line.split()[1])
+
+
+async def load(url, request, concurrency, total, timeout):
+    """Send `total` copies of `request` to `url` over `concurrency` parallel connections."""
+    parts = urlsplit(url)
+    latencies, statuses = [], Counter()
+    remaining = total
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                status = await fetch(parts.hostname, parts.port or 80, request, timeout)
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                status = 'error'
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'rps': total / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'failed': sum(count for status, count in statuses.items() if status == 'error' or status >= 400),
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare throughput of an API endpoint under concurrent connections on the ASGI and WSGI servers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--asgi-url', default='http://localhost:8000', help="core_project.asgi, e.g. under uvicorn workers")
+        parser.add_argument('--wsgi-url', default='http://localhost:8001', help="core_project.wsgi, e.g. under gunicorn")
+        parser.add_argument('--path', help="Defaults to the summary of the newest fiscal year")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50, 200])
+        parser.add_argument('--requests', type=int, default=1000, help="Per server and concurrency level")
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        for name in SERVERS:
+            if urlsplit(options[f'{name}_url']).scheme != 'http':
+                raise CommandError(f"--{name}-url must be a plain http:// URL")
+        path = options['path']
+        if path is None:
+            budget_year = BudgetYear.objects.order_by('-pk').first()
+            if budget_year is None:
+                raise CommandError("There is no fiscal year to summarize; pass --path")
+            path = reverse('app_budget:budget_year_summary', args=[budget_year.pk])
+
+        # The servers read the session from the shared store, so this one has to be committed;
+        # the throwaway superuser and its session are deleted again afterwards
+        user = User.objects.create_superuser(f"benchmark-{get_random_string(8)}", None, None)
+        session = Client()
+        try:
+            session.force_login(user)
+            host = next((host for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost').lstrip('.')
+            # One request per connection, as gunicorn's sync workers do not keep connections alive
+            request = (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {host}\r\n"
+                f"Cookie: {settings.SESSION_COOKIE_NAME}={session.cookies[settings.SESSION_COOKIE_NAME].value}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+            results = asyncio.run(self.run_all(request, options))
+        finally:
+            session.logout()
+            user.delete()
+            bump_versions(User)
+
+        self.stdout.write(f"GET {path}, {options['requests']} requests per run")
+        for concurrency in options['concurrency']:
+            for name in SERVERS:
+                result = results[name, concurrency]
+                self.stdout.write(
+                    f"{name} x{concurrency:<4} {result['rps']:8.1f} req/s  p50 {result['p50']:7.1f} ms  "
+                    f"p95 {result['p95']:7.1f} ms  p99 {result['p99']:7.1f} ms  {result['failed']} failed"
+                )
+            ratio = results['asgi', concurrency]['rps'] / results['wsgi', concurrency]['rps']
+            self.stdout.write(self.style.SUCCESS(f"x{concurrency}: ASGI serves {ratio:.2f}x the WSGI throughput"))
+
+    async def run_all(self, request, options):
+        results = {}
+        for concurrency in options['concurrency']:
+            for name in SERVERS:
+                results[name, concurrency] = await load(
+                    options[f'{name}_url'], request, concurrency, options['requests'], options['timeout'],
+                )
+        return results
@@ -0,0 +1,57 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app_budget.importers import BudgetImporter, ImportRowError, iter_batches
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import plans, projects, budget items and monthly plans from CSV files "
+        "(plans.csv, projects.csv, budget_items.csv, monthly_plans.csv) or XLSX sheets with those names"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Validate every row, then roll everything back")
+        parser.add_argument('--user', help="Username recorded as created_by / updated_by")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Unknown user {options['user']!r}")
+
+        importer = BudgetImporter(batch_size=options['batch_size'], user=user)
+        total_rows = total_seconds = 0
+        try:
+            # All or nothing: any bad row rolls the whole import back
+            with transaction.atomic():
+                numbers = {}
+                for kind, rows in iter_batches(options['paths'], options['batch_size']):
+                    report = importer.import_batch(kind, rows)
+                    numbers[kind] = numbers.get(kind, 0) + 1
+                    total_rows += report['rows']
+                    total_seconds += report['seconds']
+                    self.stdout.write(
+                        f"{kind} batch {numbers[kind]}: {report['rows']} rows, {report['created']} created, "
+                        f"{report['updated']} updated in {report['seconds']:.2f}s "
+                        f"({report['rows'] / max(report['seconds'], 1e-6):.0f} rows/s)"
+                    )
+                importer.finish()
+                if importer.errors or options['dry_run']:
+                    transaction.set_rollback(True)
+        except ImportRowError as e:
+            raise CommandError(str(e))
+
+        for kind, line, message in importer.errors:
+            self.stderr.write(f"{kind} line {line}: {message}")
+        summary = f"{total_rows} rows in {total_seconds:.2f}s ({total_rows / max(total_seconds, 1e-6):.0f} rows/s)"
+        if importer.errors:
+            raise CommandError(f"{len(importer.errors)} invalid rows; nothing was imported ({summary})")
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Dry run OK, nothing written: {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Imported {summary}"))
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app_budget import tasks
+from app_budget.models import Image
+
+
+class Command(BaseCommand):
+    help = "Run the background worker that converts uploaded Image originals to WebP and removes deleted media"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty")
+        parser.add_argument('--requeue', action='store_true',
+                            help="Put pending, failed and stalled images back on the queue before starting")
+
+    def handle(self, *args, **options):
+        if settings.IMAGE_PROCESSING_BACKEND != 'redis':
+            raise CommandError("IMAGE_PROCESSING_BACKEND is not 'redis'; images are processed inline")
+        if options['requeue']:
+            count = tasks.retry_images(Image.objects.all())
+            self.stdout.write(f"Requeued {count} images")
+        processed = tasks.run_worker(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs"))
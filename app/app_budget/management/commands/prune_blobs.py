@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from app_budget import resumable, tasks
+from app_budget.models import Blob
+
+
+class Command(BaseCommand):
+    help = "Delete stored blobs (and their files) that no Image or File row points at any more, and expired resumable uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted")
+
+    def handle(self, *args, **options):
+        count = 0
+        freed = 0
+        for blob in Blob.objects.unreferenced().iterator():
+            count += 1
+            freed += blob.size
+            if not options['dry_run']:
+                tasks.delete_blob(blob)
+        uploads = resumable.expired().count() if options['dry_run'] else resumable.remove_expired()
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {count} blobs ({freed} bytes) and {uploads} expired uploads"))
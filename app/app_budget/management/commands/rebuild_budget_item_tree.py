@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app_budget.models import BudgetItem
+
+
+class Command(BaseCommand):
+    help = "Recompute BudgetItem.tree_path / tree_depth from main_budget_item for existing data"
+
+    def handle(self, *args, **options):
+        count = BudgetItem.objects.rebuild_tree()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt tree paths for {count} budget items"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from app_budget import rollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized budget rollup (BudgetYear -> Plan -> Project -> BudgetItem)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fiscal-year', type=int, action='append', dest='fiscal_years',
+                            help="BudgetYear id to rebuild (repeatable). Defaults to every year.")
+
+    def handle(self, *args, **options):
+        count = rollup.rebuild(options['fiscal_years'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} rollup rows"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app_budget import search
+from app_budget.models import SearchDocument
+
+
+class Command(BaseCommand):
+    help = "Rebuild the admin search documents of every indexed model"
+
+    def handle(self, *args, **options):
+        for model in search.SEARCH_INDEX:
+            with transaction.atomic():
+                count = search.reindex(model)
+                # Documents whose row was removed behind the ORM's back (raw SQL, loaddata, ...)
+                stale, _ = (SearchDocument.objects.filter(model=search.document_label(model))
+                            .exclude(object_id__in=model._default_manager.values('pk')).delete())
+            self.stdout.write(f"{model._meta.verbose_name}: {count} indexed, {stale} stale removed")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
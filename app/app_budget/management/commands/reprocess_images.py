@@ -0,0 +1,54 @@
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_budget import reprocess
+
+
+class Command(BaseCommand):
+    help = "Re-encode the WebP derivatives of processed images with the current IMAGE_* settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoice', type=int, action='append', dest='invoices',
+                            help="Invoice id (repeatable)")
+        parser.add_argument('--fiscal-year', type=int, action='append', dest='fiscal_years',
+                            help="BudgetYear id (repeatable)")
+        parser.add_argument('--since', type=date.fromisoformat, help="Images uploaded on or after YYYY-MM-DD")
+        parser.add_argument('--until', type=date.fromisoformat, help="Images uploaded on or before YYYY-MM-DD")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Encoder processes")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--checkpoint', default='reprocess_images.checkpoint.json',
+                            help="Progress file; an existing one is resumed and it is removed when the run completes")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint")
+
+    def handle(self, *args, **options):
+        filters = {name: options[name] for name in ('invoices', 'fiscal_years', 'since', 'until')}
+        checkpoint = reprocess.Checkpoint(options['checkpoint'], filters)
+        if not options['restart']:
+            try:
+                if checkpoint.load():
+                    state = checkpoint.state
+                    self.stdout.write(f"Resuming after {state['phase']} {state['after']} ({state['derivatives']} derivatives done)")
+            except reprocess.CheckpointMismatch as error:
+                raise CommandError(f"{error}; pass --restart to start over")
+
+        # Rates are for this run only; a resumed run starts from the checkpoint's totals
+        started = time.monotonic()
+        images_before = checkpoint.state['images']
+        for state in reprocess.run(checkpoint, filters, options['workers'], options['batch_size']):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"{state['phase']} up to {state['after']}: {state['images']} images, "
+                f"{(state['images'] - images_before) / elapsed:.1f} images/s"
+            )
+        checkpoint.remove()
+
+        state = checkpoint.state
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-encoded {state['derivatives']} derivatives for {state['images']} images "
+            f"({(state['images'] - images_before) / elapsed:.1f} images/s), "
+            f"saved {state['bytes_saved'] / (1024 * 1024):.1f} MiB, {state['failed']} failed"
+        ))
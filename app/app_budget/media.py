@@ -0,0 +1,161 @@
+import mimetypes
+import os
+import re
+from stat import S_ISREG
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, quote_etag
+
+# Serving MEDIA_ROOT files to logged-in users (see views.serve_media).
+#
+# Blob files and their WebP derivatives are named after the SHA-256 of their content, so
+# a URL always means the same bytes: they are sent as immutable with the hash as ETag.
+# Anything else (uploads from before Blob existed) is revalidated on every use.
+#
+# The bytes themselves go out through MEDIA_SERVE_BACKEND: 'x-accel-redirect' hands the
+# file to nginx via an internal location at MEDIA_INTERNAL_URL, 'x-sendfile' to Apache
+# mod_xsendfile or lighttpd, and the default is a FileResponse that the WSGI server can
+# sendfile() (gunicorn does), with single byte ranges.
+
+# Unfinished resumable uploads (resumable.py) live here and are never served
+PARTIAL_UPLOADS = 'uploads/partial'
+CONTENT_NAMED = re.compile(r'^uploads/blobs/[0-9a-f]{2}/[0-9a-f]{2}/(?P<sha256>[0-9a-f]{64})\.(?P<extension>\w+)$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+
+def media_path(name):
+    """Absolute path of `name` under MEDIA_ROOT; SuspiciousFileOperation if it escapes it.
+
+    FileNotFoundError for unfinished uploads.
+    """
+    if not name or name.startswith('/') or '\\' in name:
+        raise SuspiciousFileOperation(name)
+    path = safe_join(settings.MEDIA_ROOT, name)
+    if os.path.relpath(path, settings.MEDIA_ROOT).split(os.sep)[:2] == PARTIAL_UPLOADS.split('/'):
+        raise FileNotFoundError(name)
+    return path
+
+
+def media_etag(name, stat):
+    match = CONTENT_NAMED.match(name)
+    if match:
+        return quote_etag(f"{match['sha256']}.{match['extension']}")
+    return quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+def add_cache_headers(response, name, etag, stat):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if CONTENT_NAMED.match(name):
+        # private: the URL is only served to logged-in users, so shared caches must not keep it
+        patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def is_fresh(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    return bool(if_none_match) and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match))
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single `bytes=` range, None to send the whole file.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or not (match['start'] or match['end']):
+        # Malformed or multiple ranges: ignoring the header is allowed
+        return None
+    if not match['start']:
+        length = int(match['end'])
+        if not length:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(match['start'])
+    end = min(int(match['end']), size - 1) if match['end'] else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFile:
+    """A file positioned at `start` that reads `length` bytes.
+
+    Without tell()/seek() FileResponse leaves Content-Length alone; fileno() still lets the
+    WSGI server sendfile() from the current offset for the Content-Length we set.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+        self.name = file.name
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def offloaded_response(name, path, content_type):
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SERVE_BACKEND == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_INTERNAL_URL + quote(name)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def file_response(request, path, size, etag, content_type):
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            response = FileResponse(RangeFile(open(path, 'rb'), start, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+            response['Accept-Ranges'] = 'bytes'
+            return response
+    response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve(request, name):
+    """The response for MEDIA_ROOT file `name`; the caller has already checked access."""
+    path = media_path(name)
+    stat = os.stat(path)
+    if not S_ISREG(stat.st_mode):
+        raise FileNotFoundError(name)
+    etag = media_etag(name, stat)
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if is_fresh(request, etag):
+        response = HttpResponse(status=304)
+    elif settings.MEDIA_SERVE_BACKEND:
+        response = offloaded_response(name, path, content_type)
+    else:
+        response = file_response(request, path, stat.st_size, etag, content_type)
+    return add_cache_headers(response, name, etag, stat)
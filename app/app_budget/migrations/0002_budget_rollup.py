@@ -0,0 +1,47 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='order',
+            field=models.PositiveIntegerField(default=1, verbose_name='Order'),
+        ),
+        migrations.CreateModel(
+            name='BudgetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('budget_year', 'ปีงบประมาณ'), ('plan', 'แผนงาน'), ('project', 'โครงการ'), ('budget_item', 'รายการงบ')], max_length=20, verbose_name='ระดับ')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='รหัสอ้างอิง')),
+                ('allocated_budget', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='งบประมาณได้รับจัดสรร')),
+                ('operating_budget', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='งบดำเนินการ')),
+                ('procurement_budget', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='งบประมาณซื้อจ้าง')),
+                ('children_allocated_budget', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='งบประมาณได้รับจัดสรรของรายการย่อย')),
+                ('children_operating_budget', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='งบดำเนินการของรายการย่อย')),
+                ('children_procurement_budget', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='งบประมาณซื้อจ้างของรายการย่อย')),
+                ('invoiced_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='ยอดเบิกจ่ายตามใบแจ้งหนี้')),
+                ('remaining_budget', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='งบประมาณคงเหลือ')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='วันที่แก้ไขล่าสุด')),
+                ('fiscal_year', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_budget.budgetyear', verbose_name='ปีงบประมาณ')),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='app_budget.budgetrollup', verbose_name='ระดับบน')),
+            ],
+            options={
+                'verbose_name': 'สรุปงบประมาณ',
+                'verbose_name_plural': 'สรุปงบประมาณ',
+                'indexes': [models.Index(fields=['fiscal_year', 'level'], name='budget_rollup_year_level_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='budgetrollup',
+            constraint=models.UniqueConstraint(fields=('level', 'object_id'), name='unique_budget_rollup_node'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+def populate_tree_path(apps, schema_editor):
+    BudgetItem = apps.get_model('app_budget', 'BudgetItem')
+    parents = dict(BudgetItem.objects.values_list('pk', 'main_budget_item_id'))
+    paths = {}
+
+    def resolve(pk, seen=()):
+        if pk not in paths:
+            parent_id = parents[pk]
+            prefix = ''
+            if parent_id in parents and parent_id not in seen and parent_id != pk:
+                prefix = resolve(parent_id, seen + (pk,))
+            paths[pk] = prefix + f"{pk:010d}/"
+        return paths[pk]
+
+    for pk in parents:
+        resolve(pk)
+    items = [BudgetItem(pk=pk, tree_path=path, tree_depth=path.count('/') - 1) for pk, path in paths.items()]
+    BudgetItem.objects.bulk_update(items, ['tree_path', 'tree_depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0002_budget_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetitem',
+            name='tree_depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='ระดับชั้น'),
+        ),
+        migrations.AddField(
+            model_name='budgetitem',
+            name='tree_path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=500, verbose_name='เส้นทางในลำดับชั้น'),
+        ),
+        migrations.RunPython(populate_tree_path, migrations.RunPython.noop),
+    ]
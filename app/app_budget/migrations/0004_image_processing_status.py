@@ -0,0 +1,40 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+def mark_existing_images_done(apps, schema_editor):
+    # Rows saved before the queue existed already carry their WebP derivative
+    Image = apps.get_model('app_budget', 'Image')
+    Image.objects.exclude(file='').update(processing_status='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0003_budget_item_tree_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='processing_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='จำนวนครั้งที่ประมวลผล'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='processing_error',
+            field=models.TextField(blank=True, default='', verbose_name='ข้อผิดพลาดการประมวลผล'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'รอประมวลผล'), ('processing', 'กำลังประมวลผล'), ('done', 'เสร็จสิ้น'), ('failed', 'ล้มเหลว')], default='pending', max_length=20, verbose_name='สถานะการประมวลผล'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='file',
+            field=models.ImageField(blank=True, upload_to='uploads/images/%Y/%m/%d/', verbose_name='รูปภาพประกอบ'),
+        ),
+        migrations.RunPython(mark_existing_images_done, migrations.RunPython.noop),
+    ]
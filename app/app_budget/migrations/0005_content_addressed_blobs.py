@@ -0,0 +1,41 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:15
+
+import app_budget.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0004_image_processing_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('file', models.FileField(max_length=255, upload_to=app_budget.models.blob_upload_to, verbose_name='ไฟล์')),
+                ('derivative', models.ImageField(blank=True, max_length=255, upload_to=app_budget.models.blob_derivative_upload_to, verbose_name='ไฟล์ที่แปลงแล้ว')),
+                ('size', models.PositiveBigIntegerField(verbose_name='ขนาดไฟล์')),
+                ('content_type', models.CharField(blank=True, max_length=100, verbose_name='ประเภทไฟล์')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่สร้าง')),
+            ],
+            options={
+                'verbose_name': 'ไฟล์ที่จัดเก็บ',
+                'verbose_name_plural': 'ไฟล์ที่จัดเก็บ',
+            },
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='files', to='app_budget.blob', verbose_name='ไฟล์ที่จัดเก็บ'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='images', to='app_budget.blob', verbose_name='ไฟล์ที่จัดเก็บ'),
+        ),
+    ]
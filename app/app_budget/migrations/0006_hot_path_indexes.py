@@ -0,0 +1,67 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:17
+
+from django.db import migrations, models
+from django.db.models import Count
+
+DUPLICATES_LISTED = 50
+
+
+def check_duplicate_monthly_plans(apps, schema_editor):
+    # The constraint below cannot be added over duplicate rows. Which of them holds the right
+    # amounts is for a person to decide, so stop here with a list rather than guess.
+    MonthlyPlan = apps.get_model('app_budget', 'MonthlyPlan')
+    duplicates = list(
+        MonthlyPlan.objects.values('budget_item_id', 'year', 'month').annotate(rows=Count('pk')).filter(rows__gt=1)
+        .order_by('budget_item_id', 'year', 'month')
+    )
+    if not duplicates:
+        return
+    lines = [
+        f"  budget_item {row['budget_item_id']}, {row['year']}-{row['month']:02d}: {row['rows']} rows"
+        for row in duplicates[:DUPLICATES_LISTED]
+    ]
+    if len(duplicates) > DUPLICATES_LISTED:
+        lines.append(f"  ... and {len(duplicates) - DUPLICATES_LISTED} more")
+    raise RuntimeError(
+        "Cannot add monthly_plan_item_period_uniq: these budget items have more than one MonthlyPlan "
+        "row for the same month. Merge or delete the extra rows, then migrate again.\n" + "\n".join(lines)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0005_content_addressed_blobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['file_name_original'], name='image_name_original_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(condition=models.Q(('processing_status', 'done'), _negated=True), fields=['processing_status'], name='image_unprocessed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['fiscal_year', 'invoice_type', 'invoice_date'], name='invoice_year_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('budget_item__isnull', True)), fields=['fiscal_year'], name='invoice_year_unassigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plan',
+            index=models.Index(fields=['fiscal_year', 'sort_order'], name='plan_year_sort_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['plan', 'project_status', 'sort_order'], name='project_plan_status_sort_idx'),
+        ),
+        migrations.RunPython(check_duplicate_monthly_plans, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='monthlyplan',
+            constraint=models.UniqueConstraint(fields=('budget_item', 'year', 'month'), name='monthly_plan_item_period_uniq'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='budgetitem',
+            index=models.Index(fields=['budget_item_name'], name='budget_item_name_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='budgetitem',
+            index=models.Index(fields=['project', 'budget_item_name'], name='budget_item_project_name_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='budgetitem',
+            index=models.Index(fields=['project', 'sort_number'], name='budget_item_project_sort_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='plan',
+            index=models.Index(fields=['fiscal_year', 'plan_name'], name='plan_year_name_prefix_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='plan',
+            index=models.Index(fields=['fiscal_year', 'plan_code'], name='plan_year_code_prefix_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['project_name'], name='project_name_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['project_code'], name='project_code_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:34
+
+from django.db import migrations, models
+
+FTS_TABLE = 'app_budget_searchdocument_fts'
+
+# Frozen copy of search.SEARCH_INDEX for the backfill
+SEARCH_INDEX = {
+    'plan': ('plan_name', 'plan_code', 'fiscal_year__fiscal_year'),
+    'project': ('project_name', 'project_code', 'plan__plan_name'),
+    'budgetitem': ('budget_item_name', 'sort_number', 'project__project_name'),
+    'monthlyplan': ('budget_item__budget_item_name',),
+    'invoice': ('invoice_number', 'fiscal_year__fiscal_year', 'contractor_name', 'approver_name', 'budget_item__budget_item_name'),
+}
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+            available = cursor.fetchone() is not None
+        # Without pg_trgm searches still work, as sequential LIKE scans
+        if available:
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            schema_editor.execute(
+                "CREATE INDEX search_document_body_trgm_idx ON app_budget_searchdocument USING gin (body gin_trgm_ops)"
+            )
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(body, content='app_budget_searchdocument', content_rowid='id', tokenize='trigram')"
+        )
+        schema_editor.execute(f"""
+            CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON app_budget_searchdocument BEGIN
+                INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body);
+            END""")
+        schema_editor.execute(f"""
+            CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON app_budget_searchdocument BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body);
+            END""")
+        schema_editor.execute(f"""
+            CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON app_budget_searchdocument BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body);
+                INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body);
+            END""")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS search_document_body_trgm_idx")
+    elif schema_editor.connection.vendor == 'sqlite':
+        for suffix in ('_ai', '_ad', '_au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def backfill(apps, schema_editor):
+    SearchDocument = apps.get_model('app_budget', 'SearchDocument')
+    for model_name, lookups in SEARCH_INDEX.items():
+        model = apps.get_model('app_budget', model_name)
+        batch = []
+        for pk, *values in model.objects.order_by().values_list('pk', *lookups).iterator(chunk_size=2000):
+            body = '\n'.join(str(value) for value in values if value not in (None, '')).casefold()
+            batch.append(SearchDocument(model=f'app_budget.{model_name}', object_id=pk, body=body))
+            if len(batch) >= 2000:
+                SearchDocument.objects.bulk_create(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0007_autocomplete_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='ประเภทข้อมูล')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='รหัสอ้างอิง')),
+                ('body', models.TextField(blank=True, default='', verbose_name='ข้อความค้นหา')),
+            ],
+            options={
+                'verbose_name': 'ดัชนีค้นหา',
+                'verbose_name_plural': 'ดัชนีค้นหา',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('model', 'object_id'), name='search_document_object_uniq'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0008_search_documents'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['created_at', 'id'], name='invoice_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlyplan',
+            index=models.Index(fields=['created_at', 'id'], name='monthly_plan_created_idx'),
+        ),
+    ]
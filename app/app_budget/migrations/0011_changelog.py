@@ -0,0 +1,35 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:41
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('app_budget', '0010_invoice_sync_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='ประเภทข้อมูล')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='รหัสอ้างอิง')),
+                ('action', models.CharField(choices=[('create', 'เพิ่ม'), ('update', 'แก้ไข'), ('delete', 'ลบ')], max_length=10, verbose_name='การกระทำ')),
+                ('changes', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='ข้อมูลที่เปลี่ยนแปลง')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='วันที่แก้ไข')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ผู้แก้ไขข้อมูล')),
+            ],
+            options={
+                'verbose_name': 'ประวัติการแก้ไข',
+                'verbose_name_plural': 'ประวัติการแก้ไข',
+                'indexes': [models.Index(fields=['model', 'object_id', 'changed_at'], name='changelog_object_idx'), models.Index(fields=['user', 'changed_at'], name='changelog_user_idx')],
+            },
+        ),
+    ]
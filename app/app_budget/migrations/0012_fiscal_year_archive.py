@@ -0,0 +1,32 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('app_budget', '0011_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FiscalYearArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField(verbose_name='ข้อมูลที่บีบอัด')),
+                ('row_counts', models.JSONField(default=dict, verbose_name='จำนวนรายการ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่สร้าง')),
+                ('blobs', models.ManyToManyField(blank=True, related_name='archives', to='app_budget.blob', verbose_name='ไฟล์ที่จัดเก็บ')),
+                ('budget_year', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='app_budget.budgetyear', verbose_name='ปีงบประมาณ')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='added_fiscal_year_archives', to=settings.AUTH_USER_MODEL, verbose_name='ผู้เพิ่มข้อมูล')),
+            ],
+            options={
+                'verbose_name': 'ปีงบประมาณที่เก็บถาวร',
+                'verbose_name_plural': 'ปีงบประมาณที่เก็บถาวร',
+            },
+        ),
+    ]
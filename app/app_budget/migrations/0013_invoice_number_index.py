@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0012_fiscal_year_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['invoice_number'], name='invoice_number_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('app_budget', '0013_invoice_number_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumableUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name_original', models.CharField(max_length=255, verbose_name='ชื่อไฟล์เดิม')),
+                ('file_type', models.CharField(blank=True, max_length=50, verbose_name='ประเภทไฟล์')),
+                ('length', models.PositiveBigIntegerField(verbose_name='ขนาดไฟล์')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='ได้รับแล้ว (ไบต์)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่สร้าง')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='วันที่แก้ไขล่าสุด')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ผู้เพิ่มข้อมูล')),
+                ('file', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_budget.file', verbose_name='ไฟล์ที่เกี่ยวข้อง')),
+                ('invoice', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_budget.invoice', verbose_name='ใบแจ้งหนี้')),
+            ],
+            options={
+                'verbose_name': 'การอัปโหลดไฟล์แบบต่อเนื่อง',
+                'verbose_name_plural': 'การอัปโหลดไฟล์แบบต่อเนื่อง',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0014_resumable_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='file_type',
+            field=models.CharField(max_length=100, verbose_name='ประเภทไฟล์'),
+        ),
+        migrations.AlterField(
+            model_name='resumableupload',
+            name='file_type',
+            field=models.CharField(blank=True, max_length=100, verbose_name='ประเภทไฟล์'),
+        ),
+    ]
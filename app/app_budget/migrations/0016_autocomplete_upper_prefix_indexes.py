@@ -0,0 +1,60 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:19
+
+from django.db import migrations, models
+from django.db.models.functions import Upper
+
+# (model, index name, leading fields, field matched by UPPER(...) LIKE 'X%')
+PREFIX_INDEXES = [
+    ('budgetitem', 'budget_item_name_prefix_idx', [], 'budget_item_name'),
+    ('budgetitem', 'budget_item_project_name_idx', ['project'], 'budget_item_name'),
+    ('budgetitem', 'budget_item_project_sort_idx', ['project'], 'sort_number'),
+    ('plan', 'plan_year_name_prefix_idx', ['fiscal_year'], 'plan_name'),
+    ('plan', 'plan_year_code_prefix_idx', ['fiscal_year'], 'plan_code'),
+    ('project', 'project_name_prefix_idx', [], 'project_name'),
+    ('project', 'project_code_prefix_idx', [], 'project_code'),
+]
+
+
+def prefix_index(name, leading, field):
+    return models.Index(*map(models.F, leading), Upper(field), name=name)
+
+
+def create_prefix_indexes(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for model_name, name, leading, field in PREFIX_INDEXES:
+        model = apps.get_model('app_budget', model_name)
+        if schema_editor.connection.vendor == 'postgresql':
+            # text_pattern_ops lets LIKE 'X%' use the index under any collation
+            columns = [quote(model._meta.get_field(f).column) for f in leading]
+            columns.append(f"(UPPER({quote(model._meta.get_field(field).column)})) text_pattern_ops")
+            schema_editor.execute(
+                f"CREATE INDEX {quote(name)} ON {quote(model._meta.db_table)} ({', '.join(columns)})"
+            )
+        else:
+            schema_editor.add_index(model, prefix_index(name, leading, field))
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    for model_name, name, leading, field in PREFIX_INDEXES:
+        schema_editor.remove_index(apps.get_model('app_budget', model_name), prefix_index(name, leading, field))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0015_file_type_length'),
+    ]
+
+    operations = [
+        *[
+            migrations.RemoveIndex(model_name=model_name, name=name)
+            for model_name, name, leading, field in PREFIX_INDEXES
+        ],
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(create_prefix_indexes, drop_prefix_indexes)],
+            state_operations=[
+                migrations.AddIndex(model_name=model_name, index=prefix_index(name, leading, field))
+                for model_name, name, leading, field in PREFIX_INDEXES
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0016_autocomplete_upper_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='เริ่มประมวลผลเมื่อ'),
+        ),
+    ]
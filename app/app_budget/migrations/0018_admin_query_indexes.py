@@ -0,0 +1,55 @@
+# Generated by Django 4.2.3 on 2026-10-18 22:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import Upper
+
+IMAGE_NAME_PREFIX_IDX = models.Index(Upper('file_name_original'), name='image_name_prefix_idx')
+
+
+def create_image_name_prefix_index(apps, schema_editor):
+    Image = apps.get_model('app_budget', 'Image')
+    if schema_editor.connection.vendor == 'postgresql':
+        # As in 0016: text_pattern_ops lets LIKE 'X%' use the index under any collation
+        schema_editor.execute(
+            "CREATE INDEX image_name_prefix_idx ON app_budget_image ((UPPER(file_name_original)) text_pattern_ops)"
+        )
+    else:
+        schema_editor.add_index(Image, IMAGE_NAME_PREFIX_IDX)
+
+
+def drop_image_name_prefix_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('app_budget', 'Image'), IMAGE_NAME_PREFIX_IDX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_budget', '0017_image_processing_started_at'),
+    ]
+
+    operations = [
+        # Nothing looks images up by exact name; the admin searches by prefix
+        migrations.RemoveIndex(
+            model_name='image',
+            name='image_name_original_idx',
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_image_name_prefix_index, drop_image_name_prefix_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name='image', index=IMAGE_NAME_PREFIX_IDX),
+            ],
+        ),
+        # The unique constraint's index already leads with budget_item
+        migrations.AlterField(
+            model_name='monthlyplan',
+            name='budget_item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='app_budget.budgetitem', verbose_name='รายการงบ'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlyplan',
+            index=models.Index(fields=['year', 'month', 'created_at', 'id'], name='monthly_plan_period_idx'),
+        ),
+    ]
@@ -1,9 +1,14 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr, Upper
 from django.contrib.auth.models import User
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from PIL import Image as PILImage
-from io import BytesIO
-import os, random, string
+import hashlib, os, random, shutil, string, tempfile, uuid
 
 class BudgetYear(models.Model):
     fiscal_year = models.CharField(max_length=255, verbose_name="ปีงบประมาณ")
@@ -37,6 +42,14 @@ class Plan(models.Model):
     updated_at = models.DateTimeField(auto_now=True, verbose_name="วันที่แก้ไขล่าสุด")
     sort_order = models.IntegerField(default=500, verbose_name="ลำดับการจัดเรียง")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fiscal_year', 'sort_order'], name='plan_year_sort_idx'),
+            # Case-insensitive prefix searches of the admin autocomplete, scoped to a fiscal year
+            models.Index(F('fiscal_year'), Upper('plan_name'), name='plan_year_name_prefix_idx'),
+            models.Index(F('fiscal_year'), Upper('plan_code'), name='plan_year_code_prefix_idx'),
+        ]
+
     def __str__(self):
         return self.plan_name
 
@@ -66,6 +79,14 @@ class Project(models.Model):
     updated_at = models.DateTimeField(auto_now=True, verbose_name="วันที่แก้ไขล่าสุด")
     sort_order = models.IntegerField(default=500, verbose_name="ลำดับการจัดเรียง")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['plan', 'project_status', 'sort_order'], name='project_plan_status_sort_idx'),
+            # Admin autocomplete prefix searches (see autocomplete.py)
+            models.Index(Upper('project_name'), name='project_name_prefix_idx'),
+            models.Index(Upper('project_code'), name='project_code_prefix_idx'),
+        ]
+
     def __str__(self):
         return self.project_name
 
@@ -81,6 +102,62 @@ class Category(models.Model):
         return self.category_name
 
 
+TREE_PATH_WIDTH = 10
+
+
+def tree_path_segment(pk):
+    return f"{pk:0{TREE_PATH_WIDTH}d}/"
+
+
+def tree_path_ids(path):
+    return [int(segment) for segment in path.split('/') if segment]
+
+
+class BudgetItemQuerySet(models.QuerySet):
+    # Every helper below is a single query over the materialized `tree_path`
+
+    def descendants_of(self, item, include_self=False):
+        queryset = self.filter(tree_path__startswith=item.tree_path)
+        if not include_self:
+            queryset = queryset.exclude(pk=item.pk)
+        return queryset.order_by('tree_path')
+
+    def ancestors_of(self, item, include_self=False):
+        ids = tree_path_ids(item.tree_path)
+        if not include_self:
+            ids = ids[:-1]
+        return self.filter(pk__in=ids).order_by('tree_depth')
+
+    def tree(self):
+        # Depth-first order: each item is directly followed by its subtree
+        return self.order_by('tree_path')
+
+    def rebuild_tree(self):
+        parents = dict(self.model.objects.values_list('pk', 'main_budget_item_id'))
+        children = {}
+        for pk, parent_id in parents.items():
+            children.setdefault(parent_id if parent_id in parents and parent_id != pk else None, []).append(pk)
+
+        paths = {}
+        frontier = [(pk, '') for pk in children.get(None, [])]
+        while frontier:
+            next_frontier = []
+            for pk, parent_path in frontier:
+                paths[pk] = parent_path + tree_path_segment(pk)
+                next_frontier.extend((child, paths[pk]) for child in children.get(pk, []))
+            frontier = next_frontier
+        # Whatever is left sits on a main_budget_item cycle; treat those items as roots
+        for pk in parents.keys() - paths.keys():
+            paths[pk] = tree_path_segment(pk)
+
+        items = [
+            self.model(pk=pk, tree_path=path, tree_depth=path.count('/') - 1)
+            for pk, path in paths.items()
+        ]
+        self.model.objects.bulk_update(items, ['tree_path', 'tree_depth'], batch_size=500)
+        return len(items)
+
+
 class BudgetItem(models.Model):
     ITEM_TYPE_CHOICES = [
         ('main_item', 'หัวข้อหลัก'),
@@ -105,14 +182,71 @@ class BudgetItem(models.Model):
     item_type = models.CharField(max_length=50, choices=ITEM_TYPE_CHOICES, default='main_item', verbose_name="ประเภทของรายการงบ")
     sub_item_type = models.CharField(max_length=50, choices=SUB_ITEM_CHOICES, default='none', verbose_name="ประเภทของรายการย่อย")
     sort_number = models.CharField(max_length=255, verbose_name="หมายเลขลำดับ")
+    tree_path = models.CharField(max_length=500, blank=True, default='', editable=False, db_index=True, verbose_name="เส้นทางในลำดับชั้น")
+    tree_depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="ระดับชั้น")
     created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="added_budget_items", verbose_name="ผู้เพิ่มข้อมูล")
     updated_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="edited_budget_items", verbose_name="ผู้แก้ไขข้อมูล")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="วันที่แก้ไขล่าสุด")
 
+    objects = BudgetItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Admin autocomplete prefix searches, across all items and within one project (see autocomplete.py).
+            # On PostgreSQL migration 0016 builds these UPPER() indexes with text_pattern_ops.
+            models.Index(Upper('budget_item_name'), name='budget_item_name_prefix_idx'),
+            models.Index(F('project'), Upper('budget_item_name'), name='budget_item_project_name_idx'),
+            models.Index(F('project'), Upper('sort_number'), name='budget_item_project_sort_idx'),
+        ]
+
     def __str__(self):
         return self.budget_item_name
 
+    def clean(self):
+        super().clean()
+        try:
+            self.get_parent_tree_path()
+        except ValueError as e:
+            raise ValidationError({'main_budget_item': str(e)})
+
+    def get_parent_tree_path(self):
+        if not self.main_budget_item_id:
+            return ''
+        parent_path = BudgetItem.objects.filter(pk=self.main_budget_item_id).values_list('tree_path', flat=True).first() or ''
+        # An item cannot be moved underneath itself or one of its own descendants
+        if self.pk and (self.main_budget_item_id == self.pk or self.pk in tree_path_ids(parent_path)):
+            raise ValueError("รายการงบหลักต้องไม่เป็นรายการนี้หรือรายการย่อยของรายการนี้")
+        return parent_path
+
+    def save(self, *args, **kwargs):
+        parent_path = self.get_parent_tree_path()
+        super().save(*args, **kwargs)
+        self.sync_tree_path(parent_path)
+
+    def sync_tree_path(self, parent_path):
+        new_path = parent_path + tree_path_segment(self.pk)
+        old_path = BudgetItem.objects.filter(pk=self.pk).values_list('tree_path', flat=True).first() or ''
+        if old_path == new_path:
+            self.tree_path, self.tree_depth = new_path, new_path.count('/') - 1
+            return
+        depth = new_path.count('/') - 1
+        BudgetItem.objects.filter(pk=self.pk).update(tree_path=new_path, tree_depth=depth)
+        if old_path:
+            # Re-root the whole subtree in one UPDATE when the item moves
+            shift = depth - (old_path.count('/') - 1)
+            BudgetItem.objects.filter(tree_path__startswith=old_path).exclude(pk=self.pk).update(
+                tree_path=Concat(Value(new_path), Substr('tree_path', len(old_path) + 1)),
+                tree_depth=F('tree_depth') + shift,
+            )
+        self.tree_path, self.tree_depth = new_path, depth
+
+    def get_ancestors(self):
+        return BudgetItem.objects.ancestors_of(self)
+
+    def get_descendants(self):
+        return BudgetItem.objects.descendants_of(self)
+
 MONTH_CHOICES = [
         (1, "มกราคม"), (2, "กุมภาพันธ์"), (3, "มีนาคม"), (4, "เมษายน"),
         (5, "พฤษภาคม"), (6, "มิถุนายน"), (7, "กรกฎาคม"), (8, "สิงหาคม"),
@@ -120,7 +254,8 @@ MONTH_CHOICES = [
     ]
 
 class MonthlyPlan(models.Model):
-    budget_item = models.ForeignKey(BudgetItem, on_delete=models.CASCADE, verbose_name="รายการงบ")
+    # No index of its own: monthly_plan_item_period_uniq leads with budget_item
+    budget_item = models.ForeignKey(BudgetItem, on_delete=models.CASCADE, db_index=False, verbose_name="รายการงบ")
     month = models.PositiveSmallIntegerField(choices=MONTH_CHOICES, verbose_name="เดือน")
     year = models.PositiveIntegerField(verbose_name="ปี")
     planned_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="แผนสำหรับเดือนนั้น")
@@ -130,6 +265,17 @@ class MonthlyPlan(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="วันที่แก้ไขล่าสุด")
 
+    class Meta:
+        constraints = [
+            # One row per budget item and month; also the index for (budget_item, year, month) lookups
+            models.UniqueConstraint(fields=['budget_item', 'year', 'month'], name='monthly_plan_item_period_uniq'),
+        ]
+        indexes = [
+            # Keyset pages of the admin changelist (see pagination.py), unfiltered and by its year/month filters
+            models.Index(fields=['created_at', 'id'], name='monthly_plan_created_idx'),
+            models.Index(fields=['year', 'month', 'created_at', 'id'], name='monthly_plan_period_idx'),
+        ]
+
     def __str__(self):
         return f"{self.budget_item} - {self.month} {self.year}"
 
@@ -166,28 +312,155 @@ class Invoice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="วันที่แก้ไขล่าสุด")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fiscal_year', 'invoice_type', 'invoice_date'], name='invoice_year_type_date_idx'),
+            # Invoices booked straight against the fiscal year (see rollup.direct_invoiced)
+            models.Index(fields=['fiscal_year'], condition=Q(budget_item__isnull=True), name='invoice_year_unassigned_idx'),
+            # Keyset pages of the admin changelist (see pagination.py)
+            models.Index(fields=['created_at', 'id'], name='invoice_created_idx'),
+            # Incremental sync API (views.invoices)
+            models.Index(fields=['updated_at', 'id'], name='invoice_updated_idx'),
+            # Lookups by number (views.invoice_lookup)
+            models.Index(fields=['invoice_number'], name='invoice_number_idx'),
+        ]
+
     def __str__(self):
         return self.invoice_number
 
+def blob_upload_to(instance, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return f"uploads/blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}{extension}"
+
+
+def blob_derivative_upload_to(instance, filename):
+    return f"uploads/blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}.webp"
+
+
+def hash_upload(upload):
+    # Uploads that came through HashingUploadHandler were hashed while streaming in
+    sha256 = getattr(upload, 'sha256', None)
+    if sha256:
+        return sha256
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobQuerySet(models.QuerySet):
+    def store(self, upload):
+        sha256 = hash_upload(upload)
+        blob = self.filter(sha256=sha256).first()
+        if blob is not None:
+            return blob
+        blob = self.model(sha256=sha256, size=upload.size, content_type=getattr(upload, 'content_type', '') or '')
+        blob.file.save(upload.name, upload, save=False)
+        try:
+            with transaction.atomic():
+                blob.save()
+        except IntegrityError:
+            # Someone stored the same content first; keep theirs
+            blob.file.delete(save=False)
+            blob = self.get(sha256=sha256)
+        return blob
+
+    def adopt(self, path, sha256, filename, content_type=''):
+        """Blob for the already hashed file at `path`, which is removed once the transaction commits.
+
+        Until then `path` is left alone, so a rolled-back caller still has its bytes.
+        """
+        blob = self.filter(sha256=sha256).first()
+        if blob is None:
+            blob = self.model(sha256=sha256, size=os.path.getsize(path), content_type=content_type)
+            blob.file.name = blob_upload_to(blob, filename)
+            os.makedirs(os.path.dirname(blob.file.path), exist_ok=True)
+            # copyfile() copies in the kernel where it can. The rename never leaves half a file
+            # under the content name and replaces any leftover from a rolled-back attempt,
+            # which held these same bytes.
+            temporary = f"{blob.file.path}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(path, temporary)
+            os.replace(temporary, blob.file.path)
+            try:
+                with transaction.atomic():
+                    blob.save()
+            except IntegrityError:
+                # Someone stored the same content first, under the same name; keep theirs
+                blob = self.get(sha256=sha256)
+
+        def remove_source():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        transaction.on_commit(remove_source)
+        return blob
+
+    def unreferenced(self):
+        # Archived years' File/Image rows still need their content for a restore
+        return self.filter(images__isnull=True, files__isnull=True, archives__isnull=True)
+
+
+class Blob(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="SHA-256")
+    file = models.FileField(upload_to=blob_upload_to, max_length=255, verbose_name="ไฟล์")
+    derivative = models.ImageField(upload_to=blob_derivative_upload_to, max_length=255, blank=True, verbose_name="ไฟล์ที่แปลงแล้ว")
+    size = models.PositiveBigIntegerField(verbose_name="ขนาดไฟล์")
+    content_type = models.CharField(max_length=100, blank=True, verbose_name="ประเภทไฟล์")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
+
+    objects = BlobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'ไฟล์ที่จัดเก็บ'
+        verbose_name_plural = 'ไฟล์ที่จัดเก็บ'
+
+    def __str__(self):
+        return self.sha256
+
+
 class File(models.Model):
     invoice = models.ForeignKey(Invoice, related_name="files", on_delete=models.CASCADE)
     file = models.FileField(upload_to='uploads/files/%Y/%m/%d/', null=True, blank=True, verbose_name='ไฟล์ที่เกี่ยวข้อง')
+    blob = models.ForeignKey(Blob, null=True, blank=True, editable=False, on_delete=models.PROTECT, related_name="files", verbose_name="ไฟล์ที่จัดเก็บ")
     file_name_original = models.CharField(max_length=255, verbose_name="ชื่อไฟล์เดิม")
-    file_type = models.CharField(max_length=50, verbose_name="ประเภทไฟล์")
+    file_type = models.CharField(max_length=100, verbose_name="ประเภทไฟล์")
     file_size = models.PositiveIntegerField(verbose_name="ขนาดไฟล์")
     created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="added_files", verbose_name="ผู้เพิ่มข้อมูล")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
 
+    def save(self, *args, **kwargs):
+        if self.file and not self.file._committed:
+            self.file_type = getattr(self.file.file, 'content_type', '') or self.file_type
+            self.file_size = self.file.size
+            self.file_name_original = os.path.basename(self.file.name)
+            # Point at the shared content-addressed copy instead of writing a new file
+            self.blob = Blob.objects.store(self.file.file)
+            self.file.name = self.blob.file.name
+            self.file._committed = True
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.file_name_original
 
 class Image(models.Model):
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', 'รอประมวลผล'),
+        ('processing', 'กำลังประมวลผล'),
+        ('done', 'เสร็จสิ้น'),
+        ('failed', 'ล้มเหลว'),
+    ]
     invoice = models.ForeignKey(Invoice, related_name="items", on_delete=models.CASCADE)
     file_original = models.ImageField(upload_to='uploads/images/original/%Y/%m/%d/', verbose_name='รูปภาพประกอบ')
-    file = models.ImageField(upload_to='uploads/images/%Y/%m/%d/', verbose_name='รูปภาพประกอบ')
+    file = models.ImageField(upload_to='uploads/images/%Y/%m/%d/', blank=True, verbose_name='รูปภาพประกอบ')
+    blob = models.ForeignKey(Blob, null=True, blank=True, editable=False, on_delete=models.PROTECT, related_name="images", verbose_name="ไฟล์ที่จัดเก็บ")
     file_name_original = models.CharField(max_length=255, verbose_name="ชื่อไฟล์เดิม")
     file_type = models.CharField(max_length=50, verbose_name="ประเภทไฟล์")
     file_size = models.PositiveIntegerField(verbose_name="ขนาดไฟล์")
+    processing_status = models.CharField(max_length=20, choices=PROCESSING_STATUS_CHOICES, default='pending', verbose_name="สถานะการประมวลผล")
+    processing_error = models.TextField(blank=True, default='', verbose_name="ข้อผิดพลาดการประมวลผล")
+    processing_attempts = models.PositiveSmallIntegerField(default=0, verbose_name="จำนวนครั้งที่ประมวลผล")
+    processing_started_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="เริ่มประมวลผลเมื่อ")
     created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="added_images", verbose_name="ผู้เพิ่มข้อมูล")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
     order = models.PositiveIntegerField("Order", default=1)
@@ -195,63 +468,242 @@ class Image(models.Model):
     class Meta:
         verbose_name = 'รูปภาพประกอบ'
         verbose_name_plural = 'รูปภาพประกอบ'
+        indexes = [
+            # Admin search by file name prefix; text_pattern_ops on PostgreSQL (migration 0018)
+            models.Index(Upper('file_name_original'), name='image_name_prefix_idx'),
+            # Only the few rows the worker still has to pick up
+            models.Index(fields=['processing_status'], condition=~Q(processing_status='done'), name='image_unprocessed_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        if self.file_original:
-            try:
-                # Save the original file type and size from the original image
-                self.file_type = self.file_original.file.content_type
-                self.file_size = self.file_original.size
-
-                # Save the original filename
-                original_name = self.file_original.name
-                base_name, extension = os.path.splitext(original_name)
-
-                # Handle filename conflicts by appending a count
-                count = Image.objects.filter(file_name_original=original_name).count()
-                if count > 0:
-                    self.file_name_original = f"{base_name}({count}){extension}"
-                else:
-                    self.file_name_original = original_name
-
-                # Process the image (resize, convert, etc.) before saving to `file`
-                self.process_image()
-            except:
-                pass
+        # A fresh upload is still uncommitted; only that needs a new WebP derivative
+        new_upload = bool(self.file_original) and not self.file_original._committed
+        if new_upload:
+            # Save the original file type and size from the original image
+            self.file_type = getattr(self.file_original.file, 'content_type', '') or self.file_type
+            self.file_size = self.file_original.size
+
+            # Save the original filename; stored names are content hashes so they never collide
+            self.file_name_original = os.path.basename(self.file_original.name)
+
+            # Identical uploads share one stored original and one WebP derivative
+            self.blob = Blob.objects.store(self.file_original.file)
+            self.file_original.name = self.blob.file.name
+            self.file_original._committed = True
+            self.processing_error = ''
+            self.processing_attempts = 0
+            if self.blob.derivative:
+                self.file = self.blob.derivative.name
+                self.processing_status = 'done'
+            else:
+                # The WebP is produced by the background worker; until then the original is shown
+                self.file = None
+                self.processing_status = 'pending'
         super().save(*args, **kwargs)
+        if new_upload and self.processing_status == 'pending':
+            from .tasks import enqueue_image_processing
+            # The row is saved either way; a broker outage leaves it pending for `process_images --requeue`
+            transaction.on_commit(lambda: enqueue_image_processing(self.pk), robust=True)
+
+    @property
+    def display_file(self):
+        # Serve the original as a placeholder until the derivative is ready
+        if self.processing_status == 'done' and self.file:
+            return self.file
+        return self.file_original
 
     def generate_random_string(self, length):
         characters = string.ascii_letters + string.digits
         return ''.join(random.choices(characters, k=length))
 
     def process_image(self):
-        if self.file_original:
-            # Open the original image
-            img = PILImage.open(self.file_original)
-
-            # Convert image to RGB if it has an alpha channel
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-
-            # Resize the image (you can adjust the resizing logic as needed)
-            original_width, original_height = img.size
-            new_width = int(original_width * 1)  # Adjust resize factor if needed
-            new_height = int(original_height * 1)
-            output_size = (new_width, new_height)
-
-            # Resize the image while preserving the aspect ratio
-            img.thumbnail(output_size, PILImage.Resampling.LANCZOS)
-
-            # Save the processed image to an in-memory file as WEBP
-            image_io = BytesIO()
-            img.save(image_io, format='WEBP', quality=80)
-            image_io.seek(0)
-
-            # Save the processed image to the `file` field
-            self.file = InMemoryUploadedFile(
-                image_io, 'ImageField', f"{self.generate_random_string(12)}.webp", 'image/webp',
-                image_io.getbuffer().nbytes, None
+        """Encode `file_original` as a WebP in `self.file` and return the decode statistics.
+
+        Peak memory is bounded by IMAGE_MAX_DIMENSION for JPEGs (decoded at a reduced
+        scale in draft mode) and by IMAGE_MAX_PIXELS for every other format.
+        """
+        if not self.file_original:
+            return None
+        self.file_original.open('rb')
+        # Open the original image; only the header is read at this point
+        img = PILImage.open(self.file_original)
+
+        # Refuse decompression bombs before a single pixel is decoded
+        original_width, original_height = img.size
+        if original_width * original_height > settings.IMAGE_MAX_PIXELS:
+            raise PILImage.DecompressionBombError(
+                f"Image size ({original_width}x{original_height} pixels) exceeds IMAGE_MAX_PIXELS"
             )
 
+        # Let the JPEG decoder scale down by 1/2 .. 1/8 while decoding
+        output_size = (settings.IMAGE_MAX_DIMENSION, settings.IMAGE_MAX_DIMENSION)
+        img.draft('RGB', output_size)
+        img.load()
+        live_bytes = peak_bytes = img.width * img.height * len(img.getbands())
+
+        # WebP is written as RGB; drop alpha / palette / CMYK
+        if img.mode != "RGB":
+            converted = img.convert("RGB")
+            peak_bytes = max(peak_bytes, live_bytes + converted.width * converted.height * 3)
+            img.close()
+            img = converted
+            live_bytes = img.width * img.height * 3
+
+        # Resize the image while preserving the aspect ratio
+        img.thumbnail(output_size, PILImage.Resampling.LANCZOS)
+        peak_bytes = max(peak_bytes, live_bytes + img.width * img.height * 3)
+
+        # Encode to memory, spilling to a temporary file above IMAGE_SPOOL_MAX_SIZE
+        image_io = tempfile.SpooledTemporaryFile(max_size=settings.IMAGE_SPOOL_MAX_SIZE)
+        img.save(image_io, format='WEBP', quality=settings.IMAGE_WEBP_QUALITY)
+        output_bytes = image_io.tell()
+        image_io.seek(0)
+
+        # Save the processed image to the `file` field
+        self.file = DjangoFile(image_io, name=f"{self.generate_random_string(12)}.webp")
+        stats = {
+            'original_size': (original_width, original_height),
+            'output_size': img.size,
+            'peak_bytes': peak_bytes,
+            'output_bytes': output_bytes,
+        }
+        img.close()
+        return stats
+
+    def __str__(self):
+        return self.file_name_original
+
+
+class BudgetRollup(models.Model):
+    LEVEL_CHOICES = [
+        ('budget_year', 'ปีงบประมาณ'),
+        ('plan', 'แผนงาน'),
+        ('project', 'โครงการ'),
+        ('budget_item', 'รายการงบ'),
+    ]
+    level = models.CharField(max_length=20, choices=LEVEL_CHOICES, verbose_name="ระดับ")
+    object_id = models.PositiveBigIntegerField(verbose_name="รหัสอ้างอิง")
+    # Not a real constraint: rollup rows are maintained by signals, not by the delete collector
+    fiscal_year = models.ForeignKey(BudgetYear, null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", verbose_name="ปีงบประมาณ")
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name="children", verbose_name="ระดับบน")
+    allocated_budget = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="งบประมาณได้รับจัดสรร")
+    operating_budget = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="งบดำเนินการ")
+    procurement_budget = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="งบประมาณซื้อจ้าง")
+    children_allocated_budget = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="งบประมาณได้รับจัดสรรของรายการย่อย")
+    children_operating_budget = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="งบดำเนินการของรายการย่อย")
+    children_procurement_budget = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="งบประมาณซื้อจ้างของรายการย่อย")
+    invoiced_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="ยอดเบิกจ่ายตามใบแจ้งหนี้")
+    remaining_budget = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="งบประมาณคงเหลือ")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="วันที่แก้ไขล่าสุด")
+
+    class Meta:
+        verbose_name = 'สรุปงบประมาณ'
+        verbose_name_plural = 'สรุปงบประมาณ'
+        constraints = [
+            models.UniqueConstraint(fields=['level', 'object_id'], name='unique_budget_rollup_node'),
+        ]
+        indexes = [
+            models.Index(fields=['fiscal_year', 'level'], name='budget_rollup_year_level_idx'),
+        ]
+
     def __str__(self):
-        return self.file_name_original
\ No newline at end of file
+        return f"{self.get_level_display()} #{self.object_id}"
+
+
+class SearchDocument(models.Model):
+    # Denormalized search text of one indexed row, maintained by search.py / signals.py
+    model = models.CharField(max_length=100, verbose_name="ประเภทข้อมูล")
+    object_id = models.PositiveBigIntegerField(verbose_name="รหัสอ้างอิง")
+    body = models.TextField(blank=True, default='', verbose_name="ข้อความค้นหา")
+
+    class Meta:
+        verbose_name = 'ดัชนีค้นหา'
+        verbose_name_plural = 'ดัชนีค้นหา'
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'object_id'], name='search_document_object_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
+
+
+class ChangeLogEntryQuerySet(models.QuerySet):
+    def for_object(self, obj):
+        return self.filter(model=obj._meta.label_lower, object_id=obj.pk).order_by('-changed_at', '-id')
+
+    def by_user(self, user, since=None, until=None):
+        queryset = self.filter(user=user)
+        if since is not None:
+            queryset = queryset.filter(changed_at__gte=since)
+        if until is not None:
+            queryset = queryset.filter(changed_at__lt=until)
+        return queryset.order_by('-changed_at', '-id')
+
+
+class ChangeLogEntry(models.Model):
+    # Field-level history of the app_budget models, written in batches by changelog.py
+    ACTION_CHOICES = [
+        ('create', 'เพิ่ม'),
+        ('update', 'แก้ไข'),
+        ('delete', 'ลบ'),
+    ]
+    model = models.CharField(max_length=100, verbose_name="ประเภทข้อมูล")
+    object_id = models.PositiveBigIntegerField(verbose_name="รหัสอ้างอิง")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name="การกระทำ")
+    # {field: [old, new]}
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder, verbose_name="ข้อมูลที่เปลี่ยนแปลง")
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="+", verbose_name="ผู้แก้ไขข้อมูล")
+    changed_at = models.DateTimeField(default=timezone.now, verbose_name="วันที่แก้ไข")
+
+    objects = ChangeLogEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'ประวัติการแก้ไข'
+        verbose_name_plural = 'ประวัติการแก้ไข'
+        indexes = [
+            models.Index(fields=['model', 'object_id', 'changed_at'], name='changelog_object_idx'),
+            models.Index(fields=['user', 'changed_at'], name='changelog_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.model} #{self.object_id}"
+
+
+class FiscalYearArchive(models.Model):
+    # The Plan -> ... -> Image rows of a closed fiscal year, moved out of the hot tables by archive.py
+    budget_year = models.OneToOneField(BudgetYear, on_delete=models.CASCADE, related_name="archive", verbose_name="ปีงบประมาณ")
+    data = models.BinaryField(verbose_name="ข้อมูลที่บีบอัด")
+    row_counts = models.JSONField(default=dict, verbose_name="จำนวนรายการ")
+    blobs = models.ManyToManyField(Blob, blank=True, related_name="archives", verbose_name="ไฟล์ที่จัดเก็บ")
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="added_fiscal_year_archives", verbose_name="ผู้เพิ่มข้อมูล")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
+
+    class Meta:
+        verbose_name = 'ปีงบประมาณที่เก็บถาวร'
+        verbose_name_plural = 'ปีงบประมาณที่เก็บถาวร'
+
+    def __str__(self):
+        return str(self.budget_year)
+
+
+class ResumableUpload(models.Model):
+    # A File attachment arriving in chunks over the tus protocol (see resumable.py)
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Plain ids rather than constraints: set-based deletes and archiving remove invoices and
+    # files without knowing about uploads; resumable.py checks the invoice on completion
+    invoice = models.ForeignKey(Invoice, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", verbose_name="ใบแจ้งหนี้")
+    file = models.ForeignKey(File, null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", verbose_name="ไฟล์ที่เกี่ยวข้อง")
+    file_name_original = models.CharField(max_length=255, verbose_name="ชื่อไฟล์เดิม")
+    file_type = models.CharField(max_length=100, blank=True, verbose_name="ประเภทไฟล์")
+    length = models.PositiveBigIntegerField(verbose_name="ขนาดไฟล์")
+    offset = models.PositiveBigIntegerField(default=0, verbose_name="ได้รับแล้ว (ไบต์)")
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="+", verbose_name="ผู้เพิ่มข้อมูล")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="วันที่แก้ไขล่าสุด")
+
+    class Meta:
+        verbose_name = 'การอัปโหลดไฟล์แบบต่อเนื่อง'
+        verbose_name_plural = 'การอัปโหลดไฟล์แบบต่อเนื่อง'
+
+    def __str__(self):
+        return self.file_name_original
@@ -0,0 +1,145 @@
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Changelists for tables too big to COUNT(*) and OFFSET through on every page load:
+# counts come from the planner above ADMIN_ESTIMATED_COUNT_THRESHOLD, and pages are
+# fetched by seeking past the (created_at, id) of the neighbouring page's edge row.
+
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+CURSOR_VARS = (AFTER_VAR, BEFORE_VAR)
+
+
+def estimate_count(queryset):
+    """The planner's row estimate for `queryset`, or None where there is none."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            self.estimated = True
+            return estimate
+        return super().count
+
+
+def encode_cursor(timestamp, pk):
+    return f"{timestamp.isoformat()}_{pk}"
+
+
+def decode_cursor(value):
+    """(timestamp, pk) from encode_cursor(); ValueError if `value` is not one."""
+    timestamp, _, pk = value.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(pk)
+
+
+def seek_after(queryset, field, cursor):
+    # Rows strictly after (field, pk) in ascending order
+    timestamp, pk = cursor
+    return queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'pk__gt': pk}))
+
+
+def seek_before(queryset, field, cursor):
+    timestamp, pk = cursor
+    return queryset.filter(Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'pk__lt': pk}))
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList that pages by (created_at, id) while the default ordering is in effect."""
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for var in CURSOR_VARS:
+            lookup_params.pop(var, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Filter, search and sort links start again from the first page
+        new_params = new_params or {}
+        remove = [*(remove or []), *(var for var in CURSOR_VARS if var not in new_params)]
+        return super().get_query_string(new_params, remove)
+
+    def get_cursor(self, var):
+        try:
+            return decode_cursor(self.params[var])
+        except ValueError:
+            raise IncorrectLookupParameters(f"Invalid cursor {self.params[var]!r}")
+
+    def get_results(self, request):
+        self.keyset = ORDER_VAR not in self.params and not self.list_editable
+        if not self.keyset:
+            return super().get_results(request)
+
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.result_count_estimated = self.paginator.estimated
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = self.result_count > self.list_per_page
+
+        per_page = self.list_per_page
+        queryset = self.queryset
+        if BEFORE_VAR in self.params:
+            rows = list(seek_after(queryset, 'created_at', self.get_cursor(BEFORE_VAR)).reverse()[:per_page + 1])
+            has_previous = len(rows) > per_page
+            rows = rows[:per_page][::-1]
+            has_next = True
+        else:
+            if AFTER_VAR in self.params:
+                # Newest first, so the next page holds the older rows
+                queryset = seek_before(queryset, 'created_at', self.get_cursor(AFTER_VAR))
+            rows = list(queryset[:per_page + 1])
+            has_next = len(rows) > per_page
+            rows = rows[:per_page]
+            has_previous = AFTER_VAR in self.params
+
+        self.result_list = rows
+        self.first_page_url = self.get_query_string() if has_previous else None
+        self.previous_page_url = self.get_query_string({BEFORE_VAR: encode_cursor(rows[0].created_at, rows[0].pk)}) if has_previous and rows else None
+        self.next_page_url = self.get_query_string({AFTER_VAR: encode_cursor(rows[-1].created_at, rows[-1].pk)}) if has_next and rows else None
+
+
+class KeysetPaginationMixin:
+    """Estimated counts and keyset pages for a changelist ordered newest first."""
+
+    ordering = ('-created_at', '-id')
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    change_list_template = 'admin/app_budget/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def changelist_view(self, request, extra_context=None):
+        # The keyset template only replaces the pagination block of whatever template
+        # the next class in the MRO (e.g. StreamingExportMixin) would have used
+        parent = 'admin/change_list.html'
+        for cls in type(self).__mro__[type(self).__mro__.index(KeysetPaginationMixin) + 1:]:
+            if cls.__dict__.get('change_list_template'):
+                parent = cls.__dict__['change_list_template']
+                break
+        extra_context = {'keyset_parent_template': parent, **(extra_context or {})}
+        return super().changelist_view(request, extra_context)
@@ -0,0 +1,134 @@
+from decimal import Decimal
+
+from django.db.models import Count, F, Max, Sum
+
+from . import archive
+from .caching import cached, model_versions
+from .models import BudgetRollup, Category, MonthlyPlan, TypeInvoice, FiscalYearArchive
+
+ZERO = Decimal('0')
+
+
+ROLLUP_TOTAL_FIELDS = (
+    'allocated_budget', 'operating_budget', 'procurement_budget', 'children_allocated_budget',
+    'invoiced_amount', 'remaining_budget',
+)
+
+
+def rollup_totals(row):
+    if row is None:
+        return None
+    return {name: getattr(row, name) for name in ROLLUP_TOTAL_FIELDS}
+
+
+def year_totals(budget_year_id):
+    def compute():
+        row = BudgetRollup.objects.filter(level='budget_year', object_id=budget_year_id).first()
+        return rollup_totals(row)
+    return cached(f"year_totals:{budget_year_id}", [BudgetRollup], compute)
+
+
+def project_spend(project_id):
+    def compute():
+        totals = rollup_totals(BudgetRollup.objects.filter(level='project', object_id=project_id).first()) or {}
+        monthly = MonthlyPlan.objects.filter(budget_item__project_id=project_id).aggregate(
+            planned=Sum('planned_amount'), actual=Sum('actual_amount'),
+        )
+        totals['planned_amount'] = monthly['planned'] or ZERO
+        totals['actual_amount'] = monthly['actual'] or ZERO
+        return totals
+    return cached(f"project_spend:{project_id}", [BudgetRollup, MonthlyPlan], compute)
+
+
+def category_choices():
+    return cached(
+        "category_choices", [Category],
+        lambda: list(Category.objects.order_by('category_name').values_list('pk', 'category_name')),
+    )
+
+
+def invoice_type_choices():
+    return cached(
+        "invoice_type_choices", [TypeInvoice],
+        lambda: list(TypeInvoice.objects.order_by('invoice_type_name').values_list('pk', 'invoice_type_name')),
+    )
+
+
+# Plan vs actual: MonthlyPlan rows summed per month at one level of the
+# BudgetYear -> Plan -> Project -> BudgetItem tree, each level carrying the keys above it
+PLAN_VS_ACTUAL_LEVELS = {
+    'fiscal_year': {
+        'fiscal_year_id': 'budget_item__project__plan__fiscal_year_id',
+        'fiscal_year': 'budget_item__project__plan__fiscal_year__fiscal_year',
+    },
+    'plan': {
+        'plan_id': 'budget_item__project__plan_id',
+        'plan_name': 'budget_item__project__plan__plan_name',
+    },
+    'project': {
+        'project_id': 'budget_item__project_id',
+        'project_name': 'budget_item__project__project_name',
+    },
+    'budget_item': {
+        'budget_item_name': 'budget_item__budget_item_name',
+    },
+}
+PLAN_VS_ACTUAL_FILTERS = {
+    'fiscal_year': 'budget_item__project__plan__fiscal_year_id',
+    'plan': 'budget_item__project__plan_id',
+    'project': 'budget_item__project_id',
+    'budget_item': 'budget_item_id',
+    'year': 'year',
+}
+
+
+def monthly_plans(filters):
+    return MonthlyPlan.objects.filter(**{PLAN_VS_ACTUAL_FILTERS[name]: value for name, value in filters.items()})
+
+
+def plan_vs_actual(level, filters):
+    columns = {}
+    for name, fields in PLAN_VS_ACTUAL_LEVELS.items():
+        columns.update(fields)
+        if name == level:
+            break
+    keys = [name for name in columns if name.endswith('_id')]
+    if level == 'budget_item':
+        keys.append('budget_item_id')
+    # values() before annotate() makes the database GROUP BY the level's keys and the month
+    rows = (
+        monthly_plans(filters)
+        .values(*(['budget_item_id'] if level == 'budget_item' else []), 'year', 'month',
+                **{name: F(path) for name, path in columns.items()})
+        .annotate(planned=Sum('planned_amount'), actual=Sum('actual_amount'))
+        .order_by(*keys, 'year', 'month')
+    )
+    archived = archive.monthly_plans(filters)
+    if not archived:
+        return rows
+
+    # Archived years are whole fiscal years, so their groups never overlap the database's
+    names = [*(['budget_item_id'] if level == 'budget_item' else []), 'year', 'month', *columns]
+    groups = {}
+    for row in archived:
+        key = tuple(row[name] for name in names)
+        if key not in groups:
+            groups[key] = {**{name: row[name] for name in names}, 'planned': ZERO, 'actual': ZERO}
+        groups[key]['planned'] += row['planned_amount']
+        groups[key]['actual'] += row['actual_amount']
+    return sorted([*rows, *groups.values()], key=lambda row: tuple(row[name] for name in [*keys, 'year', 'month']))
+
+
+def plan_vs_actual_freshness(filters):
+    # Row count plus the newest updated_at along the whole chain, so edits, renames and deletes all show up;
+    # archiving or restoring a year bumps the archive version
+    stamps = monthly_plans(filters).aggregate(
+        count=Count('pk'),
+        monthly_plan_updated_at=Max('updated_at'),
+        budget_item_updated_at=Max('budget_item__updated_at'),
+        project_updated_at=Max('budget_item__project__updated_at'),
+        plan_updated_at=Max('budget_item__project__plan__updated_at'),
+        fiscal_year_updated_at=Max('budget_item__project__plan__fiscal_year__updated_at'),
+    )
+    stamps['archive_version'], = model_versions(FiscalYearArchive)
+    return stamps
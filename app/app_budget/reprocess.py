@@ -0,0 +1,191 @@
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.crypto import get_random_string
+
+from .caching import bump_versions
+from .models import Blob, Image, blob_derivative_upload_to
+
+logger = logging.getLogger(__name__)
+
+# Re-deriving the WebP of images that are already processed, e.g. after a change of
+# IMAGE_WEBP_QUALITY or IMAGE_MAX_DIMENSION (see manage.py reprocess_images).
+#
+# Blob-backed images share one derivative per blob, so those are re-encoded per Blob and
+# every image of the blob follows; uploads from before Blob existed are re-encoded one by
+# one. Both are walked in primary key order, a batch at a time: the pool workers decode,
+# encode and write the new files, and the parent points the rows at them in one UPDATE per
+# derivative. The new file always gets a new name, and one that media.CONTENT_NAMED does
+# not match, as browsers may cache a content-named URL as immutable; the old files are
+# deleted once the batch has committed.
+#
+# After each batch the position is written to a checkpoint file, so an interrupted run
+# picks up after the last committed batch.
+
+PHASES = ('blobs', 'images')
+# Settings that change the output; a checkpoint only resumes a run made with the same ones
+ENCODER_SETTINGS = ('IMAGE_MAX_DIMENSION', 'IMAGE_MAX_PIXELS', 'IMAGE_WEBP_QUALITY')
+
+
+class CheckpointMismatch(Exception):
+    pass
+
+
+def filtered_images(filters):
+    """Processed images matching {'invoices', 'fiscal_years', 'since', 'until'}; empty values are ignored."""
+    images = Image.objects.filter(processing_status='done')
+    if filters.get('invoices'):
+        images = images.filter(invoice_id__in=filters['invoices'])
+    if filters.get('fiscal_years'):
+        images = images.filter(invoice__fiscal_year_id__in=filters['fiscal_years'])
+    if filters.get('since'):
+        images = images.filter(created_at__date__gte=filters['since'])
+    if filters.get('until'):
+        images = images.filter(created_at__date__lte=filters['until'])
+    return images
+
+
+def jobs(phase, filters, after, batch_size):
+    """The next batch of pool jobs after primary key `after`, as dicts."""
+    images = filtered_images(filters)
+    if phase == 'blobs':
+        # Every image of a blob follows its derivative, including ones outside the filters
+        rows = (Blob.objects.filter(pk__gt=after, pk__in=images.values('blob_id')).exclude(derivative='')
+                .order_by('pk').values_list('pk', 'sha256', 'file', 'derivative')[:batch_size])
+        return [{'pk': pk, 'sha256': sha256, 'original': original, 'old': old} for pk, sha256, original, old in rows]
+    rows = (images.filter(pk__gt=after, blob__isnull=True).exclude(file='')
+            .order_by('pk').values_list('pk', 'file_original', 'file')[:batch_size])
+    return [{'pk': pk, 'sha256': None, 'original': original, 'old': old} for pk, original, old in rows]
+
+
+def reencode(job):
+    """Pool worker: write a new derivative of job['original'] and return its name and sizes.
+
+    Runs without the database; errors come back as a string rather than raising.
+    """
+    try:
+        image = Image(file_original=job['original'])
+        stats = image.process_image()
+        content = image.file.file
+        try:
+            if job['sha256']:
+                root, extension = os.path.splitext(blob_derivative_upload_to(Blob(sha256=job['sha256']), content.name))
+                # Never the plain content-named path: browsers may hold the old bytes under it as immutable
+                name = default_storage.save(f"{root}_{get_random_string(7)}{extension}", content)
+            else:
+                name = default_storage.save(Image._meta.get_field('file').generate_filename(image, content.name), content)
+        finally:
+            content.close()
+            image.file_original.close()
+        try:
+            old_bytes = default_storage.size(job['old'])
+        except OSError:
+            old_bytes = 0
+        return {**job, 'name': name, 'old_bytes': old_bytes, 'new_bytes': stats['output_bytes'], 'error': None}
+    except Exception as error:
+        return {**job, 'name': None, 'error': f"{type(error).__name__}: {error}"}
+
+
+def apply_results(phase, results):
+    """Point the rows at the new derivatives; returns (Image rows updated, results applied)."""
+    written = [result for result in results if not result['error']]
+    applied, stale = [], []
+    try:
+        with transaction.atomic():
+            images = 0
+            for result in written:
+                if phase == 'blobs':
+                    moved = Blob.objects.filter(pk=result['pk'], derivative=result['old']).update(derivative=result['name'])
+                    if moved:
+                        images += Image.objects.filter(blob_id=result['pk'], file=result['old']).update(file=result['name'])
+                else:
+                    moved = Image.objects.filter(pk=result['pk'], file=result['old']).update(file=result['name'])
+                    images += moved
+                (applied if moved else stale).append(result)
+    except Exception:
+        delete_files([result['name'] for result in written])
+        raise
+    # Rows changed since the batch was read keep their file; the one made for them goes
+    obsolete = [result['old'] for result in applied] + [result['name'] for result in stale]
+    transaction.on_commit(lambda: delete_files(obsolete))
+    if applied:
+        transaction.on_commit(lambda: bump_versions(Blob, Image))
+    return images, applied
+
+
+def delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.exception("Could not delete %s", name)
+
+
+class Checkpoint:
+    """The JSON file recording how far a run with these filters and encoder settings got."""
+
+    def __init__(self, path, filters):
+        self.path = path
+        self.key = {
+            # Round-tripped, so it compares equal to the key read back from the file
+            'filters': json.loads(json.dumps(filters, cls=DjangoJSONEncoder)),
+            'settings': {name: getattr(settings, name) for name in ENCODER_SETTINGS},
+        }
+        self.state = {'phase': PHASES[0], 'after': 0, 'images': 0, 'derivatives': 0, 'failed': 0, 'bytes_saved': 0}
+
+    def load(self):
+        """Take over the saved position; False when there is no checkpoint."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with open(self.path) as file:
+            saved = json.load(file)
+        if saved['key'] != self.key:
+            raise CheckpointMismatch(f"{self.path} was written with other filters or encoder settings")
+        self.state = saved['state']
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        # Write-then-rename, so a crash never leaves half a checkpoint behind
+        with open(f"{self.path}.tmp", 'w') as file:
+            json.dump({'key': self.key, 'state': self.state}, file)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run(checkpoint, filters, workers, batch_size):
+    """Re-derive every matching image, yielding checkpoint.state after each batch."""
+    state = checkpoint.state
+    # fork, so the workers share the parent's settings (including overridden ones)
+    # and never open a database connection of their own
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        for phase in PHASES[PHASES.index(state['phase']):]:
+            if state['phase'] != phase:
+                state.update(phase=phase, after=0)
+            while True:
+                batch = jobs(phase, filters, state['after'], batch_size)
+                if not batch:
+                    break
+                results = list(pool.map(reencode, batch))
+                images, applied = apply_results(phase, results)
+                state['images'] += images
+                state['derivatives'] += len(applied)
+                state['bytes_saved'] += sum(result['old_bytes'] - result['new_bytes'] for result in applied)
+                for result in results:
+                    if result['error']:
+                        logger.warning("Could not re-encode %s %s: %s", phase, result['pk'], result['error'])
+                        state['failed'] += 1
+                state['after'] = batch[-1]['pk']
+                checkpoint.save()
+                yield state
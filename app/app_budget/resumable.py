@@ -0,0 +1,320 @@
+import base64
+import binascii
+import hashlib
+import mimetypes
+import os
+from collections import OrderedDict
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.http import HttpResponse, UnreadablePostError
+from django.utils import timezone
+from django.utils.http import http_date
+
+from .media import PARTIAL_UPLOADS
+from .models import Blob, File, Invoice, ResumableUpload
+
+# Resumable File uploads over tus 1.0.0 (https://tus.io/protocols/resumable-upload),
+# with the creation, termination and expiration extensions:
+#
+#   POST   /api/uploads/       Upload-Length, Upload-Metadata (filename, filetype, invoice)
+#   HEAD   /api/uploads/<id>/  -> Upload-Offset: how much has arrived
+#   PATCH  /api/uploads/<id>/  Upload-Offset + bytes from there on
+#   DELETE /api/uploads/<id>/  abandon it
+#
+# PATCH bodies are streamed from the socket into a part file under MEDIA_ROOT a chunk at a
+# time, so a worker holds one chunk however large the file is. The SHA-256, size and type
+# are worked out as the bytes arrive; when the last byte is in, the part file is copied into
+# the Blob store (unless the content is there already) and the File row is created in the
+# same transaction that records the upload as complete. The part file is only removed once
+# that transaction commits, so a failure leaves the upload resumable.
+#
+# hashlib objects cannot be stored, so the running SHA-256 lives in the worker that received
+# the previous chunk. A PATCH landing on another worker, or resuming after a restart, first
+# re-reads the bytes already received (still one chunk at a time).
+
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,termination,expiration'
+CHUNK_SIZE = 64 * 1024
+HASHERS_KEPT = 32
+# Leading bytes of the types invoices are usually backed by; anything else keeps the client's type
+# (see resolve_content_type)
+SIGNATURES = (
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'PK\x03\x04', 'application/zip'),
+)
+SNIFF_BYTES = 16
+# Formats stored in a sniffed container; a client type starting with one of these is more
+# specific than the sniffed one and is kept
+CONTAINER_TYPES = {
+    'application/zip': (
+        'application/vnd.openxmlformats-officedocument.', 'application/vnd.oasis.opendocument.',
+        'application/vnd.ms-excel.', 'application/vnd.ms-word.', 'application/vnd.ms-powerpoint.',
+        'application/epub+zip', 'application/java-archive', 'application/x-zip-compressed',
+    ),
+}
+
+_hashers = OrderedDict()
+
+
+class UploadError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+
+    def response(self):
+        response = tus_response(self.status, content=str(self))
+        response['Content-Type'] = 'text/plain; charset=utf-8'
+        return response
+
+
+def tus_response(status=204, content=b'', **headers):
+    response = HttpResponse(content, status=status)
+    response['Tus-Resumable'] = TUS_VERSION
+    # Offsets change with every PATCH
+    response['Cache-Control'] = 'no-store'
+    for name, value in headers.items():
+        response[name.replace('_', '-')] = value
+    return response
+
+
+def capabilities():
+    return tus_response(
+        Tus_Version=TUS_VERSION, Tus_Extension=TUS_EXTENSIONS, Tus_Max_Size=settings.RESUMABLE_UPLOAD_MAX_SIZE,
+    )
+
+
+def tus_protocol(view):
+    """Refuse requests for another protocol version and turn UploadErrors into responses."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.headers.get('Tus-Resumable') != TUS_VERSION:
+            return tus_response(412, Tus_Version=TUS_VERSION)
+        try:
+            return view(request, *args, **kwargs)
+        except UploadError as error:
+            return error.response()
+    return wrapper
+
+
+def parse_metadata(header):
+    """{key: str} from an Upload-Metadata header ("key base64value,key2,...")."""
+    metadata = {}
+    for pair in filter(None, (part.strip() for part in header.split(','))):
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode() if value else ''
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(400, f"Upload-Metadata {key} is not base64-encoded UTF-8")
+    return metadata
+
+
+def header_int(request, name):
+    try:
+        value = int(request.headers[name])
+    except (KeyError, ValueError):
+        raise UploadError(400, f"{name} must be a non-negative integer")
+    if value < 0:
+        raise UploadError(400, f"{name} must be a non-negative integer")
+    return value
+
+
+def part_path(upload):
+    return os.path.join(settings.MEDIA_ROOT, PARTIAL_UPLOADS, f"{upload.pk}.part")
+
+
+def expires_at(upload):
+    return upload.updated_at + timedelta(hours=settings.RESUMABLE_UPLOAD_EXPIRY_HOURS)
+
+
+def progress_headers(upload):
+    headers = {'Upload-Offset': upload.offset, 'Upload-Length': upload.length}
+    if upload.file_id is None:
+        headers['Upload-Expires'] = http_date(expires_at(upload).timestamp())
+    return headers
+
+
+def sniff_content_type(head):
+    return next((content_type for signature, content_type in SIGNATURES if head.startswith(signature)), None)
+
+
+def resolve_content_type(claimed, sniffed):
+    """The client's type unless it is missing, generic or contradicted by the sniffed one."""
+    if sniffed is None or claimed == sniffed or claimed.startswith(CONTAINER_TYPES.get(sniffed, ())):
+        return claimed
+    return sniffed
+
+
+def create(request, user):
+    """Start an upload from a creation request; the caller has checked the permission."""
+    length = header_int(request, 'Upload-Length')
+    if length > settings.RESUMABLE_UPLOAD_MAX_SIZE:
+        raise UploadError(413, f"Upload-Length exceeds {settings.RESUMABLE_UPLOAD_MAX_SIZE}")
+    metadata = parse_metadata(request.headers.get('Upload-Metadata', ''))
+    try:
+        invoice = Invoice.objects.get(pk=int(metadata.get('invoice', '')))
+    except (ValueError, Invoice.DoesNotExist):
+        raise UploadError(400, "Upload-Metadata invoice must be the id of an existing invoice")
+    filename = os.path.basename(metadata.get('filename', '')) or 'upload'
+    file_type = metadata.get('filetype') or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    upload = ResumableUpload.objects.create(
+        invoice=invoice, file_name_original=filename[-255:], file_type=file_type[:100], length=length, created_by=user,
+    )
+    os.makedirs(os.path.dirname(part_path(upload)), exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    if length == 0:
+        with transaction.atomic():
+            finish(upload, hashlib.sha256())
+    return upload
+
+
+def find(upload_id, user, lock=False):
+    uploads = ResumableUpload.objects.filter(pk=upload_id, created_by=user)
+    if lock:
+        try:
+            # Without waiting: a second PATCH to the same upload is a client error, not a queue
+            upload = uploads.select_for_update(nowait=True).first()
+        except DatabaseError:
+            raise UploadError(423, "Another request is writing to this upload")
+    else:
+        upload = uploads.first()
+    if upload is None:
+        raise UploadError(404, "No such upload")
+    if upload.file_id is None and expires_at(upload) < timezone.now():
+        raise UploadError(410, "The upload has expired")
+    return upload
+
+
+def running_hash(upload):
+    """SHA-256 of the upload's first `offset` bytes, carried on from the last PATCH if this worker had it."""
+    kept = _hashers.pop(upload.pk, None)
+    if kept is not None and kept[0] == upload.offset:
+        return kept[1]
+    hasher = hashlib.sha256()
+    remaining = upload.offset
+    try:
+        with open(part_path(upload), 'rb') as part:
+            while remaining:
+                chunk = part.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                remaining -= len(chunk)
+    except FileNotFoundError:
+        pass
+    if remaining:
+        raise UploadError(409, "Received bytes are missing; start a new upload")
+    return hasher
+
+
+def keep_hash(upload, hasher):
+    _hashers[upload.pk] = (upload.offset, hasher)
+    while len(_hashers) > HASHERS_KEPT:
+        _hashers.popitem(last=False)
+
+
+@transaction.atomic
+def append(request, upload_id, user):
+    """Write a PATCH body at the upload's offset; returns the upload with its new offset."""
+    if request.content_type != 'application/offset+octet-stream':
+        raise UploadError(415, "Content-Type must be application/offset+octet-stream")
+    offset = header_int(request, 'Upload-Offset')
+    # The row stays locked while the body streams in
+    upload = find(upload_id, user, lock=True)
+    if offset != upload.offset:
+        raise UploadError(409, f"Upload-Offset must be {upload.offset}")
+    if upload.file_id is not None:
+        return upload
+    if not request.META.get('CONTENT_LENGTH'):
+        raise UploadError(411, "Content-Length is required")
+    size = header_int(request, 'Content-Length')
+    if offset + size > upload.length:
+        raise UploadError(400, "The body runs past Upload-Length")
+
+    hasher = running_hash(upload)
+    received = 0
+    with open(part_path(upload), 'r+b') as part:
+        # Bytes past the offset are from a request that never got to record them
+        part.truncate(offset)
+        part.seek(offset)
+        while received < size:
+            try:
+                chunk = request.read(min(CHUNK_SIZE, size - received))
+            except UnreadablePostError:
+                # The client went away; keep what arrived so it can resume from there
+                break
+            if not chunk:
+                break
+            part.write(chunk)
+            hasher.update(chunk)
+            received += len(chunk)
+        part.flush()
+        os.fsync(part.fileno())
+
+    if offset < SNIFF_BYTES and (offset + received >= SNIFF_BYTES or offset + received == upload.length):
+        with open(part_path(upload), 'rb') as part:
+            upload.file_type = resolve_content_type(upload.file_type, sniff_content_type(part.read(SNIFF_BYTES)))
+    upload.offset = offset + received
+    upload.save(update_fields=['offset', 'file_type', 'updated_at'])
+    if upload.offset == upload.length:
+        finish(upload, hasher)
+    else:
+        keep_hash(upload, hasher)
+    return upload
+
+
+def finish(upload, hasher):
+    # Called inside the transaction that holds the upload's row; an upload for a deleted
+    # invoice is left for remove_expired()
+    if not Invoice.objects.filter(pk=upload.invoice_id).exists():
+        raise UploadError(410, "The invoice has been deleted")
+    blob = Blob.objects.adopt(part_path(upload), hasher.hexdigest(), upload.file_name_original, upload.file_type)
+    upload.file = File.objects.create(
+        invoice_id=upload.invoice_id,
+        file=blob.file.name,
+        blob=blob,
+        file_name_original=upload.file_name_original,
+        file_type=upload.file_type,
+        file_size=upload.length,
+        created_by=upload.created_by,
+    )
+    upload.save(update_fields=['file', 'updated_at'])
+
+
+def remove_part(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def terminate(upload):
+    _hashers.pop(upload.pk, None)
+    if upload.file_id is None:
+        path = part_path(upload)
+        transaction.on_commit(lambda: remove_part(path))
+    upload.delete()
+
+
+def expired():
+    """Uploads idle for longer than RESUMABLE_UPLOAD_EXPIRY_HOURS; finished ones are only bookkeeping by then."""
+    return ResumableUpload.objects.filter(
+        updated_at__lt=timezone.now() - timedelta(hours=settings.RESUMABLE_UPLOAD_EXPIRY_HOURS),
+    )
+
+
+def remove_expired():
+    count = 0
+    for upload in expired().iterator():
+        with transaction.atomic():
+            terminate(upload)
+        count += 1
+    return count
@@ -0,0 +1,235 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .caching import bump_versions
+from .models import BudgetYear, Plan, Project, BudgetItem, Invoice, BudgetRollup
+
+ZERO = Decimal('0')
+
+LEVEL_MODELS = {
+    'budget_year': BudgetYear,
+    'plan': Plan,
+    'project': Project,
+    'budget_item': BudgetItem,
+}
+MODEL_LEVELS = {model: level for level, model in LEVEL_MODELS.items()}
+
+BUDGET_FIELDS = ('allocated_budget', 'operating_budget', 'procurement_budget')
+
+
+def parent_key(level, obj):
+    # The node above `obj` in the BudgetYear -> Plan -> Project -> BudgetItem tree
+    if level == 'plan':
+        return ('budget_year', obj.fiscal_year_id)
+    if level == 'project':
+        return ('plan', obj.plan_id)
+    if level == 'budget_item':
+        if obj.main_budget_item_id and obj.main_budget_item_id != obj.pk:
+            return ('budget_item', obj.main_budget_item_id)
+        return ('project', obj.project_id)
+    return None
+
+
+def direct_invoiced(level, object_id):
+    # Invoices hang off a budget item, or straight off the fiscal year when no item is set
+    if level == 'budget_item':
+        invoices = Invoice.objects.filter(budget_item_id=object_id)
+    elif level == 'budget_year':
+        invoices = Invoice.objects.filter(fiscal_year_id=object_id, budget_item__isnull=True)
+    else:
+        return ZERO
+    return Decimal(invoices.aggregate(total=Sum('total_amount_due'))['total'] or 0)
+
+
+def recompute(row):
+    totals = {}
+    if row.pk:
+        totals = BudgetRollup.objects.filter(parent_id=row.pk).aggregate(
+            allocated=Sum('allocated_budget'),
+            operating=Sum('operating_budget'),
+            procurement=Sum('procurement_budget'),
+            invoiced=Sum('invoiced_amount'),
+        )
+    row.children_allocated_budget = totals.get('allocated') or ZERO
+    row.children_operating_budget = totals.get('operating') or ZERO
+    row.children_procurement_budget = totals.get('procurement') or ZERO
+    row.invoiced_amount = (totals.get('invoiced') or ZERO) + direct_invoiced(row.level, row.object_id)
+    row.remaining_budget = row.allocated_budget - row.invoiced_amount
+    row.save()
+    return row
+
+
+def propagate(parent_id):
+    # Walk up from `parent_id` re-summing each ancestor from its direct children
+    while parent_id:
+        row = BudgetRollup.objects.filter(pk=parent_id).first()
+        if row is None:
+            return
+        recompute(row)
+        parent_id = row.parent_id
+
+
+def get_row(level, object_id):
+    row = BudgetRollup.objects.filter(level=level, object_id=object_id).first()
+    if row is None:
+        row = refresh_node(level, object_id)
+    return row
+
+
+def _move_descendants(row):
+    frontier = [row.pk]
+    while frontier:
+        BudgetRollup.objects.filter(parent_id__in=frontier).update(fiscal_year_id=row.fiscal_year_id)
+        frontier = list(BudgetRollup.objects.filter(parent_id__in=frontier).values_list('pk', flat=True))
+
+
+@transaction.atomic
+def refresh_node(level, object_id):
+    # One version bump for the whole walk; rollup rows are not versioned per save
+    transaction.on_commit(lambda: bump_versions(BudgetRollup))
+    obj = LEVEL_MODELS[level].objects.filter(pk=object_id).first()
+    row = BudgetRollup.objects.filter(level=level, object_id=object_id).first()
+    old_parent_id = row.parent_id if row else None
+    old_fiscal_year_id = row.fiscal_year_id if row else None
+
+    if obj is None:
+        # The node is gone; drop its row and re-sum whatever it used to hang off
+        if row is not None:
+            row.delete()
+        propagate(old_parent_id)
+        return None
+
+    parent_row = None
+    key = parent_key(level, obj)
+    if key and key[1]:
+        parent_row = get_row(*key)
+
+    if row is None:
+        row = BudgetRollup(level=level, object_id=object_id)
+    row.parent = parent_row
+    if level == 'budget_year':
+        row.fiscal_year_id = obj.pk
+    else:
+        row.fiscal_year_id = parent_row.fiscal_year_id if parent_row else None
+    for field in BUDGET_FIELDS:
+        setattr(row, field, getattr(obj, field))
+    recompute(row)
+
+    if old_fiscal_year_id and old_fiscal_year_id != row.fiscal_year_id:
+        _move_descendants(row)
+    if old_parent_id and old_parent_id != row.parent_id:
+        propagate(old_parent_id)
+    propagate(row.parent_id)
+    return row
+
+
+@transaction.atomic
+def refresh_invoiced(budget_item_id, fiscal_year_id):
+    transaction.on_commit(lambda: bump_versions(BudgetRollup))
+    if budget_item_id:
+        row = get_row('budget_item', budget_item_id)
+    elif fiscal_year_id:
+        row = get_row('budget_year', fiscal_year_id)
+    else:
+        return
+    if row is not None:
+        recompute(row)
+        propagate(row.parent_id)
+
+
+def year_summary(budget_year):
+    # Every node of one fiscal year in a single read over (fiscal_year, level)
+    return BudgetRollup.objects.filter(fiscal_year=budget_year)
+
+
+@transaction.atomic
+def rebuild(fiscal_years=None):
+    """Recompute the rollup for whole fiscal years in a handful of queries."""
+    # An archived year's rollup is kept as it was; its tree is no longer in the tables
+    years = BudgetYear.objects.filter(archive__isnull=True)
+    if fiscal_years is not None:
+        years = years.filter(pk__in=[getattr(year, 'pk', year) for year in fiscal_years])
+    years = list(years.values('pk', *BUDGET_FIELDS))
+    year_ids = [year['pk'] for year in years]
+    BudgetRollup.objects.filter(fiscal_year_id__in=year_ids).delete()
+
+    plans = Plan.objects.filter(fiscal_year_id__in=year_ids).values('pk', 'fiscal_year_id', *BUDGET_FIELDS)
+    projects = Project.objects.filter(plan__fiscal_year_id__in=year_ids).values('pk', 'plan_id', *BUDGET_FIELDS)
+    items = BudgetItem.objects.filter(project__plan__fiscal_year_id__in=year_ids).values(
+        'pk', 'project_id', 'main_budget_item_id', *BUDGET_FIELDS
+    )
+
+    nodes = {}
+    parents = {}
+    for year in years:
+        nodes[('budget_year', year['pk'])] = year
+    for plan in plans:
+        nodes[('plan', plan['pk'])] = plan
+        parents[('plan', plan['pk'])] = ('budget_year', plan['fiscal_year_id'])
+    for project in projects:
+        nodes[('project', project['pk'])] = project
+        parents[('project', project['pk'])] = ('plan', project['plan_id'])
+    items = list(items)
+    item_ids = {item['pk'] for item in items}
+    for item in items:
+        nodes[('budget_item', item['pk'])] = item
+        main_id = item['main_budget_item_id']
+        if main_id in item_ids and main_id != item['pk']:
+            parents[('budget_item', item['pk'])] = ('budget_item', main_id)
+        else:
+            parents[('budget_item', item['pk'])] = ('project', item['project_id'])
+
+    invoiced = {}
+    for entry in Invoice.objects.filter(budget_item_id__in=item_ids).values('budget_item_id').annotate(total=Sum('total_amount_due')):
+        invoiced[('budget_item', entry['budget_item_id'])] = Decimal(entry['total'] or 0)
+    for entry in (Invoice.objects.filter(fiscal_year_id__in=year_ids, budget_item__isnull=True)
+                  .values('fiscal_year_id').annotate(total=Sum('total_amount_due'))):
+        invoiced[('budget_year', entry['fiscal_year_id'])] = Decimal(entry['total'] or 0)
+
+    children = {key: [] for key in nodes}
+    for key, parent in parents.items():
+        if parent in children:
+            children[parent].append(key)
+        else:
+            parents[key] = None
+
+    # Order nodes root-first so parents can be inserted (and summed) before/after their children
+    ordered = []
+    frontier = [key for key in nodes if parents.get(key) is None]
+    while frontier:
+        ordered.extend(frontier)
+        frontier = [child for key in frontier for child in children[key]]
+
+    rows = {}
+    for key in reversed(ordered):
+        values = nodes[key]
+        row = BudgetRollup(level=key[0], object_id=key[1])
+        for field in BUDGET_FIELDS:
+            setattr(row, field, values[field])
+        kids = [rows[child] for child in children[key]]
+        row.children_allocated_budget = sum((kid.allocated_budget for kid in kids), ZERO)
+        row.children_operating_budget = sum((kid.operating_budget for kid in kids), ZERO)
+        row.children_procurement_budget = sum((kid.procurement_budget for kid in kids), ZERO)
+        row.invoiced_amount = sum((kid.invoiced_amount for kid in kids), invoiced.get(key, ZERO))
+        row.remaining_budget = row.allocated_budget - row.invoiced_amount
+        rows[key] = row
+
+    # Insert one depth at a time so every parent has a primary key before its children
+    depth = [key for key in ordered if parents.get(key) is None]
+    while depth:
+        batch = []
+        for key in depth:
+            row = rows[key]
+            parent = parents.get(key)
+            if parent is not None:
+                row.parent = rows[parent]
+                row.fiscal_year_id = rows[parent].fiscal_year_id
+            elif key[0] == 'budget_year':
+                row.fiscal_year_id = key[1]
+            batch.append(row)
+        BudgetRollup.objects.bulk_create(batch, batch_size=500)
+        depth = [child for key in depth for child in children[key]]
+    transaction.on_commit(lambda: bump_versions(BudgetRollup))
+    return len(rows)
@@ -0,0 +1,147 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from django.utils.text import smart_split, unescape_string_literal
+
+from .models import Plan, Project, BudgetItem, MonthlyPlan, Invoice, SearchDocument
+
+# Admin search over a denormalized SearchDocument per row: the row's own text columns and
+# the names it is joined to, casefolded into one `body`. Matching is a substring test per
+# search word, which suits Thai (no spaces between words) better than word-based FTS.
+# Migration 0008 indexes `body` with pg_trgm on PostgreSQL and an FTS5 trigram table on
+# SQLite; the backend that uses it is picked by SEARCH_BACKEND or the database vendor.
+
+SEARCH_INDEX = {
+    Plan: ('plan_name', 'plan_code', 'fiscal_year__fiscal_year'),
+    Project: ('project_name', 'project_code', 'plan__plan_name'),
+    BudgetItem: ('budget_item_name', 'sort_number', 'project__project_name'),
+    MonthlyPlan: ('budget_item__budget_item_name',),
+    Invoice: ('invoice_number', 'fiscal_year__fiscal_year', 'contractor_name', 'approver_name', 'budget_item__budget_item_name'),
+}
+# How each indexed model reaches its fiscal year, for reindexing whole years at once
+FISCAL_YEAR_LOOKUPS = {
+    Plan: 'fiscal_year_id',
+    Project: 'plan__fiscal_year_id',
+    BudgetItem: 'project__plan__fiscal_year_id',
+    MonthlyPlan: 'budget_item__project__plan__fiscal_year_id',
+    Invoice: 'fiscal_year_id',
+}
+BATCH_SIZE = 2000
+
+
+def document_label(model):
+    return model._meta.label_lower
+
+
+def embedded_models():
+    # Models whose text is copied into other models' documents, e.g. BudgetYear.fiscal_year
+    return {
+        model._meta.get_field(lookup.split('__', 1)[0]).related_model
+        for model, lookups in SEARCH_INDEX.items() for lookup in lookups if '__' in lookup
+    }
+
+
+def dependents(related_model):
+    # (indexed model, FK name, joined field) for every lookup that reads from `related_model`
+    for model, lookups in SEARCH_INDEX.items():
+        for lookup in lookups:
+            if '__' not in lookup:
+                continue
+            name, field = lookup.split('__', 1)
+            if model._meta.get_field(name).related_model is related_model:
+                yield model, name, field
+
+
+def search_terms(search_term):
+    # The same word splitting as ModelAdmin.get_search_results, "quoted phrases" included
+    terms = []
+    for bit in smart_split(search_term):
+        if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+            bit = unescape_string_literal(bit)
+        if bit:
+            terms.append(bit.casefold())
+    return terms
+
+
+def reindex(model, queryset=None):
+    """(Re)build the documents of `queryset` (default: every row of `model`)."""
+    if queryset is None:
+        queryset = model._default_manager.all()
+    label = document_label(model)
+    batch = []
+    count = 0
+    for pk, *values in queryset.order_by().values_list('pk', *SEARCH_INDEX[model]).iterator(chunk_size=BATCH_SIZE):
+        body = '\n'.join(str(value) for value in values if value not in (None, '')).casefold()
+        batch.append(SearchDocument(model=label, object_id=pk, body=body))
+        if len(batch) >= BATCH_SIZE:
+            count += write(batch)
+            batch = []
+    return count + write(batch)
+
+
+def reindex_years(fiscal_year_ids):
+    for model, lookup in FISCAL_YEAR_LOOKUPS.items():
+        reindex(model, model._default_manager.filter(**{f'{lookup}__in': fiscal_year_ids}))
+
+
+def write(documents):
+    if documents:
+        SearchDocument.objects.bulk_create(
+            documents, update_conflicts=True, unique_fields=['model', 'object_id'], update_fields=['body'],
+        )
+    return len(documents)
+
+
+def remove(model, object_ids):
+    SearchDocument.objects.filter(model=document_label(model), object_id__in=object_ids).delete()
+
+
+class ContainsBackend:
+    """One `body LIKE '%word%'` per word; served by the pg_trgm GIN index on PostgreSQL."""
+
+    def filter(self, documents, terms):
+        for term in terms:
+            documents = documents.filter(body__contains=term)
+        return documents
+
+
+class SQLiteFTS5Backend(ContainsBackend):
+    """Words of three or more characters go through the FTS5 trigram table."""
+
+    table = 'app_budget_searchdocument_fts'
+
+    def filter(self, documents, terms):
+        long_terms = [term for term in terms if len(term) >= 3]
+        if long_terms:
+            query = ' AND '.join('"%s"' % term.replace('"', '""') for term in long_terms)
+            documents = documents.filter(pk__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [query]))
+        return super().filter(documents, [term for term in terms if len(term) < 3])
+
+
+BACKENDS = {
+    'postgresql': ContainsBackend,
+    'sqlite': SQLiteFTS5Backend,
+}
+
+
+def get_backend():
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    backend = import_string(path) if path else BACKENDS.get(connection.vendor, ContainsBackend)
+    return backend()
+
+
+def matching_ids(model, search_term):
+    documents = SearchDocument.objects.filter(model=document_label(model))
+    return get_backend().filter(documents, search_terms(search_term)).values('object_id')
+
+
+class FullTextSearchMixin:
+    """Admin search through the SearchDocument index instead of icontains over `search_fields`."""
+
+    def get_search_results(self, request, queryset, search_term):
+        match = getattr(request, 'resolver_match', None)
+        autocomplete = match is not None and match.url_name == 'autocomplete'
+        if autocomplete or self.model not in SEARCH_INDEX or not search_terms(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=matching_ids(self.model, search_term)), False
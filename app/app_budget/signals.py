@@ -0,0 +1,128 @@
+from django.apps import apps
+from django.db import transaction
+from django.contrib.auth.models import User
+from django.db.models.signals import post_init, pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import changelog, rollup, search
+from .caching import bump_versions, bump_row_versions, versioned_models
+from .models import BudgetYear, Plan, Project, BudgetItem, Invoice
+
+
+@receiver(post_save, sender=BudgetYear)
+@receiver(post_save, sender=Plan)
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=BudgetItem)
+@receiver(post_delete, sender=BudgetYear)
+@receiver(post_delete, sender=Plan)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=BudgetItem)
+def refresh_budget_rollup(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    rollup.refresh_node(rollup.MODEL_LEVELS[sender], instance.pk)
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_invoice_rollup_target(sender, instance, raw=False, **kwargs):
+    # Keep the old target so moving an invoice also re-sums the node it left
+    instance._rollup_previous = None
+    if raw or not instance.pk:
+        return
+    instance._rollup_previous = Invoice.objects.filter(pk=instance.pk).values_list('budget_item_id', 'fiscal_year_id').first()
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def refresh_invoice_rollup(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    current = (instance.budget_item_id, instance.fiscal_year_id)
+    if previous and previous != current:
+        rollup.refresh_invoiced(*previous)
+    rollup.refresh_invoiced(*current)
+
+
+def update_search_documents(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if sender in search.SEARCH_INDEX:
+        search.reindex(sender, sender._default_manager.filter(pk=instance.pk))
+    # Rows that embed this one's text, e.g. the invoices of a renamed budget item
+    for model, name, field in search.dependents(sender):
+        if update_fields is None or field in update_fields:
+            search.reindex(model, model._default_manager.filter(**{name: instance.pk}))
+
+
+def remove_search_document(sender, instance, **kwargs):
+    search.remove(sender, [instance.pk])
+
+
+for model in {*search.SEARCH_INDEX, *search.embedded_models()}:
+    post_save.connect(update_search_documents, sender=model, dispatch_uid=f'update_search_documents_{model._meta.model_name}')
+for model in search.SEARCH_INDEX:
+    post_delete.connect(remove_search_document, sender=model, dispatch_uid=f'remove_search_document_{model._meta.model_name}')
+
+
+def bump_cache_version(sender, raw=False, **kwargs):
+    if raw:
+        return
+    # After commit, so a concurrent reader cannot cache pre-commit data under the new version
+    transaction.on_commit(lambda: bump_versions(sender))
+
+
+# Per sender rather than for every model: a post_delete receiver without one stops Django
+# from fast-deleting anything, sessions and admin log entries included
+for model in versioned_models(apps.get_app_config('app_budget')):
+    post_save.connect(bump_cache_version, sender=model, dispatch_uid=f'bump_cache_version_save_{model._meta.model_name}')
+    post_delete.connect(bump_cache_version, sender=model, dispatch_uid=f'bump_cache_version_delete_{model._meta.model_name}')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_cache_version(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Drops the user's copy cached by CachedModelBackend; a login only sets last_login,
+    # which is no reason to reload them
+    if raw or update_fields == {'last_login'}:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: bump_row_versions(User, [pk]))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def bump_user_cache_version_for_access(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif pk_set:
+        # Changed from the group's or permission's side: pk_set holds the users
+        user_ids = list(pk_set)
+    else:
+        # A group or permission cleared of all its users
+        transaction.on_commit(lambda: bump_versions(User))
+        return
+    transaction.on_commit(lambda: bump_row_versions(User, user_ids))
+
+
+def remember_changelog_snapshot(sender, instance, **kwargs):
+    changelog.snapshot(instance)
+
+
+def record_save_in_changelog(sender, instance, created, raw=False, using=None, **kwargs):
+    if not raw:
+        changelog.record(instance, 'create' if created else 'update', using)
+
+
+def record_delete_in_changelog(sender, instance, using=None, **kwargs):
+    changelog.record(instance, 'delete', using)
+
+
+# post_init especially runs for every instance the ORM builds, so only the tracked models
+for model in changelog.tracked_models(apps.get_app_config('app_budget')):
+    name = model._meta.model_name
+    post_init.connect(remember_changelog_snapshot, sender=model, dispatch_uid=f'remember_changelog_snapshot_{name}')
+    post_save.connect(record_save_in_changelog, sender=model, dispatch_uid=f'record_save_in_changelog_{name}')
+    post_delete.connect(record_delete_in_changelog, sender=model, dispatch_uid=f'record_delete_in_changelog_{name}')
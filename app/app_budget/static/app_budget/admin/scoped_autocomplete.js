@@ -0,0 +1,32 @@
+'use strict';
+// Send the value of a scoping field (e.g. the selected project) with every autocomplete
+// request of the fields that declare it, and clear those fields when the scope changes.
+{
+    const $ = django.jQuery;
+
+    $.ajaxPrefilter(function(options) {
+        if (typeof options.data !== 'string') {
+            return;
+        }
+        const params = new URLSearchParams(options.data);
+        const fieldName = params.get('field_name');
+        if (!fieldName) {
+            return;
+        }
+        const select = document.querySelector(
+            'select.admin-autocomplete[data-field-name="' + fieldName + '"][data-scope-param]'
+        );
+        const source = select && document.getElementById(select.dataset.scopeSource);
+        if (source && source.value) {
+            params.set(select.dataset.scopeParam, source.value);
+            options.data = params.toString();
+        }
+    });
+
+    $(document).on('change', 'select, input', function() {
+        const scoped = document.querySelectorAll('select.admin-autocomplete[data-scope-source="' + this.id + '"]');
+        scoped.forEach(function(select) {
+            $(select).val(null).trigger('change');
+        });
+    });
+}
@@ -0,0 +1,162 @@
+import json
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Blob, Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_QUEUE_KEY = 'app_budget:image_processing'
+IMAGE_RETRY_KEY = 'app_budget:image_processing:retry'
+MEDIA_CLEANUP_QUEUE_KEY = 'app_budget:media_cleanup'
+
+_redis = None
+
+
+def get_redis():
+    # One client (and connection pool) per process
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+def enqueue_image_processing(image_id):
+    # Redis is the broker in docker-compose; without it the job runs in-process
+    if settings.IMAGE_PROCESSING_BACKEND == 'redis':
+        get_redis().lpush(IMAGE_QUEUE_KEY, image_id)
+    else:
+        process_image_job(image_id)
+
+
+def log_image_stats(image, stats):
+    if stats:
+        logger.info(
+            "Image %s: %sx%s -> %sx%s, peak decode %.1f MiB, %s bytes WebP",
+            image.pk, *stats['original_size'], *stats['output_size'],
+            stats['peak_bytes'] / (1024 * 1024), stats['output_bytes'],
+        )
+
+
+def schedule_image_retry(image_id, attempts):
+    # A sorted set scored by due time; the worker moves due entries onto the queue
+    delay = settings.IMAGE_PROCESSING_RETRY_DELAY * 2 ** (attempts - 1)
+    get_redis().zadd(IMAGE_RETRY_KEY, {image_id: time.time() + delay})
+
+
+def promote_due_retries(connection):
+    for image_id in connection.zrangebyscore(IMAGE_RETRY_KEY, 0, time.time()):
+        # zrem decides which worker gets to move it when several poll at once
+        if connection.zrem(IMAGE_RETRY_KEY, image_id):
+            connection.lpush(IMAGE_QUEUE_KEY, image_id)
+
+
+def process_image_job(image_id):
+    # The queue may hold the same id more than once; only a pending row is claimed
+    claimed = Image.objects.filter(pk=image_id, processing_status='pending').update(
+        processing_status='processing', processing_attempts=F('processing_attempts') + 1,
+        processing_started_at=timezone.now(),
+    )
+    if not claimed:
+        return None
+    image = Image.objects.select_related('blob').get(pk=image_id)
+    try:
+        blob = image.blob
+        if blob is not None and not blob.derivative:
+            log_image_stats(image, image.process_image())
+            blob.derivative.save(image.file.name, image.file, save=False)
+            blob.save(update_fields=['derivative'])
+        if blob is not None:
+            # Every row sharing this content can use the one derivative
+            Image.objects.filter(blob=blob).exclude(pk=image.pk).exclude(processing_status='processing').update(
+                file=blob.derivative.name, processing_status='done', processing_error='',
+            )
+            image.file = blob.derivative.name
+        else:
+            log_image_stats(image, image.process_image())
+        image.processing_status = 'done'
+        image.processing_error = ''
+        image.save(update_fields=['file', 'processing_status', 'processing_error'])
+    except Exception:
+        logger.exception("Image %s processing failed (attempt %s)", image_id, image.processing_attempts)
+        # Only the queue can wait before retrying; inline failures are retried from the admin action
+        retry = (settings.IMAGE_PROCESSING_BACKEND == 'redis'
+                 and image.processing_attempts < settings.IMAGE_PROCESSING_MAX_ATTEMPTS)
+        Image.objects.filter(pk=image_id).update(
+            processing_status='pending' if retry else 'failed',
+            processing_error=traceback.format_exc(),
+        )
+        if retry:
+            schedule_image_retry(image_id, image.processing_attempts)
+    return image
+
+
+def retry_images(queryset):
+    # Pending and failed rows get a fresh set of attempts and go back onto the queue; a
+    # 'processing' row is only taken back once its worker has been silent for too long
+    stale = timezone.now() - timedelta(seconds=settings.IMAGE_PROCESSING_STALE_AFTER)
+    ids = list(queryset.filter(
+        Q(processing_status__in=['pending', 'failed'])
+        | Q(processing_status='processing', processing_started_at__lt=stale)
+        | Q(processing_status='processing', processing_started_at__isnull=True)
+    ).values_list('pk', flat=True))
+    Image.objects.filter(pk__in=ids).update(processing_status='pending', processing_attempts=0)
+    for image_id in ids:
+        enqueue_image_processing(image_id)
+    return len(ids)
+
+
+def delete_blob(blob):
+    blob.file.delete(save=False)
+    if blob.derivative:
+        blob.derivative.delete(save=False)
+    blob.delete()
+
+
+def enqueue_media_cleanup(names, blob_ids):
+    # Files left behind by a set-based delete (see deletion.py); same broker as the images
+    if not names and not blob_ids:
+        return
+    if settings.IMAGE_PROCESSING_BACKEND == 'redis':
+        get_redis().lpush(MEDIA_CLEANUP_QUEUE_KEY, json.dumps({'names': names, 'blob_ids': blob_ids}))
+    else:
+        cleanup_media_job(names, blob_ids)
+
+
+def cleanup_media_job(names, blob_ids):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.exception("Could not delete %s", name)
+    # Other rows may have started sharing a blob since; only drop the ones nobody uses
+    blobs = Blob.objects.filter(pk__in=blob_ids).unreferenced()
+    for blob in blobs:
+        delete_blob(blob)
+    return len(names), len(blobs)
+
+
+def run_worker(burst=False, timeout=5):
+    connection = get_redis()
+    processed = 0
+    while True:
+        promote_due_retries(connection)
+        job = connection.brpop([IMAGE_QUEUE_KEY, MEDIA_CLEANUP_QUEUE_KEY], timeout=timeout)
+        if job is None:
+            if burst:
+                return processed
+            continue
+        queue, payload = job
+        if queue.decode() == MEDIA_CLEANUP_QUEUE_KEY:
+            cleanup_media_job(**json.loads(payload))
+        else:
+            process_image_job(int(payload))
+        processed += 1
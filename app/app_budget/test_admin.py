@@ -0,0 +1,91 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import (
+    BudgetYear, Plan, Project, Category, BudgetItem,
+    MonthlyPlan, Image, TypeInvoice, Invoice
+)
+
+# Upper bound on queries for one admin page, whatever the number of rows.
+# Session, user, and for change lists the filtered + total counts and the page itself.
+CHANGELIST_QUERY_CEILING = 12
+CHANGEFORM_QUERY_CEILING = 14
+
+
+class AdminQueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.invoice_type = TypeInvoice.objects.create(invoice_type_name="ค่าจ้าง")
+        cls.category = Category.objects.create(category_name="ครุภัณฑ์")
+
+    def setUp(self):
+        # Test users are rolled back, so their ids (and cached copies) get reused
+        cache.clear()
+        self.client.force_login(self.user)
+        # Warm the cached user so every counted request starts from the same state
+        self.client.get(reverse("admin:index"))
+        self.counter = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.counter += 1
+            n = self.counter
+            year = BudgetYear.objects.create(fiscal_year=f"25{n:02d}", department="IT", section="Central", office="Office")
+            plan = Plan.objects.create(
+                fiscal_year=year, plan_name=f"Plan {n}", plan_code=f"P{n}", slug=f"plan-{n}",
+                contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+            )
+            project = Project.objects.create(
+                fiscal_year=year, plan=plan, project_name=f"Project {n}", project_code=f"PR{n}", slug=f"project-{n}",
+                contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+            )
+            item = BudgetItem.objects.create(
+                project=project, category=self.category, budget_item_name=f"Item {n}", sort_number=str(n),
+                contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+            )
+            MonthlyPlan.objects.create(budget_item=item, month=1, year=2567)
+            invoice = Invoice.objects.create(
+                fiscal_year=year, invoice_type=self.invoice_type, invoice_number=f"INV{n}", budget_item=item,
+            )
+            Image.objects.create(
+                invoice=invoice, file_original=f"uploads/images/original/{n}.png", file_name_original=f"{n}.png",
+                file_type="image/png", file_size=1, processing_status='done',
+            )
+        return invoice
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelists_run_a_constant_number_of_queries(self):
+        models = (BudgetYear, Plan, Project, Category, BudgetItem, MonthlyPlan, Image, TypeInvoice, Invoice)
+        self.add_rows(2)
+        small = {model: self.count_queries(reverse(f"admin:app_budget_{model._meta.model_name}_changelist")) for model in models}
+        self.add_rows(10)
+        for model in models:
+            with self.subTest(model=model.__name__):
+                url = reverse(f"admin:app_budget_{model._meta.model_name}_changelist")
+                queries = self.count_queries(url)
+                self.assertEqual(queries, small[model], "changelist queries grow with the number of rows")
+                self.assertLessEqual(queries, CHANGELIST_QUERY_CEILING)
+
+    def test_change_forms_stay_under_the_ceiling(self):
+        invoice = self.add_rows(3)
+        item = invoice.budget_item
+        objects = (
+            item.project.fiscal_year, item.project.plan, item.project, self.category, item,
+            item.monthlyplan_set.get(), invoice.items.get(), self.invoice_type, invoice,
+        )
+        for obj in objects:
+            with self.subTest(model=type(obj).__name__):
+                url = reverse(f"admin:app_budget_{obj._meta.model_name}_change", args=[obj.pk])
+                self.assertLessEqual(self.count_queries(url), CHANGEFORM_QUERY_CEILING)
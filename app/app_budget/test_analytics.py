@@ -0,0 +1,148 @@
+import random
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from . import analytics
+from .models import BudgetYear, Plan, Project, BudgetItem, MonthlyPlan
+
+CENT = Decimal('0.01')
+
+
+def reference_metrics(rows, as_of):
+    # Straightforward Decimal version of analytics.item_metrics, one item at a time
+    by_item = {}
+    for item_id, year, month, planned, actual in rows:
+        by_item.setdefault(item_id, []).append((analytics.period(year, month), planned, actual))
+    metrics = {}
+    for item_id, months in by_item.items():
+        start = min(period for period, planned, actual in months)
+        horizon = max(12, max(period for period, planned, actual in months) - start + 1)
+        elapsed = 0 if as_of is None else min(max(as_of - start + 1, 0), horizon)
+        planned_total = sum((planned for period, planned, actual in months), Decimal(0))
+        actual_total = sum((actual for period, planned, actual in months), Decimal(0))
+        planned_to_date = sum((planned for period, planned, actual in months if period - start < elapsed), Decimal(0))
+        actual_to_date = sum((actual for period, planned, actual in months if period - start < elapsed), Decimal(0))
+        values = {
+            'planned_total': planned_total,
+            'actual_total': actual_total,
+            'variance': actual_total - planned_total,
+            'planned_to_date': planned_to_date,
+            'actual_to_date': actual_to_date,
+            'elapsed_months': elapsed,
+            'start': analytics.period_label(start),
+            'burn_rate_percent': None,
+            'monthly_run_rate': None,
+            'projected_year_end': None,
+            'projected_variance': None,
+        }
+        if planned_to_date:
+            values['burn_rate_percent'] = (actual_to_date * 100 / planned_to_date).quantize(CENT, ROUND_HALF_UP)
+        if elapsed:
+            values['monthly_run_rate'] = (actual_to_date / elapsed).quantize(CENT, ROUND_HALF_UP)
+            projected = actual_to_date + (actual_to_date * (horizon - elapsed) / elapsed).quantize(CENT, ROUND_HALF_UP)
+            values['projected_year_end'] = projected
+            values['projected_variance'] = projected - planned_total
+        metrics[item_id] = values
+    return metrics
+
+
+class AnalyticsTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office")
+        plan = Plan.objects.create(
+            fiscal_year=year, plan_name="Plan", plan_code="P1", slug="p1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        cls.project = Project.objects.create(
+            fiscal_year=year, plan=plan, project_name="Bridge", project_code="B1", slug="b1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+
+    def setUp(self):
+        # The default as_of is cached under a MonthlyPlan version that test rollbacks never bump
+        cache.clear()
+
+    def create_item(self, name):
+        return BudgetItem.objects.create(
+            project=self.project, budget_item_name=name, sort_number=name,
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+
+
+class ItemMetricsTest(AnalyticsTestMixin, TestCase):
+    def test_matches_decimal_reference(self):
+        generator = random.Random(2567)
+        for number in range(40):
+            item = self.create_item(str(number))
+            # Items start in different months and some skip months or run past a year
+            start = analytics.period(2566, 10) + generator.randrange(-3, 4)
+            for offset in generator.sample(range(14), generator.randrange(1, 14)):
+                year, month = divmod(start + offset, 12)
+                MonthlyPlan.objects.create(
+                    budget_item=item, year=year, month=month + 1,
+                    planned_amount=Decimal(generator.randrange(0, 10 ** 9)) / 100,
+                    actual_amount=Decimal(generator.randrange(-10 ** 6, 10 ** 9)) / 100 if generator.random() < 0.8 else 0,
+                )
+        rows = list(MonthlyPlan.objects.values_list('budget_item_id', 'year', 'month', 'planned_amount', 'actual_amount'))
+        analytics.default_as_of()
+        for as_of in (None, analytics.period(2566, 9), analytics.period(2567, 2), analytics.period(2568, 6)):
+            with self.subTest(as_of=as_of):
+                with self.assertNumQueries(1):
+                    metrics = analytics.item_metrics(MonthlyPlan.objects.all(), as_of)
+                default = as_of
+                if default is None:
+                    default = max(analytics.period(year, month) for item_id, year, month, planned, actual in rows if actual)
+                self.assertEqual(metrics, reference_metrics(rows, default))
+
+    def test_projection(self):
+        item = self.create_item("Steel")
+        for month, actual in ((10, '100.00'), (11, '200.00'), (12, '0.01')):
+            MonthlyPlan.objects.create(budget_item=item, year=2566, month=month, planned_amount=150, actual_amount=actual)
+        metrics = analytics.item_metrics(MonthlyPlan.objects.all())[item.pk]
+        self.assertEqual(metrics['elapsed_months'], 3)
+        self.assertEqual(metrics['monthly_run_rate'], Decimal('100.00'))
+        self.assertEqual(metrics['projected_year_end'], Decimal('1200.04'))
+        self.assertEqual(metrics['burn_rate_percent'], Decimal('66.67'))
+
+    def test_default_as_of_does_not_depend_on_the_rows_listed(self):
+        early, late = self.create_item("Early"), self.create_item("Late")
+        MonthlyPlan.objects.create(budget_item=early, year=2566, month=10, planned_amount=100, actual_amount=100)
+        MonthlyPlan.objects.create(budget_item=late, year=2567, month=3, planned_amount=100, actual_amount=100)
+        alone = analytics.item_metrics(MonthlyPlan.objects.filter(budget_item=early))[early.pk]
+        together = analytics.item_metrics(MonthlyPlan.objects.all())[early.pk]
+        self.assertEqual(alone, together)
+        self.assertEqual(alone['elapsed_months'], 6)
+
+    def test_amounts_too_large_for_int64(self):
+        item = self.create_item("Dam")
+        MonthlyPlan.objects.create(budget_item=item, year=2566, month=10, planned_amount=Decimal('9999999999999.99'), actual_amount=Decimal('9999999999999.97'))
+        rows = list(MonthlyPlan.objects.values_list('budget_item_id', 'year', 'month', 'planned_amount', 'actual_amount'))
+        metrics = analytics.item_metrics(MonthlyPlan.objects.all())
+        self.assertEqual(metrics, reference_metrics(rows, analytics.period(2566, 10)))
+        self.assertEqual(metrics[item.pk]['projected_year_end'], Decimal('119999999999999.64'))
+
+    def test_no_rows(self):
+        self.assertEqual(analytics.item_metrics(MonthlyPlan.objects.none()), {})
+
+
+class BurnRateApiTest(AnalyticsTestMixin, TestCase):
+    def test_burn_rates_endpoint(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        item = self.create_item("Steel")
+        MonthlyPlan.objects.create(budget_item=item, year=2566, month=10, planned_amount=100, actual_amount=50)
+        url = reverse("app_budget:burn_rates")
+        response = self.client.get(url, {"project": self.project.pk, "as_of": "2566-11"})
+        self.assertEqual(response.status_code, 200)
+        result, = response.json()["results"]
+        self.assertEqual(result["budget_item_id"], item.pk)
+        self.assertEqual(result["elapsed_months"], 2)
+        self.assertEqual(result["monthly_run_rate"], "25.00")
+        self.assertEqual(self.client.get(url, {"as_of": "2566-13"}).status_code, 400)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=self.client.get(url)["ETag"]).status_code, 304)
@@ -0,0 +1,74 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from .models import BudgetYear, Plan, Project, BudgetItem, MonthlyPlan
+
+
+class PlanVsActualApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office")
+        cls.plan = Plan.objects.create(
+            fiscal_year=year, plan_name="Plan", plan_code="P1", slug="p1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        project = Project.objects.create(
+            fiscal_year=year, plan=cls.plan, project_name="Bridge", project_code="B1", slug="b1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        cls.items = [
+            BudgetItem.objects.create(
+                project=project, budget_item_name=name, sort_number=str(number),
+                contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+            )
+            for number, name in enumerate(["Steel", "Labour"], 1)
+        ]
+        for item in cls.items:
+            for month in (1, 2):
+                MonthlyPlan.objects.create(budget_item=item, month=month, year=2567, planned_amount=100, actual_amount=month * 30)
+
+    def setUp(self):
+        # Test users are rolled back, so their ids (and cached copies) get reused
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        return self.client.get(reverse("app_budget:plan_vs_actual"), params)
+
+    def test_project_level_sums_items_per_month(self):
+        response = self.get(level="project")
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([(row["project_name"], row["month"]) for row in results], [("Bridge", 1), ("Bridge", 2)])
+        self.assertEqual(Decimal(results[0]["planned_amount"]), Decimal("200"))
+        self.assertEqual(Decimal(results[1]["actual_amount"]), Decimal("120"))
+
+    def test_budget_item_level_and_filters(self):
+        results = self.get(budget_item=self.items[1].pk).json()["results"]
+        self.assertEqual({row["budget_item_id"] for row in results}, {self.items[1].pk})
+        self.assertEqual(results[0]["plan_id"], self.plan.pk)
+
+    def test_conditional_get(self):
+        response = self.get(level="plan")
+        self.assertIn("Last-Modified", response)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(reverse("app_budget:plan_vs_actual"), {"level": "plan"}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+        MonthlyPlan.objects.filter(budget_item=self.items[0], month=2).delete()
+        changed = self.client.get(reverse("app_budget:plan_vs_actual"), {"level": "plan"}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(Decimal(changed.json()["results"][1]["planned_amount"]), Decimal("100"))
+
+    def test_bad_parameters_and_permissions(self):
+        self.assertEqual(self.get(level="invoice").status_code, 400)
+        self.assertEqual(self.get(plan="x").status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.get().status_code, 401)
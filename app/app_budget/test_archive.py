@@ -0,0 +1,103 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+
+from . import archive
+from .models import (
+    BudgetYear, Plan, Project, BudgetItem, MonthlyPlan, Invoice, File, Blob, BudgetRollup, SearchDocument,
+    FiscalYearArchive,
+)
+
+
+class FiscalYearArchiveTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.closed = cls.create_year("2566", 1)
+        cls.current = cls.create_year("2567", 5)
+        cls.blob = Blob.objects.create(sha256="a" * 64, file="blobs/a", size=1)
+        invoice = Invoice.objects.get(fiscal_year=cls.closed)
+        File.objects.create(invoice=invoice, blob=cls.blob, file_name_original="a.pdf", file_type="application/pdf", file_size=1)
+
+    @classmethod
+    def create_year(cls, name, actual):
+        year = BudgetYear.objects.create(fiscal_year=name, department="IT", section="Central", office="Office", allocated_budget=1000)
+        dates = {"contract_sign_date": date(2024, 1, 1), "contract_end_date": date(2025, 1, 1)}
+        plan = Plan.objects.create(fiscal_year=year, plan_name=f"Plan {name}", plan_code=name, slug=name, **dates)
+        project = Project.objects.create(fiscal_year=year, plan=plan, project_name=f"Project {name}", project_code=name, slug=name, **dates)
+        main = BudgetItem.objects.create(project=project, budget_item_name=f"Main {name}", sort_number="1", allocated_budget=500, **dates)
+        sub = BudgetItem.objects.create(project=project, budget_item_name=f"Sub {name}", sort_number="1.1", main_budget_item=main, **dates)
+        for month in (1, 2):
+            MonthlyPlan.objects.create(budget_item=sub, month=month, year=int(name), planned_amount=100, actual_amount=actual * month)
+        Invoice.objects.create(fiscal_year=year, budget_item=sub, invoice_number=f"INV{name}", total_amount_due=40)
+        return year
+
+    def setUp(self):
+        # Test users are rolled back, so their ids (and cached copies) get reused
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def plan_vs_actual(self, **params):
+        results = self.client.get(reverse("app_budget:plan_vs_actual"), params).json()["results"]
+        # SQLite sums come back as e.g. "100" rather than "100.00"
+        for row in results:
+            row["planned_amount"] = Decimal(row["planned_amount"])
+            row["actual_amount"] = Decimal(row["actual_amount"])
+        return results
+
+    def test_archive_and_restore_round_trip(self):
+        rows = {model: sorted(model.objects.values_list("pk", flat=True)) for model in archive.ARCHIVED_MODELS}
+        reports = {level: self.plan_vs_actual(level=level) for level in ("fiscal_year", "project", "budget_item")}
+        year_rollup = BudgetRollup.objects.get(level="budget_year", object_id=self.closed.pk)
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("archive_fiscal_year", self.closed.pk, stdout=out)
+        self.assertIn("app_budget.monthlyplan: 2", out.getvalue())
+        for model in archive.ARCHIVED_MODELS:
+            self.assertEqual(model.objects.count(), len(rows[model]) // 2, model)
+        self.assertFalse(Invoice.objects.filter(fiscal_year=self.closed).exists())
+        self.assertFalse(SearchDocument.objects.filter(body__contains="2566").exclude(model="app_budget.plan").exists())
+        # Totals and reports still see the archived year
+        self.assertEqual(BudgetRollup.objects.get(level="budget_year", object_id=self.closed.pk).invoiced_amount, year_rollup.invoiced_amount)
+        for level, results in reports.items():
+            self.assertEqual(self.plan_vs_actual(level=level), results, level)
+        closed = self.plan_vs_actual(fiscal_year=self.closed.pk, level="plan")
+        self.assertEqual([(row["plan_name"], row["month"]) for row in closed], [("Plan 2566", 1), ("Plan 2566", 2)])
+        # The archive keeps the file's content from being pruned
+        self.assertFalse(Blob.objects.unreferenced().exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("archive_fiscal_year", self.closed.pk, "--restore", stdout=StringIO())
+        self.assertFalse(FiscalYearArchive.objects.exists())
+        for model in archive.ARCHIVED_MODELS:
+            self.assertEqual(sorted(model.objects.values_list("pk", flat=True)), rows[model], model)
+        self.assertEqual(BudgetItem.objects.get(budget_item_name="Sub 2566").main_budget_item.budget_item_name, "Main 2566")
+        self.assertTrue(SearchDocument.objects.filter(model="app_budget.invoice", body__contains="inv2566").exists())
+        self.assertEqual(BudgetRollup.objects.get(level="budget_year", object_id=self.closed.pk).invoiced_amount, year_rollup.invoiced_amount)
+        for level, results in reports.items():
+            self.assertEqual(self.plan_vs_actual(level=level), results, level)
+
+    def test_archived_year_filters(self):
+        archive.archive_year(self.closed)
+        item = archive.monthly_plans({"fiscal_year": self.closed.pk})[0]["budget_item_id"]
+        results = self.plan_vs_actual(budget_item=item, year=2566)
+        self.assertEqual([(row["budget_item_name"], row["month"], row["actual_amount"]) for row in results],
+                         [("Sub 2566", 1, Decimal("1")), ("Sub 2566", 2, Decimal("2"))])
+        self.assertEqual(self.plan_vs_actual(fiscal_year=self.current.pk, year=2566), [])
+
+    def test_command_errors(self):
+        with self.assertRaisesMessage(CommandError, "is not archived"):
+            call_command("archive_fiscal_year", self.closed.pk, "--restore")
+        archive.archive_year(self.closed)
+        with self.assertRaisesMessage(CommandError, "already archived"):
+            call_command("archive_fiscal_year", self.closed.pk)
+        with self.assertRaisesMessage(CommandError, "does not exist"):
+            call_command("archive_fiscal_year", 0)
@@ -0,0 +1,87 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from .models import BudgetYear, Plan, TypeInvoice, Invoice, File, Image
+
+
+class AsyncReadApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.year = BudgetYear.objects.create(
+            fiscal_year="2567", department="IT", section="Central", office="Office", allocated_budget=1000,
+        )
+        cls.plan = Plan.objects.create(
+            fiscal_year=cls.year, plan_name="Plan", plan_code="P1", slug="plan", allocated_budget=400,
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        invoice_type = TypeInvoice.objects.create(invoice_type_name="ค่าจ้าง")
+        cls.invoice = Invoice.objects.create(fiscal_year=cls.year, invoice_type=invoice_type, invoice_number="INV1")
+        Invoice.objects.create(fiscal_year=cls.year, invoice_type=invoice_type, invoice_number="INV2")
+        File.objects.create(
+            invoice=cls.invoice, file="uploads/files/2024/01/01/receipt.pdf", file_name_original="receipt.pdf",
+            file_type="application/pdf", file_size=10,
+        )
+        cls.image = Image.objects.create(
+            invoice=cls.invoice, file_original="uploads/images/original/1.png", file_name_original="1.png",
+            file_type="image/png", file_size=1, processing_status='done',
+        )
+
+    def setUp(self):
+        # Test users are rolled back, so their ids (and cached copies) get reused
+        cache.clear()
+        self.async_client.force_login(self.user)
+
+    async def test_budget_year_summary(self):
+        response = await self.async_client.get(reverse("app_budget:budget_year_summary", args=[self.year.pk]))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["fiscal_year"], "2567")
+        self.assertEqual(Decimal(data["totals"]["allocated_budget"]), 1000)
+        self.assertEqual(Decimal(data["totals"]["children_allocated_budget"]), 400)
+        self.assertEqual([plan["plan_code"] for plan in data["plans"]], ["P1"])
+        self.assertEqual(Decimal(data["plans"][0]["totals"]["allocated_budget"]), 400)
+
+        missing = await self.async_client.get(reverse("app_budget:budget_year_summary", args=[self.year.pk + 100]))
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_invoice_lookup(self):
+        url = reverse("app_budget:invoice_lookup")
+        response = await self.async_client.get(url, {"number": "INV1"})
+        self.assertEqual(response.status_code, 200)
+        [row] = response.json()["results"]
+        self.assertEqual(row["id"], self.invoice.pk)
+        self.assertEqual(row["invoice_type_name"], "ค่าจ้าง")
+        self.assertEqual([file["file_url"] for file in row["files"]], ["/media/uploads/files/2024/01/01/receipt.pdf"])
+        self.assertEqual([image["id"] for image in row["images"]], [self.image.pk])
+        self.assertIsNone(row["images"][0]["file_url"])
+
+        self.assertEqual((await self.async_client.get(url, {"number": "INV9"})).json()["results"], [])
+        self.assertEqual((await self.async_client.get(url)).status_code, 400)
+
+    async def test_image_metadata(self):
+        response = await self.async_client.get(reverse("app_budget:image_metadata", args=[self.image.pk]))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["invoice_id"], self.invoice.pk)
+        self.assertEqual(data["processing_status"], "done")
+        self.assertEqual(data["file_original_url"], "/media/uploads/images/original/1.png")
+
+    async def test_safe_methods_only(self):
+        response = await self.async_client.post(reverse("app_budget:image_metadata", args=[self.image.pk]))
+        self.assertEqual(response.status_code, 405)
+
+    def test_permission_required(self):
+        # Through the WSGI-style test client: the async views serve both entry points
+        url = reverse("app_budget:image_metadata", args=[self.image.pk])
+        self.assertEqual(self.client.get(url).status_code, 401)
+        clerk = User.objects.create_user("clerk")
+        clerk.user_permissions.add(Permission.objects.get(codename="view_invoice"))
+        self.client.force_login(clerk)
+        self.assertEqual(self.client.get(reverse("app_budget:invoice_lookup"), {"number": "INV1"}).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 403)
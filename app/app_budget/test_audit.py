@@ -0,0 +1,77 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+
+from . import audit
+from .models import BudgetYear, Plan, Project, BudgetItem, Invoice
+
+
+class BudgetAuditTest(TestCase):
+    def setUp(self):
+        self.year = BudgetYear.objects.create(
+            fiscal_year="2567", department="IT", section="Central", office="Office", allocated_budget=1000,
+        )
+        self.plan = Plan.objects.create(
+            fiscal_year=self.year, plan_name="Development", plan_code="DEV", slug="dev", allocated_budget=800,
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        self.project = Project.objects.create(
+            fiscal_year=self.year, plan=self.plan, project_name="Bridge", project_code="BR1", slug="br1",
+            allocated_budget=500, contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        self.main_item = self.create_item("1", "Equipment", 300)
+        self.sub_item = self.create_item("1.1", "Laptops", 200, main_budget_item=self.main_item)
+
+    def create_item(self, number, name, allocated, **kwargs):
+        return BudgetItem.objects.create(
+            project=self.project, budget_item_name=name, sort_number=number, allocated_budget=allocated,
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1), **kwargs,
+        )
+
+    def test_consistent_year_has_no_issues(self):
+        with self.assertNumQueries(6):
+            self.assertEqual(audit.audit(), [])
+
+    def test_over_allocation_reports_the_node_path(self):
+        self.create_item("1.2", "Monitors", 150, main_budget_item=self.main_item)
+        issue, = audit.audit([self.year])
+        self.assertEqual(issue['check'], 'over_allocated')
+        self.assertEqual(issue['path'], "2567 > DEV Development > BR1 Bridge > 1 Equipment")
+        self.assertEqual(issue['excess'], Decimal('50'))
+
+    def test_invoices_above_allocation_count_towards_every_ancestor(self):
+        Invoice.objects.create(invoice_number="INV1", budget_item=self.sub_item, total_amount_due=600)
+        issues = {(entry['level'], entry['object_id']): entry for entry in audit.audit()}
+        self.assertEqual(set(issues), {
+            ('budget_item', self.sub_item.pk), ('budget_item', self.main_item.pk), ('project', self.project.pk),
+        })
+        self.assertEqual(issues[('project', self.project.pk)]['excess'], Decimal('100'))
+
+    def test_cycle_is_reported_instead_of_looping(self):
+        BudgetItem.objects.filter(pk=self.main_item.pk).update(main_budget_item=self.sub_item)
+        checks = {(entry['check'], entry['object_id']) for entry in audit.audit()}
+        self.assertEqual(checks, {('detached', self.main_item.pk), ('detached', self.sub_item.pk)})
+
+    def test_command(self):
+        self.create_item("2", "Vehicles", 250)
+        stdout = StringIO()
+        call_command('audit_budget', '--fiscal-year', str(self.year.pk), stdout=stdout)
+        self.assertIn("2567 > DEV Development > BR1 Bridge: children total 550", stdout.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('audit_budget', '--fail-on-issues', stdout=StringIO())
+
+    def test_admin_view(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        self.create_item("2", "Vehicles", 250)
+        response = self.client.get(reverse("admin:app_budget_budgetyear_audit", args=[self.year.pk]))
+        self.assertContains(response, "2567 &gt; DEV Development &gt; BR1 Bridge")
+        response = self.client.get(reverse("admin:app_budget_budgetyear_change", args=[self.year.pk]))
+        self.assertContains(response, reverse("admin:app_budget_budgetyear_audit", args=[self.year.pk]))
@@ -0,0 +1,105 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from .models import BudgetYear, Plan, Project, BudgetItem
+
+
+class ScopedAutocompleteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office")
+        cls.other_year = BudgetYear.objects.create(fiscal_year="2568", department="IT", section="Central", office="Office")
+        cls.plan = cls.create_plan(cls.year, "DEV")
+        cls.other_plan = cls.create_plan(cls.other_year, "DEV2")
+        cls.project = cls.create_project("BR1")
+        cls.other_project = cls.create_project("BR2")
+        cls.item = cls.create_item(cls.project, "Equipment")
+        cls.create_item(cls.other_project, "Equipment spare")
+
+    @classmethod
+    def create_plan(cls, year, code):
+        return Plan.objects.create(
+            fiscal_year=year, plan_name=f"Plan {code}", plan_code=code, slug=code.lower(),
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+
+    @classmethod
+    def create_project(cls, code):
+        return Project.objects.create(
+            fiscal_year=cls.year, plan=cls.plan, project_name=f"Project {code}", project_code=code, slug=code.lower(),
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+
+    @classmethod
+    def create_item(cls, project, name):
+        return BudgetItem.objects.create(
+            project=project, budget_item_name=name, sort_number="1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+
+    def setUp(self):
+        # Test users are rolled back, so their ids (and cached copies) get reused
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def autocomplete(self, model_name, field_name, **params):
+        response = self.client.get(reverse("admin:autocomplete"), {
+            "app_label": "app_budget", "model_name": model_name, "field_name": field_name, **params,
+        })
+        self.assertEqual(response.status_code, 200)
+        return [result["text"] for result in response.json()["results"]]
+
+    def test_budget_items_are_scoped_to_the_selected_project(self):
+        self.assertEqual(self.autocomplete("budgetitem", "main_budget_item", term="Equip"), ["Equipment", "Equipment spare"])
+        self.assertEqual(self.autocomplete("budgetitem", "main_budget_item", term="Equip", project=self.project.pk), ["Equipment"])
+        # Prefix search only
+        self.assertEqual(self.autocomplete("budgetitem", "main_budget_item", term="spare"), [])
+
+    def test_whole_term_is_one_case_insensitive_prefix(self):
+        self.assertEqual(self.autocomplete("budgetitem", "main_budget_item", term="equipment SP"), ["Equipment spare"])
+        self.assertEqual(self.autocomplete("project", "plan", term=" plan dev2 "), ["Plan DEV2"])
+        self.assertEqual(self.autocomplete("budgetitem", "main_budget_item", term="Equipment Con"), [])
+
+    def test_plans_are_scoped_to_the_selected_fiscal_year(self):
+        self.assertEqual(self.autocomplete("project", "plan", term="Plan", fiscal_year=self.other_year.pk), ["Plan DEV2"])
+
+    def test_change_form_size_does_not_grow_with_the_table(self):
+        url = reverse("admin:app_budget_budgetitem_change", args=[self.item.pk])
+        small = self.client.get(url)
+        BudgetItem.objects.bulk_create([
+            BudgetItem(
+                project=self.project, budget_item_name=f"Item {n}", sort_number=str(n), tree_path=f"{n}/",
+                contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+            )
+            for n in range(200)
+        ])
+        large = self.client.get(url)
+        self.assertContains(large, 'data-scope-source="id_project"')
+        self.assertNotContains(large, "Item 199")
+        self.assertLess(abs(len(large.content) - len(small.content)), 200)
+
+    def test_scoped_prefix_search_uses_an_index(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("pattern opclasses are PostgreSQL only")
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        BudgetItem.objects.bulk_create([
+            BudgetItem(
+                project=self.project, budget_item_name=f"Item {n}", sort_number="1", tree_path=f"{n}/",
+                contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+            )
+            for n in range(500)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE app_budget_budgetitem")
+        plan = BudgetItem.objects.filter(budget_item_name__istartswith="equip").explain()
+        self.assertIn("budget_item_name_prefix_idx", plan)
+        # Within a project the prefix is still an index condition, not a filter over the project's rows
+        plan = BudgetItem.objects.filter(project=self.project, budget_item_name__istartswith="equip").explain()
+        self.assertRegex(plan, r"Index Cond: .*upper\(\(budget_item_name\)::text\) ~>=~ 'EQUIP'")
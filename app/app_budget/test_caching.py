@@ -0,0 +1,44 @@
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from . import reports
+from .models import BudgetYear, Plan, Category, Invoice, BudgetRollup
+
+
+class VersionedCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_lookup_list_is_served_from_cache_until_a_save(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(category_name="ครุภัณฑ์")
+        self.assertEqual([name for pk, name in reports.category_choices()], ["ครุภัณฑ์"])
+        with self.assertNumQueries(0):
+            reports.category_choices()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(category_name="ค่าจ้าง")
+        self.assertEqual([name for pk, name in reports.category_choices()], ["ครุภัณฑ์", "ค่าจ้าง"])
+
+    def test_year_totals_follow_invoice_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office", allocated_budget=1000)
+            Plan.objects.create(
+                fiscal_year=year, plan_name="Plan", plan_code="P1", slug="p1", allocated_budget=400,
+                contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+            )
+        self.assertEqual(reports.year_totals(year.pk)['children_allocated_budget'], Decimal('400'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Invoice.objects.create(fiscal_year=year, invoice_number="INV1", total_amount_due=250)
+        totals = reports.year_totals(year.pk)
+        self.assertEqual(totals['invoiced_amount'], Decimal('250'))
+        self.assertEqual(totals['remaining_budget'], Decimal('750'))
+
+    def test_derived_rows_do_not_bump_versions_one_by_one(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            BudgetRollup.objects.create(level="plan", object_id=1)
+        self.assertEqual(callbacks, [])
@@ -0,0 +1,115 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models.deletion import Collector
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from . import changelog
+from .models import BudgetYear, TypeInvoice, ChangeLogEntry, SearchDocument
+
+
+class ChangeLogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("editor", "editor@example.com", "password")
+        cls.year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office")
+
+    def test_records_only_changed_fields_after_commit(self):
+        year = BudgetYear.objects.get(pk=self.year.pk)
+        year.allocated_budget = 1000
+        year.office = "Office"
+        year.updated_by = self.user
+        with self.captureOnCommitCallbacks(execute=True):
+            year.save()
+            self.assertFalse(ChangeLogEntry.objects.exists())
+
+        entry, = ChangeLogEntry.objects.for_object(year)
+        self.assertEqual(entry.action, "update")
+        self.assertEqual(entry.changes, {"allocated_budget": ["0.00", "1000"]})
+        self.assertEqual(entry.user, self.user)
+
+        # The snapshot moves on with each save, and an unchanged save records nothing
+        with self.captureOnCommitCallbacks(execute=True):
+            year.save()
+            year.department = "Finance"
+            year.save()
+        self.assertEqual(ChangeLogEntry.objects.for_object(year).count(), 2)
+        self.assertEqual(ChangeLogEntry.objects.for_object(year).first().changes, {"department": ["IT", "Finance"]})
+
+    def test_batch_is_written_in_one_insert(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            for n in range(5):
+                TypeInvoice.objects.create(invoice_type_name=f"type {n}")
+            self.year.delete()
+        with self.assertNumQueries(1):
+            with changelog.batch():
+                for callback in callbacks:
+                    callback()
+        self.assertEqual(ChangeLogEntry.objects.filter(action="create").count(), 5)
+        entry = ChangeLogEntry.objects.get(action="delete")
+        self.assertEqual(entry.changes["fiscal_year"], ["2567", None])
+
+    def test_rolled_back_savepoint_drops_its_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            TypeInvoice.objects.create(invoice_type_name="kept")
+            try:
+                with transaction.atomic():
+                    TypeInvoice.objects.create(invoice_type_name="rolled back")
+                    raise ValueError
+            except ValueError:
+                pass
+            TypeInvoice.objects.create(invoice_type_name="also kept")
+        names = [entry.changes["invoice_type_name"][1] for entry in ChangeLogEntry.objects.order_by("pk")]
+        self.assertEqual(names, ["kept", "also kept"])
+
+    def test_changes_by_user_in_range(self):
+        other = User.objects.create_user("other")
+        with self.captureOnCommitCallbacks(execute=True):
+            with changelog.acting_as(self.user):
+                TypeInvoice.objects.create(invoice_type_name="mine")
+            with changelog.acting_as(other):
+                TypeInvoice.objects.create(invoice_type_name="theirs")
+        now = timezone.now()
+        entries = ChangeLogEntry.objects.by_user(self.user, since=now - timedelta(hours=1), until=now + timedelta(hours=1))
+        self.assertEqual([entry.changes["invoice_type_name"][1] for entry in entries], ["mine"])
+        self.assertFalse(ChangeLogEntry.objects.by_user(self.user, since=now + timedelta(hours=1)).exists())
+
+    def test_middleware_attributes_request_user(self):
+        def view(request):
+            TypeInvoice.objects.create(invoice_type_name="from a request")
+            return HttpResponse()
+
+        request = RequestFactory().get("/")
+        with self.captureOnCommitCallbacks(execute=True):
+            request.user = self.user
+            changelog.ChangeLogMiddleware(view)(request)
+            request.user = AnonymousUser()
+            changelog.ChangeLogMiddleware(view)(request)
+        self.assertEqual([entry.user for entry in ChangeLogEntry.objects.order_by("pk")], [self.user, None])
+
+    def test_request_is_written_once_it_is_handled(self):
+        def view(request):
+            for n in range(3):
+                with self.captureOnCommitCallbacks(execute=True):
+                    TypeInvoice.objects.create(invoice_type_name=f"type {n}")
+            self.assertFalse(ChangeLogEntry.objects.exists())
+            return HttpResponse()
+
+        request = RequestFactory().get("/")
+        request.user = self.user
+        changelog.ChangeLogMiddleware(view)(request)
+        self.assertEqual(ChangeLogEntry.objects.filter(user=self.user).count(), 3)
+
+    def test_derived_tables_are_not_tracked(self):
+        self.assertEqual(changelog.tracked_fields(SearchDocument), {})
+        self.assertNotIn("updated_at", changelog.tracked_fields(BudgetYear))
+        self.assertNotIn("updated_by_id", changelog.tracked_fields(BudgetYear))
+
+    def test_other_models_keep_fast_deletes(self):
+        # No app_budget receiver without a sender, so Django can still delete these in one query
+        self.assertTrue(Collector(using="default").can_fast_delete(Session.objects.all()))
+        self.assertFalse(hasattr(SearchDocument(), "_changelog_snapshot"))
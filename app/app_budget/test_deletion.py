@@ -0,0 +1,110 @@
+import shutil
+import tempfile
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import archive, deletion
+from .models import (
+    BudgetYear, Plan, Project, BudgetItem, MonthlyPlan, Invoice, File, Blob, BudgetRollup, SearchDocument, ChangeLogEntry,
+    FiscalYearArchive,
+)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PROCESSING_BACKEND='inline')
+class BulkDeleteTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Test users are rolled back, so their ids (and cached copies) get reused
+        cache.clear()
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.doomed = self.create_year("2560")
+        self.kept = self.create_year("2567")
+
+    def create_year(self, name):
+        year = BudgetYear.objects.create(fiscal_year=name, department="IT", section="Central", office="Office")
+        dates = {"contract_sign_date": date(2024, 1, 1), "contract_end_date": date(2025, 1, 1)}
+        plan = Plan.objects.create(fiscal_year=year, plan_name=f"Plan {name}", plan_code=name, slug=name, **dates)
+        for code in ("A", "B"):
+            project = Project.objects.create(
+                fiscal_year=year, plan=plan, project_name=f"Project {name}{code}", project_code=f"{name}{code}", slug=f"{name}{code}", **dates,
+            )
+            main = BudgetItem.objects.create(project=project, budget_item_name=f"Main {name}{code}", sort_number="1", **dates)
+            sub = BudgetItem.objects.create(project=project, budget_item_name=f"Sub {name}{code}", sort_number="1.1", main_budget_item=main, **dates)
+            MonthlyPlan.objects.create(budget_item=sub, month=1, year=int(name), planned_amount=100)
+            Invoice.objects.create(fiscal_year=year, budget_item=sub, invoice_number=f"INV{name}{code}", total_amount_due=40)
+        return year
+
+    def test_deletes_year_tree_with_set_based_statements(self):
+        invoice = Invoice.objects.get(invoice_number="INV2560A")
+        name = default_storage.save("uploads/files/doomed.txt", ContentFile(b"x"))
+        File.objects.create(invoice=invoice, file=name, file_name_original="doomed.txt", file_type="text/plain", file_size=1)
+        blob = Blob.objects.create(sha256="b" * 64, file=default_storage.save("uploads/blobs/b", ContentFile(b"y")), size=1)
+        File.objects.create(invoice=invoice, blob=blob, file_name_original="b.txt", file_type="text/plain", file_size=1)
+        counts = {model: model.objects.count() for model in deletion.TREE_MODELS}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = deletion.delete_trees(budget_years=[self.doomed])
+        rows = {table["table"]: table["rows"] for table in report["tables"]}
+        self.assertEqual(rows, {
+            "app_budget_image": 0, "app_budget_file": 2, "app_budget_invoice": 2, "app_budget_monthlyplan": 2,
+            "app_budget_budgetitem": 4, "app_budget_project": 2, "app_budget_plan": 1, "app_budget_budgetyear": 1,
+        })
+        for model in deletion.TREE_MODELS:
+            self.assertEqual(model.objects.count(), counts[model] - rows[model._meta.db_table], model)
+        self.assertFalse(BudgetRollup.objects.filter(fiscal_year=self.doomed).exists())
+        self.assertFalse(SearchDocument.objects.filter(body__contains="2560").exists())
+        self.assertTrue(SearchDocument.objects.filter(body__contains="2567").exists())
+        self.assertEqual(ChangeLogEntry.objects.filter(action="delete").get().object_id, self.doomed.pk)
+        # Media cleanup ran inline after commit
+        self.assertEqual((report["files"], report["blobs"]), (1, 1))
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_deletes_an_archived_year_with_its_archive(self):
+        blob = Blob.objects.create(sha256="c" * 64, file=default_storage.save("uploads/blobs/c", ContentFile(b"z")), size=1)
+        invoice = Invoice.objects.get(invoice_number="INV2560A")
+        File.objects.create(invoice=invoice, blob=blob, file_name_original="c.txt", file_type="text/plain", file_size=1)
+        archive.archive_year(self.doomed)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = deletion.delete_trees(budget_years=[self.doomed])
+        self.assertEqual(report["blobs"], 1)
+        self.assertFalse(BudgetYear.objects.filter(pk=self.doomed.pk).exists())
+        self.assertFalse(FiscalYearArchive.objects.exists())
+        self.assertFalse(FiscalYearArchive.blobs.through.objects.exists())
+        # Nothing else refers to the archive's blob, so the cleanup job removed it
+        self.assertFalse(Blob.objects.exists())
+
+    def test_deleting_a_project_updates_its_plan_rollup(self):
+        project = Project.objects.get(project_code="2567A")
+        plan_row = BudgetRollup.objects.get(level="plan", object_id=project.plan_id)
+        self.assertEqual(plan_row.invoiced_amount, 80)
+        deletion.delete_trees(projects=[project])
+        self.assertFalse(BudgetItem.objects.filter(project=project).exists())
+        self.assertEqual(Project.objects.filter(plan=project.plan).count(), 1)
+        plan_row.refresh_from_db()
+        self.assertEqual(plan_row.invoiced_amount, 40)
+
+    def test_admin_action_confirms_then_deletes(self):
+        self.client.force_login(self.user)
+        url = reverse("admin:app_budget_budgetyear_changelist")
+        data = {"action": "bulk_delete_tree", "_selected_action": [self.doomed.pk]}
+        response = self.client.post(url, data)
+        self.assertContains(response, "ยืนยันการลบ")
+        self.assertTrue(BudgetYear.objects.filter(pk=self.doomed.pk).exists())
+
+        response = self.client.post(url, {**data, "post": "yes"}, follow=True)
+        self.assertContains(response, "app_budget_budgetitem 4")
+        self.assertFalse(BudgetYear.objects.filter(pk=self.doomed.pk).exists())
@@ -0,0 +1,74 @@
+import csv
+from io import BytesIO, StringIO
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import BudgetYear, TypeInvoice, Invoice
+
+
+class StreamingExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office")
+        other_year = BudgetYear.objects.create(fiscal_year="2568", department="IT", section="Central", office="Office")
+        invoice_type = TypeInvoice.objects.create(invoice_type_name="ค่าจ้าง")
+        for n in range(5):
+            Invoice.objects.create(fiscal_year=cls.year, invoice_type=invoice_type, invoice_number=f"INV{n}", total_amount_due=n)
+        Invoice.objects.create(fiscal_year=other_year, invoice_number="OTHER")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_csv_export_streams_the_filtered_changelist(self):
+        url = reverse("admin:app_budget_invoice_export_csv") + f"?fiscal_year__id__exact={self.year.pk}"
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        with CaptureQueriesContext(connection) as context:
+            content = b"".join(response.streaming_content).decode("utf-8-sig")
+        # One query however many rows; the FK columns come from joins
+        self.assertEqual(len(context.captured_queries), 1)
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0][:3], ["เลขที่ใบแจ้งหนี้", "ปีงบประมาณ", "ชื่อประเภทใบแจ้งหนี้"])
+        self.assertEqual(sorted(row[0] for row in rows[1:]), [f"INV{n}" for n in range(5)])
+        self.assertEqual(rows[1][2], "ค่าจ้าง")
+
+    def test_export_skips_the_changelist_page_queries(self):
+        url = reverse("admin:app_budget_monthlyplan_export_csv") + "?o=-3"
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in context.captured_queries if "COUNT(" in query["sql"].upper()])
+        self.assertFalse([query for query in context.captured_queries if "app_budget_monthlyplan" in query["sql"]])
+
+    def test_bad_filter_redirects_like_the_changelist(self):
+        response = self.client.get(reverse("admin:app_budget_invoice_export_csv") + "?fiscal_year__id__exact=abc")
+        self.assertRedirects(response, reverse("admin:app_budget_invoice_changelist") + "?e=1", fetch_redirect_response=False)
+
+    def test_xlsx_action_exports_selected_rows(self):
+        from openpyxl import load_workbook
+
+        selected = Invoice.objects.filter(invoice_number__in=["INV1", "OTHER"])
+        response = self.client.post(reverse("admin:app_budget_invoice_changelist"), {
+            "action": "export_xlsx", "_selected_action": [invoice.pk for invoice in selected],
+        })
+        self.assertEqual(response.status_code, 200)
+        workbook = load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(sorted(row[0] for row in rows[1:]), ["INV1", "OTHER"])
+
+    def test_changelist_links_to_exports(self):
+        response = self.client.get(reverse("admin:app_budget_monthlyplan_changelist"))
+        self.assertContains(response, reverse("admin:app_budget_monthlyplan_export_csv"))
+
+    def test_exports_need_the_view_permission(self):
+        clerk = User.objects.create_user("clerk", "clerk@example.com", "password", is_staff=True)
+        self.client.force_login(clerk)
+        for name in ("invoice", "monthlyplan"):
+            for extension in ("csv", "xlsx"):
+                response = self.client.get(reverse(f"admin:app_budget_{name}_export_{extension}"))
+                self.assertEqual(response.status_code, 403)
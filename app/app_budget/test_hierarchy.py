@@ -0,0 +1,54 @@
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from .models import BudgetYear, Plan, Project, BudgetItem
+
+
+class BudgetItemTreeTest(TestCase):
+    def setUp(self):
+        year = BudgetYear.objects.create(fiscal_year="2567", department="IT Group", section="Central", office="Office")
+        plan = Plan.objects.create(
+            fiscal_year=year, plan_name="Plan", plan_code="P1", slug="p1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        self.project = Project.objects.create(
+            fiscal_year=year, plan=plan, project_name="Project", project_code="PR1", slug="pr1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        self.root = self.create_item("Root")
+        self.child = self.create_item("Child", self.root)
+        self.leaf = self.create_item("Leaf", self.child)
+        self.other = self.create_item("Other")
+
+    def create_item(self, name, parent=None):
+        return BudgetItem.objects.create(
+            project=self.project, budget_item_name=name, main_budget_item=parent, sort_number="1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+
+    def test_descendants_and_ancestors(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.root.get_descendants()), [self.child, self.leaf])
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.leaf.get_ancestors()), [self.root, self.child])
+        self.assertEqual(self.leaf.tree_depth, 2)
+
+    def test_move_reroots_subtree(self):
+        self.child.main_budget_item = self.other
+        self.child.save()
+        self.leaf.refresh_from_db()
+        self.assertEqual(list(self.leaf.get_ancestors()), [self.other, self.child])
+        self.assertEqual(list(self.root.get_descendants()), [])
+
+    def test_cannot_move_under_own_descendant(self):
+        self.root.main_budget_item = self.leaf
+        with self.assertRaises(ValidationError):
+            self.root.clean()
+
+    def test_rebuild_tree(self):
+        expected = list(BudgetItem.objects.tree().values_list('pk', 'tree_path', 'tree_depth'))
+        BudgetItem.objects.update(tree_path='', tree_depth=0)
+        BudgetItem.objects.rebuild_tree()
+        self.assertEqual(list(BudgetItem.objects.tree().values_list('pk', 'tree_path', 'tree_depth')), expected)
@@ -0,0 +1,159 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from . import tasks
+from .models import Invoice, Image, File, Blob
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def png_upload(name="receipt.png", size=(64, 48)):
+    buffer = BytesIO()
+    PILImage.new("RGBA", size, (200, 10, 10, 255)).save(buffer, format="PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PROCESSING_BACKEND='inline')
+class ImageProcessingTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.invoice = Invoice.objects.create(invoice_number="INV1")
+
+    def test_webp_derivative_is_built_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            image = Image.objects.create(invoice=self.invoice, file_original=png_upload())
+        # Until the job runs the original doubles as the placeholder
+        self.assertEqual(image.processing_status, 'pending')
+        self.assertEqual(image.display_file, image.file_original)
+        self.assertEqual(image.file_type, "image/png")
+
+        for callback in callbacks:
+            callback()
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'done')
+        self.assertTrue(image.file.name.endswith(".webp"))
+        self.assertEqual(image.display_file, image.file)
+
+    def test_failures_are_recorded_and_retryable(self):
+        broken = SimpleUploadedFile("broken.png", b"not an image", content_type="image/png")
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(invoice=self.invoice, file_original=broken)
+        image.refresh_from_db()
+        # Inline there is nothing to wait on, so the failure stands until the admin retries it
+        self.assertEqual(image.processing_status, 'failed')
+        self.assertEqual(image.processing_attempts, 1)
+        self.assertIn("UnidentifiedImageError", image.processing_error)
+
+        self.assertEqual(tasks.retry_images(Image.objects.filter(pk=image.pk)), 1)
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'failed')
+        self.assertEqual(image.processing_attempts, 1)
+
+    @override_settings(IMAGE_PROCESSING_BACKEND='redis', IMAGE_PROCESSING_RETRY_DELAY=60)
+    def test_queued_failures_are_retried_after_a_delay(self):
+        broken = SimpleUploadedFile("broken.png", b"not an image", content_type="image/png")
+        with mock.patch('app_budget.tasks.get_redis') as get_redis:
+            with self.captureOnCommitCallbacks(execute=True):
+                image = Image.objects.create(invoice=self.invoice, file_original=broken)
+            get_redis.return_value.lpush.assert_called_once_with(tasks.IMAGE_QUEUE_KEY, image.pk)
+
+            with mock.patch('app_budget.tasks.time.time', return_value=1000.0):
+                tasks.process_image_job(image.pk)
+                tasks.process_image_job(image.pk)
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'pending')
+        self.assertEqual(image.processing_attempts, 2)
+        self.assertEqual(get_redis.return_value.zadd.call_args_list, [
+            mock.call(tasks.IMAGE_RETRY_KEY, {image.pk: 1060.0}),
+            mock.call(tasks.IMAGE_RETRY_KEY, {image.pk: 1120.0}),
+        ])
+        # Nothing went back onto the queue itself
+        get_redis.return_value.lpush.assert_called_once()
+
+    @override_settings(IMAGE_PROCESSING_BACKEND='redis')
+    def test_broker_outage_does_not_fail_the_upload(self):
+        with mock.patch('app_budget.tasks.get_redis', side_effect=ConnectionError):
+            with self.assertLogs('django.test', 'ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    image = Image.objects.create(invoice=self.invoice, file_original=png_upload())
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'pending')
+
+    def test_duplicate_jobs_only_process_pending_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(invoice=self.invoice, file_original=png_upload())
+        self.assertIsNone(tasks.process_image_job(image.pk))
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'done')
+        self.assertEqual(image.processing_attempts, 1)
+
+    def test_retry_leaves_images_another_worker_is_processing(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            busy = Image.objects.create(invoice=self.invoice, file_original=png_upload("a.png"))
+            stalled = Image.objects.create(invoice=self.invoice, file_original=png_upload("b.png", size=(8, 8)))
+        Image.objects.filter(pk=busy.pk).update(processing_status='processing', processing_started_at=timezone.now())
+        Image.objects.filter(pk=stalled.pk).update(
+            processing_status='processing', processing_started_at=timezone.now() - timedelta(hours=1),
+        )
+        with mock.patch('app_budget.tasks.enqueue_image_processing') as enqueue:
+            self.assertEqual(tasks.retry_images(Image.objects.all()), 1)
+        enqueue.assert_called_once_with(stalled.pk)
+        busy.refresh_from_db()
+        self.assertEqual(busy.processing_status, 'processing')
+
+    def test_duplicate_upload_reuses_blob_and_derivative(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Image.objects.create(invoice=self.invoice, file_original=png_upload("a.png"))
+        other_invoice = Invoice.objects.create(invoice_number="INV2")
+        with mock.patch('app_budget.tasks.enqueue_image_processing') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                second = Image.objects.create(invoice=other_invoice, file_original=png_upload("a.png"))
+        first.refresh_from_db()
+
+        # No job is queued: the derivative already exists for this content
+        enqueue.assert_not_called()
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(second.blob_id, first.blob_id)
+        self.assertEqual(second.processing_status, 'done')
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(second.file_original.name, first.file_original.name)
+        self.assertEqual(second.file_name_original, "a.png")
+
+    def test_file_attachments_share_blobs(self):
+        for name in ("contract.pdf", "contract-copy.pdf"):
+            File.objects.create(
+                invoice=self.invoice, file=SimpleUploadedFile(name, b"%PDF-1.4 same", content_type="application/pdf"),
+            )
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(len({f.file.name for f in File.objects.all()}), 1)
+        self.assertEqual(sorted(File.objects.values_list('file_name_original', flat=True)),
+                         ["contract-copy.pdf", "contract.pdf"])
+        self.assertFalse(Blob.objects.unreferenced().exists())
+
+    @override_settings(IMAGE_MAX_DIMENSION=100)
+    def test_large_jpeg_is_decoded_at_reduced_scale(self):
+        buffer = BytesIO()
+        PILImage.new("RGB", (1600, 1200), (10, 120, 10)).save(buffer, format="JPEG")
+        image = Image(invoice=self.invoice, file_original=SimpleUploadedFile("big.jpg", buffer.getvalue()))
+        stats = image.process_image()
+        self.assertEqual(stats['output_size'], (100, 75))
+        # Draft mode decodes at 1/8 scale (200x150) instead of the full 1600x1200
+        self.assertLessEqual(stats['peak_bytes'], 200 * 150 * 3 + 100 * 75 * 3)
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_decompression_bomb_is_rejected(self):
+        image = Image(invoice=self.invoice, file_original=png_upload(size=(100, 100)))
+        with self.assertRaises(PILImage.DecompressionBombError):
+            image.process_image()
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from .models import BudgetYear, Plan, Project, BudgetItem, MonthlyPlan, BudgetRollup
+
+PLANS = """fiscal_year,plan_code,plan_name,allocated_budget,contract_sign_date,contract_end_date
+2567,DEV,Development Plan,"1,000.00",2024-01-01,2025-01-01
+"""
+PROJECTS = """fiscal_year,plan_code,project_code,project_name,allocated_budget,contract_sign_date,contract_end_date
+2567,DEV,BRIDGE,Bridge Construction,800,2024-01-01,2025-01-01
+"""
+BUDGET_ITEMS = """fiscal_year,project_code,sort_number,main_sort_number,budget_item_name,category,item_type,allocated_budget,contract_sign_date,contract_end_date
+2567,BRIDGE,1.1,1,Laptops,ครุภัณฑ์,sub_item,200,2024-01-01,2025-01-01
+2567,BRIDGE,1,,Equipment,ครุภัณฑ์,main_item,300,2024-01-01,2025-01-01
+"""
+MONTHLY_PLANS = """fiscal_year,project_code,sort_number,year,month,planned_amount,actual_amount
+2567,BRIDGE,1.1,2567,1,100,90
+2567,BRIDGE,1.1,2567,2,100,
+"""
+
+
+class ImportBudgetTest(TestCase):
+    def setUp(self):
+        self.year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        return path
+
+    def paths(self, **overrides):
+        files = {'plans': PLANS, 'projects': PROJECTS, 'budget_items': BUDGET_ITEMS, 'monthly_plans': MONTHLY_PLANS}
+        files.update(overrides)
+        # Deliberately out of dependency order
+        return [self.write(f"{kind}.csv", content) for kind, content in reversed(files.items())]
+
+    def run_import(self, *args):
+        stdout = StringIO()
+        call_command('import_budget', *args, stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_import_creates_the_hierarchy(self):
+        output = self.run_import(*self.paths(), '--batch-size', '1')
+        self.assertIn("rows/s", output)
+
+        plan = Plan.objects.get()
+        self.assertEqual(plan.slug, "2567-dev")
+        self.assertEqual(plan.allocated_budget, Decimal('1000.00'))
+        child = BudgetItem.objects.get(sort_number="1.1")
+        self.assertEqual(child.main_budget_item.sort_number, "1")
+        self.assertEqual(list(child.get_ancestors()), [child.main_budget_item])
+        self.assertEqual(MonthlyPlan.objects.filter(budget_item=child).count(), 2)
+        # Derived data is refreshed even though bulk writes skip signals
+        year_row = BudgetRollup.objects.get(level='budget_year', object_id=self.year.pk)
+        self.assertEqual(year_row.children_allocated_budget, Decimal('1000.00'))
+
+    def test_reimport_updates_in_place(self):
+        self.run_import(*self.paths())
+        self.run_import(*self.paths(plans=PLANS.replace("Development Plan", "Renamed Plan")))
+        self.assertEqual(Plan.objects.get().plan_name, "Renamed Plan")
+        self.assertEqual(Project.objects.count(), 1)
+        self.assertEqual(BudgetItem.objects.count(), 2)
+        self.assertEqual(MonthlyPlan.objects.count(), 2)
+
+    def test_dry_run_writes_nothing(self):
+        output = self.run_import(*self.paths(), '--dry-run')
+        self.assertIn("Dry run OK", output)
+        self.assertFalse(Plan.objects.exists())
+
+    def test_invalid_rows_roll_back_everything(self):
+        broken = PROJECTS + "2567,NOPE,X,Bad,abc,2024-01-01,2025-01-01\n"
+        with self.assertRaisesMessage(CommandError, "1 invalid rows"):
+            self.run_import(*self.paths(projects=broken))
+        self.assertFalse(Plan.objects.exists())
+
+    def test_xlsx_workbook(self):
+        from openpyxl import Workbook
+        import csv
+
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        for kind, content in (('plans', PLANS), ('projects', PROJECTS), ('budget_items', BUDGET_ITEMS)):
+            sheet = workbook.create_sheet(kind)
+            for row in csv.reader(StringIO(content)):
+                sheet.append(row)
+        path = os.path.join(self.directory, "budget.xlsx")
+        workbook.save(path)
+
+        self.run_import(path)
+        self.assertEqual(BudgetItem.objects.count(), 2)
+
+    def test_existing_item_can_move_under_a_parent_later_in_the_file(self):
+        self.run_import(*self.paths())
+        moved = BUDGET_ITEMS.splitlines()[0] + """
+2567,BRIDGE,1.1,2,Laptops,ครุภัณฑ์,sub_item,200,2024-01-01,2025-01-01
+2567,BRIDGE,2,,Vehicles,ครุภัณฑ์,main_item,300,2024-01-01,2025-01-01
+"""
+        self.run_import(*self.paths(budget_items=moved), '--batch-size', '1')
+        child = BudgetItem.objects.get(sort_number="1.1")
+        self.assertEqual(child.main_budget_item.sort_number, "2")
+        self.assertEqual(list(child.get_ancestors()), [child.main_budget_item])
+
+    def test_fractional_month_is_rejected(self):
+        plans = MONTHLY_PLANS.replace("2567,1,100,90", "2567,1.5,100,90").replace("2567,2,100,", "2567,2.0,100,")
+        with self.assertRaisesMessage(CommandError, "1 invalid rows"):
+            self.run_import(*self.paths(monthly_plans=plans))
@@ -0,0 +1,156 @@
+from datetime import date
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import reports, rollup
+from .models import BudgetYear, Plan, Project, BudgetItem, MonthlyPlan, TypeInvoice, Invoice, Image
+
+
+class HotPathIndexTest(TestCase):
+    """EXPLAIN the queries the admin, reports and analytics actually build."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.invoice_type, other_type = (TypeInvoice.objects.create(invoice_type_name=name) for name in ("ค่าจ้าง", "ค่าวัสดุ"))
+        # Enough rows in every table for the planner's choice to mean something
+        items = []
+        for fiscal_year in ("2567", "2568"):
+            year = BudgetYear.objects.create(fiscal_year=fiscal_year, department="IT", section="Central", office="Office")
+            plans = [
+                Plan.objects.create(
+                    fiscal_year=year, plan_name=f"Plan {n}", plan_code=f"P{fiscal_year}{n}", slug=f"p{fiscal_year}{n}",
+                    contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1), sort_order=n,
+                )
+                for n in range(6)
+            ]
+            for plan in plans[:2]:
+                for status, _ in Project.STATUS_CHOICES:
+                    project = Project.objects.create(
+                        fiscal_year=year, plan=plan, project_name=f"Project {status}", project_code=f"PR{plan.pk}{status}",
+                        slug=f"pr{plan.pk}{status}", project_status=status,
+                        contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+                    )
+                    items += BudgetItem.objects.bulk_create([
+                        BudgetItem(
+                            project=project, budget_item_name=f"Item {k}", sort_number=str(k), tree_path=f"{project.pk}.{k}/",
+                            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+                        )
+                        for k in range(5)
+                    ])
+            invoices = Invoice.objects.bulk_create([
+                Invoice(fiscal_year=year, invoice_type=invoice_type, invoice_number=f"INV{fiscal_year}{k}", invoice_date=date(2024, 1, 1))
+                for invoice_type in (cls.invoice_type, other_type) for k in range(5)
+            ])
+        Image.objects.bulk_create([
+            Image(
+                invoice=invoice, file_original=f"uploads/blobs/{invoice.pk}-{k}.png",
+                file_name_original="receipt.png" if k == 0 else f"scan-{invoice.pk}-{k}.png",
+                file_type="image/png", file_size=1, processing_status='failed' if k == 0 else 'done',
+            )
+            for invoice in invoices for k in range(5)
+        ])
+        MonthlyPlan.objects.bulk_create([
+            MonthlyPlan(budget_item=item, year=year, month=month, planned_amount=100, actual_amount=50)
+            for item in items for year in (2567, 2568) for month in range(1, 13)
+        ])
+        cls.year, cls.plan, cls.project, cls.item = year, plan, project, items[-1]
+
+    def setUp(self):
+        cache.clear()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            if connection.vendor == 'postgresql':
+                # The test tables are still small; make the planner show which index it *can* use
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    @property
+    def monthly_plan_unique_index(self):
+        # SQLite builds unique constraints inline and names the backing index itself
+        if connection.vendor == 'sqlite':
+            return 'sqlite_autoindex_app_budget_monthlyplan'
+        return 'monthly_plan_item_period_uniq'
+
+    def changelist_queryset(self, model, params):
+        request = RequestFactory().get("/", params)
+        request.user = self.user
+        model_admin = admin.site._registry[model]
+        return model_admin.get_changelist_instance(request).get_queryset(request)
+
+    def explain_queries(self, table, run):
+        """The plans of the SELECTs from `table` that `run()` sends."""
+        with CaptureQueriesContext(connection) as context:
+            run()
+        plans = []
+        for query in context.captured_queries:
+            if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql']:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"{connection.ops.explain_query_prefix()} {query['sql']}")
+                    plans.append("\n".join(" ".join(map(str, row)) for row in cursor.fetchall()))
+        self.assertTrue(plans, f"no query read {table}")
+        return plans
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_invoice_changelist_by_year_and_type(self):
+        queryset = self.changelist_queryset(Invoice, {
+            'fiscal_year__id__exact': self.year.pk, 'invoice_type__id__exact': self.invoice_type.pk,
+        })
+        self.assertUsesIndex(queryset, 'invoice_year_type_date_idx')
+
+    def test_monthly_plan_changelist_by_period(self):
+        queryset = self.changelist_queryset(MonthlyPlan, {'year__exact': 2567, 'month__exact': 1})
+        self.assertUsesIndex(queryset, 'monthly_plan_period_idx')
+
+    def test_monthly_plan_admin_form_checks_the_period(self):
+        self.client.force_login(self.user)
+        url = reverse("admin:app_budget_monthlyplan_add")
+        plans = self.explain_queries('app_budget_monthlyplan', lambda: self.client.post(url, {
+            'budget_item': self.item.pk, 'year': 2567, 'month': 2, 'planned_amount': 10, 'actual_amount': 0,
+        }))
+        self.assertTrue(any(self.monthly_plan_unique_index in plan for plan in plans))
+
+    def test_plan_vs_actual_report(self):
+        for level, filters in (('budget_item', {'budget_item': self.item.pk, 'year': 2567}),
+                               ('project', {'project': self.project.pk, 'year': 2567})):
+            with self.subTest(level=level):
+                self.assertUsesIndex(reports.plan_vs_actual(level, filters), self.monthly_plan_unique_index)
+
+    def test_burn_rate_metrics_of_the_budget_item_changelist(self):
+        self.client.force_login(self.user)
+        url = reverse("admin:app_budget_budgetitem_changelist") + f"?project__id__exact={self.project.pk}"
+        plans = self.explain_queries('app_budget_monthlyplan', lambda: self.client.get(url))
+        self.assertTrue(any(self.monthly_plan_unique_index in plan for plan in plans))
+
+    def test_invoices_without_budget_item(self):
+        plans = self.explain_queries('app_budget_invoice', lambda: rollup.direct_invoiced('budget_year', self.year.pk))
+        self.assertIn('invoice_year_unassigned_idx', plans[0])
+
+    def test_plan_changelist_by_year(self):
+        queryset = self.changelist_queryset(Plan, {'fiscal_year__id__exact': self.year.pk})
+        self.assertUsesIndex(queryset, 'plan_year_sort_idx')
+
+    def test_project_changelist_by_plan_and_status(self):
+        queryset = self.changelist_queryset(Project, {
+            'plan__id__exact': self.plan.pk, 'project_status__exact': 'planning',
+        })
+        self.assertUsesIndex(queryset, 'project_plan_status_sort_idx')
+
+    def test_image_changelist_search(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("pattern opclasses are PostgreSQL only")
+        self.assertUsesIndex(self.changelist_queryset(Image, {'q': 'receipt'}), 'image_name_prefix_idx')
+
+    def test_image_changelist_unprocessed(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("SQLite only uses a partial index when the query repeats its condition")
+        queryset = self.changelist_queryset(Image, {'processing_status__exact': 'failed'})
+        self.assertUsesIndex(queryset, 'image_unprocessed_idx')
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import BudgetYear, TypeInvoice, Invoice
+
+
+@override_settings(INVOICE_SYNC_SETTLE_SECONDS=0)
+class InvoiceSyncApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office")
+        invoice_type = TypeInvoice.objects.create(invoice_type_name="ค่าจ้าง")
+        cls.start = timezone.now() - timedelta(days=1)
+        for n in range(7):
+            invoice = Invoice.objects.create(fiscal_year=cls.year, invoice_type=invoice_type, invoice_number=f"INV{n}")
+            # Two rows per timestamp, so the id has to break ties
+            Invoice.objects.filter(pk=invoice.pk).update(updated_at=cls.start + timedelta(minutes=n // 2))
+
+    def setUp(self):
+        # Test users are rolled back, so their ids (and cached copies) get reused
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse("app_budget:invoices")
+
+    def sync(self, **params):
+        rows = []
+        while True:
+            with self.assertNumQueries(1):
+                page = self.client.get(self.url, params).json()
+            rows.extend(page["results"])
+            params["cursor"] = page["next_cursor"]
+            if not page["has_more"]:
+                return rows, params["cursor"]
+
+    def test_pages_through_every_invoice_in_update_order(self):
+        # Warm the cached user so every page is a single query
+        self.client.get(self.url, {"limit": 1})
+        rows, cursor = self.sync(limit=2, fields="invoice_number,fiscal_year_name,invoice_type_name")
+        self.assertEqual([row["invoice_number"] for row in rows], [f"INV{n}" for n in range(7)])
+        self.assertEqual(rows[0], {"invoice_number": "INV0", "fiscal_year_name": "2567", "invoice_type_name": "ค่าจ้าง"})
+
+        # Resuming from the stored cursor returns only what changed since
+        changed = Invoice.objects.get(invoice_number="INV2")
+        changed.details = "แก้ไข"
+        changed.save()
+        rows, cursor = self.sync(cursor=cursor, fields="id,details")
+        self.assertEqual(rows, [{"id": changed.pk, "details": "แก้ไข"}])
+
+    def test_updated_since_and_validation(self):
+        since = (self.start + timedelta(minutes=2)).isoformat()
+        page = self.client.get(self.url, {"updated_since": since, "fields": "invoice_number"}).json()
+        self.assertEqual([row["invoice_number"] for row in page["results"]], ["INV4", "INV5", "INV6"])
+        self.assertEqual(self.client.get(self.url, {"fields": "password"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"cursor": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"limit": "0"}).status_code, 400)
+
+    @override_settings(INVOICE_SYNC_SETTLE_SECONDS=60)
+    def test_recent_rows_wait_until_they_settle(self):
+        Invoice.objects.create(fiscal_year=self.year, invoice_number="NEW")
+        numbers = [row["invoice_number"] for row in self.client.get(self.url).json()["results"]]
+        self.assertNotIn("NEW", numbers)
+        self.assertEqual(len(numbers), 7)
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+MEDIA_ROOT = tempfile.mkdtemp()
+CONTENT = bytes(range(256)) * 4
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_SERVE_BACKEND='')
+class MediaServingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("clerk", password="password")
+        cls.user.user_permissions.add(Permission.objects.get(codename="view_invoice"))
+        sha256 = hashlib.sha256(CONTENT).hexdigest()
+        cls.blob_name = f"uploads/blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.webp"
+        cls.legacy_name = "uploads/files/2024/01/01/receipt.pdf"
+        for name in (cls.blob_name, cls.legacy_name):
+            os.makedirs(os.path.dirname(os.path.join(MEDIA_ROOT, name)), exist_ok=True)
+            with open(os.path.join(MEDIA_ROOT, name), "wb") as file:
+                file.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Test users are rolled back, so their ids (and cached copies) get reused
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get(self, name, **headers):
+        return self.client.get(f"/media/{name}", **headers)
+
+    def test_requires_invoice_access(self):
+        self.client.logout()
+        response = self.get(self.blob_name)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("/admin/login/", response["Location"])
+        self.client.force_login(User.objects.create_user("outsider"))
+        self.assertEqual(self.get(self.blob_name).status_code, 403)
+
+    def test_content_named_files_are_immutable(self):
+        response = self.get(self.blob_name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), CONTENT)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertEqual(response["ETag"], f'"{os.path.basename(self.blob_name)}"')
+        for directive in ("private", "max-age=31536000", "immutable"):
+            self.assertIn(directive, response["Cache-Control"])
+
+        cached = self.get(self.blob_name, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached["ETag"], response["ETag"])
+
+    def test_other_files_are_revalidated(self):
+        response = self.get(self.legacy_name)
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertNotIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.get(self.legacy_name, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.get(self.blob_name, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), CONTENT[10:20])
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(CONTENT)}")
+        self.assertEqual(response["Content-Length"], "10")
+
+        suffix = self.get(self.blob_name, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(suffix.streaming_content), CONTENT[-5:])
+        self.assertEqual(self.get(self.blob_name, HTTP_RANGE=f"bytes={len(CONTENT)}-").status_code, 416)
+        # A stale If-Range gets the whole (changed) file instead
+        stale = self.get(self.blob_name, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"other"')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_offloads_to_the_proxy(self):
+        with self.settings(MEDIA_SERVE_BACKEND="x-accel-redirect", MEDIA_INTERNAL_URL="/protected-media/"):
+            response = self.get(self.blob_name)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.blob_name}")
+        self.assertEqual(response.content, b"")
+        self.assertIn("immutable", response["Cache-Control"])
+        with self.settings(MEDIA_SERVE_BACKEND="x-sendfile"):
+            response = self.get(self.legacy_name)
+        self.assertEqual(response["X-Sendfile"], os.path.join(MEDIA_ROOT, self.legacy_name))
+
+    def test_missing_and_escaping_paths(self):
+        self.assertEqual(self.get("uploads/files/missing.pdf").status_code, 404)
+        self.assertEqual(self.get("uploads/files").status_code, 404)
+        self.assertEqual(self.get("../manage.py").status_code, 404)
+        self.assertEqual(self.get("uploads/%2e%2e/%2e%2e/manage.py").status_code, 404)
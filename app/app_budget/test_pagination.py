@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import InvoiceAdmin
+from .models import BudgetYear, Invoice
+
+
+@mock.patch.object(InvoiceAdmin, 'list_per_page', 10)
+class KeysetChangeListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office")
+        start = timezone.make_aware(datetime(2024, 1, 1))
+        for n in range(35):
+            invoice = Invoice.objects.create(fiscal_year=cls.year, invoice_number=f"INV{n:03d}")
+            # Pairs of invoices share a timestamp, so the id has to break ties
+            Invoice.objects.filter(pk=invoice.pk).update(created_at=start + timedelta(hours=n // 2))
+        cls.expected = list(Invoice.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def setUp(self):
+        # Test users are rolled back, so their ids (and cached copies) get reused
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse("admin:app_budget_invoice_changelist")
+
+    def page(self, query=""):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context["cl"]
+
+    def test_walks_every_row_once_forwards_and_back(self):
+        pages = [self.page()]
+        while pages[-1].next_page_url:
+            pages.append(self.page(pages[-1].next_page_url))
+        self.assertEqual([obj.pk for cl in pages for obj in cl.result_list], self.expected)
+        self.assertEqual(len(pages), 4)
+
+        previous = self.page(pages[-1].previous_page_url)
+        self.assertEqual([obj.pk for obj in previous.result_list], self.expected[20:30])
+        first = self.page(pages[1].previous_page_url)
+        self.assertEqual([obj.pk for obj in first.result_list], self.expected[:10])
+        self.assertIsNone(first.previous_page_url)
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        cl = self.page()
+        with CaptureQueriesContext(connection) as first:
+            self.page()
+        last = self.page(self.page(self.page(cl.next_page_url).next_page_url).next_page_url)
+        with CaptureQueriesContext(connection) as deep:
+            self.page(self.page(last.previous_page_url).next_page_url)
+        self.assertFalse(any("OFFSET" in query["sql"] for query in deep.captured_queries))
+        self.assertEqual(len(first.captured_queries), len(deep.captured_queries) // 2)
+
+    def test_filters_and_column_sorting(self):
+        cl = self.page("?invoice_number=INV001")
+        self.assertEqual([obj.invoice_number for obj in cl.result_list], ["INV001"])
+        # Sorting by a column falls back to numbered pages
+        cl = self.page("?o=1")
+        self.assertFalse(cl.keyset)
+        self.assertEqual(cl.paginator.num_pages, 4)
+        self.assertRedirects(self.client.get(self.url + "?after=garbage"), self.url + "?e=1", fetch_redirect_response=False)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1)
+    def test_estimated_count_replaces_count_star(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("row estimates come from the PostgreSQL planner")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE app_budget_invoice")
+        with CaptureQueriesContext(connection) as context:
+            cl = self.page()
+        self.assertTrue(cl.result_count_estimated)
+        self.assertFalse(any("COUNT(" in query["sql"] for query in context.captured_queries))
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from PIL import Image as PILImage
+
+from . import reprocess
+from .media import CONTENT_NAMED
+from .models import BudgetYear, Invoice, Image
+from .test_images import png_upload
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PROCESSING_BACKEND='inline')
+class ReprocessImagesTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office")
+        self.invoices = [Invoice.objects.create(fiscal_year=self.year, invoice_number=f"INV{n}") for n in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for invoice in self.invoices[:2]:
+                Image.objects.create(invoice=invoice, file_original=png_upload())
+        self.shared = list(Image.objects.order_by('pk'))
+        # An upload from before Blob existed: its own original and derivative, no blob
+        buffer = BytesIO()
+        PILImage.new("RGB", (64, 48), (10, 10, 200)).save(buffer, format="PNG")
+        self.legacy = Image.objects.create(
+            invoice=self.invoices[2], file_name_original="legacy.png", file_type="image/png", file_size=1,
+            file_original=default_storage.save("uploads/images/original/legacy.png", ContentFile(buffer.getvalue())),
+            file=default_storage.save("uploads/images/legacy.webp", ContentFile(b"old webp")),
+            processing_status='done',
+        )
+        self.checkpoint = os.path.join(MEDIA_ROOT, f"checkpoint-{self._testMethodName}.json")
+
+    def reprocess(self, *args):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("reprocess_images", "--workers", "2", "--checkpoint", self.checkpoint, *args, stdout=out)
+        return out.getvalue()
+
+    @override_settings(IMAGE_WEBP_QUALITY=40)
+    def test_rewrites_derivatives_under_new_names(self):
+        old_shared, old_legacy = self.shared[0].file.name, self.legacy.file.name
+        output = self.reprocess()
+        self.assertIn("Re-encoded 2 derivatives for 3 images", output)
+
+        for image in self.shared:
+            image.refresh_from_db()
+            self.assertEqual(image.file.name, image.blob.derivative.name)
+        self.legacy.refresh_from_db()
+        for old, image in ((old_shared, self.shared[0]), (old_legacy, self.legacy)):
+            self.assertNotEqual(image.file.name, old)
+            self.assertFalse(default_storage.exists(old))
+            self.assertTrue(default_storage.exists(image.file.name))
+            self.assertIsNone(CONTENT_NAMED.match(image.file.name))
+            with PILImage.open(default_storage.path(image.file.name)) as webp:
+                self.assertEqual(webp.format, "WEBP")
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_filters(self):
+        old_legacy = self.legacy.file.name
+        output = self.reprocess("--invoice", str(self.invoices[0].pk))
+        # The other image of the blob follows its shared derivative
+        self.assertIn("Re-encoded 1 derivatives for 2 images", output)
+        self.legacy.refresh_from_db()
+        self.assertEqual(self.legacy.file.name, old_legacy)
+
+        self.assertIn("Re-encoded 0 derivatives", self.reprocess("--since", "2999-01-01"))
+
+    def test_resumes_from_checkpoint(self):
+        filters = {'invoices': None, 'fiscal_years': None, 'since': None, 'until': None}
+        checkpoint = reprocess.Checkpoint(self.checkpoint, filters)
+        with self.captureOnCommitCallbacks(execute=True):
+            run = reprocess.run(checkpoint, filters, workers=1, batch_size=1)
+            # Interrupted after the first batch: the blob
+            self.assertEqual(next(run)['phase'], 'blobs')
+            run.close()
+        self.assertTrue(os.path.exists(self.checkpoint))
+
+        with self.assertRaises(CommandError):
+            self.reprocess("--invoice", str(self.invoices[0].pk))
+        output = self.reprocess()
+        self.assertIn(f"Resuming after blobs {self.shared[0].blob_id}", output)
+        self.assertIn("Re-encoded 2 derivatives for 3 images", output)
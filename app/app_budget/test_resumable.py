@@ -0,0 +1,177 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import resumable
+from .models import Invoice, File, Blob, ResumableUpload
+
+MEDIA_ROOT = tempfile.mkdtemp()
+CONTENT = b"%PDF-1.4\n" + bytes(range(256)) * 1024
+
+
+def metadata(**values):
+    return ",".join(f"{key} {base64.b64encode(str(value).encode()).decode()}" for key, value in values.items())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_SERVE_BACKEND='')
+class ResumableUploadTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.invoice = Invoice.objects.create(invoice_number="INV1")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Test users are rolled back, so their ids (and cached copies) get reused
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def tus(self, method, url, **headers):
+        return getattr(self.client, method)(url, headers={"Tus-Resumable": "1.0.0", **headers})
+
+    def create(self, length=len(CONTENT), **values):
+        values = {"filename": "contract.pdf", "filetype": "application/octet-stream", "invoice": self.invoice.pk, **values}
+        response = self.tus("post", reverse("app_budget:uploads"), **{
+            "Upload-Length": str(length), "Upload-Metadata": metadata(**values),
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        return response["Location"]
+
+    def patch(self, url, offset, data):
+        return self.client.patch(url, data, content_type="application/offset+octet-stream", headers={
+            "Tus-Resumable": "1.0.0", "Upload-Offset": str(offset),
+        })
+
+    def test_upload_in_chunks(self):
+        options = self.client.options(reverse("app_budget:uploads"))
+        self.assertEqual(options["Tus-Version"], "1.0.0")
+        self.assertIn("creation", options["Tus-Extension"])
+
+        url = self.create()
+        self.assertEqual(self.tus("head", url)["Upload-Offset"], "0")
+        upload = ResumableUpload.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.patch(url, 0, CONTENT[:100_000])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["Upload-Offset"], "100000")
+        self.assertIn("Upload-Expires", response)
+        self.assertEqual(os.path.getsize(resumable.part_path(upload)), 100_000)
+
+        # The next chunk lands on a worker that never saw the first one
+        resumable._hashers.clear()
+        self.assertEqual(self.patch(url, 0, CONTENT[:10]).status_code, 409)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.patch(url, 100_000, CONTENT[100_000:])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["Upload-Offset"], str(len(CONTENT)))
+
+        file = File.objects.get()
+        self.assertEqual(response["Upload-File-Id"], str(file.pk))
+        self.assertEqual(file.invoice, self.invoice)
+        self.assertEqual(file.file_name_original, "contract.pdf")
+        self.assertEqual(file.file_size, len(CONTENT))
+        # Sniffed from the first bytes rather than the client's guess
+        self.assertEqual(file.file_type, "application/pdf")
+        self.assertEqual(file.blob.sha256, hashlib.sha256(CONTENT).hexdigest())
+        with file.file.open("rb") as stored:
+            self.assertEqual(stored.read(), CONTENT)
+        self.assertFalse(os.path.exists(resumable.part_path(upload)))
+
+        # A client that lost the response can still see that it is done
+        head = self.tus("head", url)
+        self.assertEqual(head["Upload-Offset"], str(len(CONTENT)))
+        self.assertEqual(head["Upload-File-Id"], str(file.pk))
+
+    def test_failed_completion_can_be_resumed(self):
+        url = self.create()
+        upload = ResumableUpload.objects.get()
+        with mock.patch.object(File.objects, "create", side_effect=DatabaseError("boom")):
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(DatabaseError):
+                self.patch(url, 0, CONTENT)
+        # Rolled back, and the received bytes are still there to be sent again
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.tus("head", url)["Upload-Offset"], "0")
+        self.assertEqual(os.path.getsize(resumable.part_path(upload)), len(CONTENT))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.patch(url, 0, CONTENT).status_code, 204)
+        with File.objects.get().file.open("rb") as stored:
+            self.assertEqual(stored.read(), CONTENT)
+        self.assertFalse(os.path.exists(resumable.part_path(upload)))
+
+    def test_client_type_is_kept_for_formats_inside_the_sniffed_container(self):
+        docx = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        content = b"PK\x03\x04" + bytes(100)
+        for filename, filetype, stored in (
+            ("contract.docx", docx, docx),
+            ("contract.docx", "application/octet-stream", "application/zip"),
+            # Claims to be a PDF but is not one
+            ("contract.pdf", "application/pdf", "application/zip"),
+        ):
+            url = self.create(length=len(content), filename=filename, filetype=filetype)
+            self.assertEqual(self.patch(url, 0, content).status_code, 204)
+            self.assertEqual(File.objects.latest("pk").file_type, stored)
+
+    def test_same_content_shares_the_blob(self):
+        for name in ("a.pdf", "b.pdf"):
+            url = self.create(filename=name)
+            self.assertEqual(self.patch(url, 0, CONTENT).status_code, 204)
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(sorted(File.objects.values_list("file_name_original", flat=True)), ["a.pdf", "b.pdf"])
+
+    def test_protocol_errors(self):
+        url = self.create()
+        self.assertEqual(self.client.head(url).status_code, 412)
+        response = self.client.patch(url, b"x", content_type="application/pdf", headers={
+            "Tus-Resumable": "1.0.0", "Upload-Offset": "0",
+        })
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(self.patch(url, 5, b"x").status_code, 409)
+        self.assertEqual(self.patch(url, 0, CONTENT + b"extra").status_code, 400)
+
+        with override_settings(RESUMABLE_UPLOAD_MAX_SIZE=10):
+            response = self.tus("post", reverse("app_budget:uploads"), **{"Upload-Length": "11"})
+            self.assertEqual(response.status_code, 413)
+        response = self.tus("post", reverse("app_budget:uploads"), **{"Upload-Length": "1", "Upload-Metadata": metadata(invoice=0)})
+        self.assertEqual(response.status_code, 400)
+
+        # Uploads belong to whoever started them
+        self.client.force_login(User.objects.create_superuser("other", "other@example.com", "password"))
+        self.assertEqual(self.tus("head", url).status_code, 404)
+
+    def test_terminate_and_expire(self):
+        url = self.create()
+        self.patch(url, 0, CONTENT[:10])
+        upload = ResumableUpload.objects.get()
+        # Unfinished bytes are never served
+        self.assertEqual(self.client.get(f"/media/uploads/partial/{upload.pk}.part").status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.tus("delete", url).status_code, 204)
+        self.assertFalse(ResumableUpload.objects.exists())
+        self.assertFalse(os.path.exists(resumable.part_path(upload)))
+
+        url = self.create()
+        upload = ResumableUpload.objects.get()
+        ResumableUpload.objects.update(updated_at=upload.updated_at - timedelta(hours=25))
+        self.assertEqual(self.tus("head", url).status_code, 410)
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("prune_blobs", stdout=out)
+        self.assertIn("1 expired uploads", out.getvalue())
+        self.assertFalse(os.path.exists(resumable.part_path(upload)))
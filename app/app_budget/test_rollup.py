@@ -0,0 +1,79 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase
+
+from . import rollup
+from .models import BudgetYear, Plan, Project, BudgetItem, Invoice, BudgetRollup
+
+
+class BudgetRollupTest(TestCase):
+    def setUp(self):
+        self.year = BudgetYear.objects.create(
+            fiscal_year="2567", department="IT Group", section="Central", office="Office of Management",
+            allocated_budget=1000,
+        )
+        self.plan = Plan.objects.create(
+            fiscal_year=self.year, plan_name="Development Plan", plan_code="DEV123", slug="dev123",
+            allocated_budget=800, contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        self.project = Project.objects.create(
+            fiscal_year=self.year, plan=self.plan, project_name="Bridge Construction", project_code="BRIDGE001",
+            slug="bridge001", allocated_budget=500, contract_sign_date=date(2024, 1, 1),
+            contract_end_date=date(2025, 1, 1),
+        )
+        self.main_item = BudgetItem.objects.create(
+            project=self.project, budget_item_name="Equipment", allocated_budget=300, sort_number="1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        self.sub_item = BudgetItem.objects.create(
+            project=self.project, main_budget_item=self.main_item, budget_item_name="Laptops",
+            allocated_budget=200, item_type='sub_item', sort_number="1.1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+
+    def node(self, level, obj):
+        return BudgetRollup.objects.get(level=level, object_id=obj.pk)
+
+    def test_children_sums(self):
+        self.assertEqual(self.node('budget_item', self.main_item).children_allocated_budget, Decimal('200'))
+        self.assertEqual(self.node('project', self.project).children_allocated_budget, Decimal('300'))
+        self.assertEqual(self.node('budget_year', self.year).children_allocated_budget, Decimal('800'))
+
+    def test_invoice_propagates_to_every_ancestor(self):
+        invoice = Invoice.objects.create(
+            fiscal_year=self.year, invoice_number="INV1", total_amount_due=150, budget_item=self.sub_item,
+        )
+        for level, obj in (('budget_item', self.main_item), ('project', self.project), ('budget_year', self.year)):
+            self.assertEqual(self.node(level, obj).invoiced_amount, Decimal('150'))
+        self.assertEqual(self.node('project', self.project).remaining_budget, Decimal('350'))
+
+        invoice.budget_item = self.main_item
+        invoice.total_amount_due = 100
+        invoice.save()
+        self.assertEqual(self.node('budget_item', self.sub_item).invoiced_amount, Decimal('0'))
+        self.assertEqual(self.node('budget_item', self.main_item).invoiced_amount, Decimal('100'))
+
+        invoice.delete()
+        self.assertEqual(self.node('budget_year', self.year).invoiced_amount, Decimal('0'))
+
+    def test_delete_removes_subtree(self):
+        self.main_item.delete()
+        self.assertFalse(BudgetRollup.objects.filter(level='budget_item').exists())
+        self.assertEqual(self.node('project', self.project).children_allocated_budget, Decimal('0'))
+
+        self.year.delete()
+        self.assertFalse(BudgetRollup.objects.exists())
+
+    def test_rebuild_matches_incremental(self):
+        Invoice.objects.create(fiscal_year=self.year, invoice_number="INV2", total_amount_due=40)
+        Invoice.objects.create(invoice_number="INV3", total_amount_due=60, budget_item=self.sub_item)
+        expected = list(rollup.year_summary(self.year).order_by('level', 'object_id').values(
+            'level', 'object_id', 'children_allocated_budget', 'invoiced_amount', 'remaining_budget'
+        ))
+        rollup.rebuild([self.year])
+        rebuilt = list(rollup.year_summary(self.year).order_by('level', 'object_id').values(
+            'level', 'object_id', 'children_allocated_budget', 'invoiced_amount', 'remaining_budget'
+        ))
+        self.assertEqual(rebuilt, expected)
+        self.assertEqual(self.node('budget_year', self.year).invoiced_amount, Decimal('100'))
@@ -0,0 +1,72 @@
+from datetime import date
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import search
+from .models import BudgetYear, Plan, Project, BudgetItem, Invoice, SearchDocument
+
+
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        self.year = BudgetYear.objects.create(fiscal_year="2567", department="IT", section="Central", office="Office")
+        plan = Plan.objects.create(
+            fiscal_year=self.year, plan_name="แผนพัฒนาระบบ", plan_code="DEV", slug="dev",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        self.project = Project.objects.create(
+            fiscal_year=self.year, plan=plan, project_name="ก่อสร้างสะพาน", project_code="BR1", slug="br1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        self.item = BudgetItem.objects.create(
+            project=self.project, budget_item_name="ค่าจ้างเหมาบริการ", sort_number="1",
+            contract_sign_date=date(2024, 1, 1), contract_end_date=date(2025, 1, 1),
+        )
+        self.invoice = Invoice.objects.create(
+            fiscal_year=self.year, invoice_number="INV-0001", contractor_name="บริษัท ตัวอย่าง จำกัด", budget_item=self.item,
+        )
+
+    def matches(self, model, term):
+        return set(model.objects.filter(pk__in=search.matching_ids(model, term)).values_list('pk', flat=True))
+
+    def test_thai_substrings_and_joined_names_match(self):
+        self.assertEqual(self.matches(Invoice, "จ้างเหมา"), {self.invoice.pk})
+        self.assertEqual(self.matches(Invoice, "inv-00 ตัวอย่าง"), {self.invoice.pk})
+        self.assertEqual(self.matches(Invoice, "2567"), {self.invoice.pk})
+        self.assertEqual(self.matches(Invoice, "inv ไม่มี"), set())
+        self.assertEqual(self.matches(BudgetItem, "สะพาน"), {self.item.pk})
+        if connection.vendor == 'sqlite':
+            self.assertIn("MATCH", str(search.matching_ids(Invoice, "จ้างเหมา").query))
+
+    def test_documents_follow_saves_of_joined_rows_and_deletes(self):
+        self.item.budget_item_name = "ค่าวัสดุสำนักงาน"
+        self.item.save()
+        self.assertEqual(self.matches(Invoice, "วัสดุ"), {self.invoice.pk})
+        self.assertEqual(self.matches(Invoice, "จ้างเหมา"), set())
+
+        self.invoice.delete()
+        self.assertFalse(SearchDocument.objects.filter(model='app_budget.invoice').exists())
+
+    @override_settings(SEARCH_BACKEND='app_budget.search.ContainsBackend')
+    def test_backend_is_pluggable(self):
+        self.assertIsInstance(search.get_backend(), search.ContainsBackend)
+        self.assertEqual(self.matches(Project, "br"), {self.project.pk})
+
+    def test_rebuild_command_repairs_the_index(self):
+        Invoice.objects.filter(pk=self.invoice.pk).update(contractor_name="ห้างหุ้นส่วน")
+        SearchDocument.objects.create(model='app_budget.invoice', object_id=self.invoice.pk + 1000, body="orphan")
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.matches(Invoice, "หุ้นส่วน"), {self.invoice.pk})
+        self.assertFalse(SearchDocument.objects.filter(body="orphan").exists())
+
+    def test_admin_search_uses_the_index(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        response = self.client.get(reverse("admin:app_budget_invoice_changelist"), {"q": "จ้างเหมา"})
+        self.assertContains(response, "INV-0001")
+        self.assertIn("app_budget_searchdocument", str(response.context["cl"].queryset.query))
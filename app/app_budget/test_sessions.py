@@ -0,0 +1,69 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .caching import current_versions, version_key
+
+DATABASE_SESSIONS = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+    'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+}
+
+
+class CachedSessionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+
+    def setUp(self):
+        cache.clear()
+
+    def admin_index_queries(self):
+        client = self.client_class()
+        client.force_login(self.user)
+        client.get(reverse("admin:index"))
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(client.get(reverse("admin:index")).status_code, 200)
+        return len(context.captured_queries)
+
+    def test_session_and_user_come_from_the_cache(self):
+        cached = self.admin_index_queries()
+        with override_settings(**DATABASE_SESSIONS):
+            database = self.admin_index_queries()
+        self.assertEqual(database - cached, 2)
+
+    def test_deactivated_user_is_logged_out_on_the_next_request(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("admin:index")).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get(reverse("admin:index")).status_code, 302)
+
+    def test_logins_and_other_users_leave_the_cached_user_alone(self):
+        def version():
+            return current_versions([version_key(User), version_key(User, self.user.pk)])
+
+        before = version()
+        other = User.objects.create_user("clerk", "clerk@example.com", "password", is_staff=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            # update_last_login saves only last_login
+            self.assertTrue(self.client.login(username="admin", password="password"))
+            other.first_name = "Somchai"
+            other.save()
+        self.assertEqual(version(), before)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.groups.create(name="Finance").user_set.add(self.user)
+        self.assertNotEqual(version(), before)
+
+    def test_benchmark_command(self):
+        stdout = StringIO()
+        call_command('benchmark_admin_session', '--requests', '2', stdout=stdout)
+        self.assertIn("remove 2.0 queries per request", stdout.getvalue())
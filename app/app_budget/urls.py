@@ -0,0 +1,16 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'app_budget'
+
+urlpatterns = [
+    path('plan-vs-actual/', views.plan_vs_actual, name='plan_vs_actual'),
+    path('burn-rates/', views.burn_rates, name='burn_rates'),
+    path('invoices/', views.invoices, name='invoices'),
+    path('invoices/lookup/', views.invoice_lookup, name='invoice_lookup'),
+    path('budget-years/<int:pk>/summary/', views.budget_year_summary, name='budget_year_summary'),
+    path('images/<int:pk>/', views.image_metadata, name='image_metadata'),
+    path('uploads/', views.uploads, name='uploads'),
+    path('uploads/<uuid:pk>/', views.upload, name='upload'),
+]
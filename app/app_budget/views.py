@@ -1,3 +1,383 @@
-from django.shortcuts import render
+import hashlib
+from datetime import timedelta
+from functools import wraps
 
-# Create your views here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import F
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition, require_http_methods, require_safe
+
+from . import analytics, media, reports, resumable
+from .models import BudgetYear, BudgetRollup, Plan, Invoice, File, Image
+from .pagination import decode_cursor, encode_cursor, seek_after
+
+# Fields of the invoice sync API: own columns, and the joined names under their own keys
+INVOICE_FIELDS = (
+    'id', 'invoice_number', 'invoice_date', 'invoice_month', 'invoice_year', 'total_amount_due',
+    'approval_date', 'approver_name', 'contractor_name', 'details', 'fiscal_year_id', 'invoice_type_id',
+    'budget_item_id', 'created_at', 'updated_at',
+)
+INVOICE_JOINED_FIELDS = {
+    'fiscal_year_name': 'fiscal_year__fiscal_year',
+    'invoice_type_name': 'invoice_type__invoice_type_name',
+    'budget_item_name': 'budget_item__budget_item_name',
+}
+INVOICE_PAGE_SIZE = 500
+INVOICE_MAX_PAGE_SIZE = 5000
+INVOICE_LOOKUP_LIMIT = 20
+# Attachment metadata of the async lookup endpoints; the stored file names become URLs
+FILE_FIELDS = ('id', 'invoice_id', 'file_name_original', 'file_type', 'file_size', 'created_at')
+IMAGE_FIELDS = (
+    'id', 'invoice_id', 'file_name_original', 'file_type', 'file_size', 'processing_status', 'order', 'created_at',
+)
+
+
+def api_permission_required(perm):
+    def check(request):
+        if not request.user.is_authenticated:
+            return JsonResponse({'detail': 'Authentication required.'}, status=401)
+        if not request.user.has_perm(perm):
+            return JsonResponse({'detail': 'Permission denied.'}, status=403)
+        return None
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # Loading request.user (session, user, permissions) is synchronous in Django 4.2
+                denied = await sync_to_async(check)(request)
+                return denied or await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return check(request) or view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def async_require_safe(view):
+    # require_safe only learns to wrap coroutine functions in Django 5.0
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+class BadRequest(Exception):
+    pass
+
+
+def api_filters(request):
+    filters = {}
+    for name in reports.PLAN_VS_ACTUAL_FILTERS:
+        value = request.GET.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            filters[name] = int(value)
+        except ValueError:
+            raise BadRequest(f"{name} must be an integer")
+    return filters
+
+
+def api_period(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        year, month = (int(part) for part in value.split('-'))
+    except ValueError:
+        raise BadRequest(f"{name} must look like YYYY-MM")
+    if not 1 <= month <= 12:
+        raise BadRequest(f"{name} must look like YYYY-MM")
+    return analytics.period(year, month)
+
+
+def monthly_plan_freshness(request):
+    # condition() asks for the ETag and Last-Modified separately; aggregate once per request
+    if not hasattr(request, '_monthly_plan_freshness'):
+        try:
+            request._monthly_plan_freshness = reports.plan_vs_actual_freshness(api_filters(request))
+        except BadRequest:
+            request._monthly_plan_freshness = None
+    return request._monthly_plan_freshness
+
+
+def monthly_plan_etag(request):
+    stamps = monthly_plan_freshness(request)
+    if stamps is None:
+        return None
+    key = request.get_full_path() + ':' + ':'.join(str(stamps[name]) for name in sorted(stamps))
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def monthly_plan_last_modified(request):
+    stamps = monthly_plan_freshness(request)
+    if stamps is None:
+        return None
+    return max((value for name, value in stamps.items() if name.endswith('_updated_at') and value is not None), default=None)
+
+
+def json_response(data):
+    response = JsonResponse(data)
+    # Let browsers and proxies keep a private copy but always revalidate it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+monthly_plan_condition = condition(etag_func=monthly_plan_etag, last_modified_func=monthly_plan_last_modified)
+
+
+def burn_rate_etag(request):
+    etag = monthly_plan_etag(request)
+    if etag is None or request.GET.get('as_of'):
+        return etag
+    # The default as_of comes from every MonthlyPlan row, not just the filtered ones
+    return hashlib.md5(f"{etag}:{analytics.default_as_of()}".encode()).hexdigest()
+
+
+@require_safe
+@api_permission_required('app_budget.view_monthlyplan')
+@monthly_plan_condition
+def plan_vs_actual(request):
+    level = request.GET.get('level', 'budget_item')
+    try:
+        if level not in reports.PLAN_VS_ACTUAL_LEVELS:
+            raise BadRequest(f"level must be one of: {', '.join(reports.PLAN_VS_ACTUAL_LEVELS)}")
+        filters = api_filters(request)
+    except BadRequest as error:
+        return JsonResponse({'detail': str(error)}, status=400)
+    results = []
+    for row in reports.plan_vs_actual(level, filters):
+        row['planned_amount'] = row.pop('planned')
+        row['actual_amount'] = row.pop('actual')
+        results.append(row)
+    return json_response({'level': level, 'filters': filters, 'results': results})
+
+
+@require_safe
+@api_permission_required('app_budget.view_monthlyplan')
+# No Last-Modified: rows outside the filters can move the default as_of
+@condition(etag_func=burn_rate_etag)
+def burn_rates(request):
+    try:
+        filters = api_filters(request)
+        as_of = api_period(request, 'as_of')
+    except BadRequest as error:
+        return JsonResponse({'detail': str(error)}, status=400)
+    if as_of is None:
+        as_of = analytics.default_as_of()
+    metrics = analytics.item_metrics(reports.monthly_plans(filters), as_of)
+    results = [{'budget_item_id': item_id, **values} for item_id, values in metrics.items()]
+    return json_response({
+        'filters': filters, 'as_of': None if as_of is None else analytics.period_label(as_of), 'results': results,
+    })
+
+
+def api_fields(request):
+    value = request.GET.get('fields')
+    if not value:
+        return [*INVOICE_FIELDS, *INVOICE_JOINED_FIELDS]
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in INVOICE_FIELDS and name not in INVOICE_JOINED_FIELDS]
+    if unknown:
+        raise BadRequest(f"unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def api_limit(request):
+    try:
+        limit = int(request.GET.get('limit', INVOICE_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest("limit must be an integer")
+    if not 1 <= limit <= INVOICE_MAX_PAGE_SIZE:
+        raise BadRequest(f"limit must be between 1 and {INVOICE_MAX_PAGE_SIZE}")
+    return limit
+
+
+@require_safe
+@api_permission_required('app_budget.view_invoice')
+def invoices(request):
+    """Invoices in (updated_at, id) order, one keyset page per request.
+
+    Start with ?updated_since=<ISO datetime> (or nothing, for a full sync), then follow
+    `next_cursor` until `has_more` is false. Keep the last `next_cursor` to resume the next
+    sync exactly where this one stopped.
+    """
+    try:
+        fields = api_fields(request)
+        limit = api_limit(request)
+        queryset = Invoice.objects.all()
+        if request.GET.get('cursor'):
+            try:
+                queryset = seek_after(queryset, 'updated_at', decode_cursor(request.GET['cursor']))
+            except ValueError:
+                raise BadRequest("invalid cursor")
+        if request.GET.get('updated_since'):
+            since = parse_datetime(request.GET['updated_since'])
+            if since is None:
+                raise BadRequest("updated_since must be an ISO 8601 datetime")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            queryset = queryset.filter(updated_at__gte=since)
+    except BadRequest as error:
+        return JsonResponse({'detail': str(error)}, status=400)
+
+    # Leave out rows saved in the last few seconds: a transaction still in flight could
+    # commit an older updated_at behind the cursor and never be seen
+    settle = timezone.now() - timedelta(seconds=settings.INVOICE_SYNC_SETTLE_SECONDS)
+    own = [name for name in fields if name in INVOICE_FIELDS]
+    joined = {name: F(INVOICE_JOINED_FIELDS[name]) for name in fields if name in INVOICE_JOINED_FIELDS}
+    rows = list(
+        queryset.filter(updated_at__lt=settle)
+        .order_by('updated_at', 'pk')
+        .values(*own, _cursor_updated_at=F('updated_at'), _cursor_pk=F('pk'), **joined)[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = request.GET.get('cursor')
+    if rows:
+        next_cursor = encode_cursor(rows[-1]['_cursor_updated_at'], rows[-1]['_cursor_pk'])
+    for row in rows:
+        del row['_cursor_updated_at'], row['_cursor_pk']
+    return JsonResponse({'results': rows, 'next_cursor': next_cursor, 'has_more': has_more})
+
+
+# Read-only lookups written against the async ORM. Under core_project/asgi.py they run on
+# the event loop, so a slow client holds a coroutine rather than a worker thread; under
+# WSGI Django runs them in an event loop of their own and they behave like the views above.
+
+def with_media_urls(row, names):
+    # Stored file names out, URLs (served by serve_media) in
+    for name in names:
+        value = row.pop(name)
+        row[f'{name}_url'] = default_storage.url(value) if value else None
+    return row
+
+
+def not_found():
+    return JsonResponse({'detail': 'Not found.'}, status=404)
+
+
+async def attachments(model, fields, invoice_ids):
+    """{invoice id: [row, ...]} of the Files or Images of these invoices."""
+    rows = {invoice_id: [] for invoice_id in invoice_ids}
+    file_fields = ['file', 'file_original'] if model is Image else ['file']
+    async for row in model.objects.filter(invoice_id__in=invoice_ids).order_by('pk').values(*fields, *file_fields):
+        rows[row['invoice_id']].append(with_media_urls(row, file_fields))
+    return rows
+
+
+@async_require_safe
+@api_permission_required('app_budget.view_budgetyear')
+async def budget_year_summary(request, pk):
+    """A fiscal year with its plans and their totals, straight from the rollup table."""
+    budget_year = await BudgetYear.objects.filter(pk=pk).values('id', 'fiscal_year', 'department', 'section', 'office').afirst()
+    if budget_year is None:
+        return not_found()
+    totals = {}
+    async for row in BudgetRollup.objects.filter(fiscal_year_id=pk, level__in=('budget_year', 'plan')).values('level', 'object_id', *reports.ROLLUP_TOTAL_FIELDS):
+        totals[row.pop('level'), row.pop('object_id')] = row
+    plans = [
+        {**plan, 'totals': totals.get(('plan', plan['id']))}
+        async for plan in Plan.objects.filter(fiscal_year_id=pk).order_by('pk').values('id', 'plan_code', 'plan_name')
+    ]
+    return json_response({
+        **budget_year,
+        'totals': totals.get(('budget_year', budget_year['id'])),
+        'plans': plans,
+    })
+
+
+@async_require_safe
+@api_permission_required('app_budget.view_invoice')
+async def invoice_lookup(request):
+    """Invoices numbered ?number=, with their attached files and images."""
+    number = request.GET.get('number', '').strip()
+    if not number:
+        return JsonResponse({'detail': 'number is required'}, status=400)
+    joined = {name: F(lookup) for name, lookup in INVOICE_JOINED_FIELDS.items()}
+    rows = [
+        row async for row in Invoice.objects.filter(invoice_number=number).order_by('pk')
+        .values(*INVOICE_FIELDS, **joined)[:INVOICE_LOOKUP_LIMIT]
+    ]
+    ids = [row['id'] for row in rows]
+    files = await attachments(File, FILE_FIELDS, ids)
+    images = await attachments(Image, IMAGE_FIELDS, ids)
+    for row in rows:
+        row['files'] = files[row['id']]
+        row['images'] = images[row['id']]
+    return json_response({'results': rows})
+
+
+@async_require_safe
+@api_permission_required('app_budget.view_image')
+async def image_metadata(request, pk):
+    row = await (
+        Image.objects.filter(pk=pk)
+        .values(*IMAGE_FIELDS, 'file', 'file_original', 'processing_error', sha256=F('blob__sha256'))
+        .afirst()
+    )
+    if row is None:
+        return not_found()
+    return json_response(with_media_urls(row, ('file', 'file_original')))
+
+
+@require_http_methods(['OPTIONS', 'POST'])
+def uploads(request):
+    """Resumable File uploads (tus 1.0.0, see resumable.py): capabilities and creation."""
+    if request.method == 'OPTIONS':
+        return resumable.capabilities()
+    return create_upload(request)
+
+
+@api_permission_required('app_budget.add_file')
+@resumable.tus_protocol
+def create_upload(request):
+    upload = resumable.create(request, request.user)
+    location = request.build_absolute_uri(reverse('app_budget:upload', args=[upload.pk]))
+    return resumable.tus_response(201, Location=location, **resumable.progress_headers(upload))
+
+
+@require_http_methods(['HEAD', 'PATCH', 'DELETE'])
+@api_permission_required('app_budget.add_file')
+@resumable.tus_protocol
+def upload(request, pk):
+    if request.method == 'HEAD':
+        upload = resumable.find(pk, request.user)
+    elif request.method == 'PATCH':
+        upload = resumable.append(request, pk, request.user)
+    else:
+        with transaction.atomic():
+            resumable.terminate(resumable.find(pk, request.user, lock=True))
+        return resumable.tus_response()
+    response = resumable.tus_response(**resumable.progress_headers(upload))
+    if upload.file_id is not None:
+        # Not part of tus: where the finished attachment ended up
+        response['Upload-File-Id'] = upload.file_id
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    # Invoice attachments and images; the admin login for anyone not signed in
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path(), reverse('admin:login'))
+    if not request.user.has_perm('app_budget.view_invoice'):
+        raise PermissionDenied
+    try:
+        return media.serve(request, path)
+    except (FileNotFoundError, SuspiciousFileOperation):
+        raise Http404(path)
@@ -51,6 +51,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "app_budget.changelog.ChangeLogMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -135,6 +136,96 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Media is served by app_budget.views.serve_media to users who may view invoices. The view
+# only checks access and headers: with "x-accel-redirect" nginx sends the file from an
+# internal location at MEDIA_INTERNAL_URL, e.g.
+#     location /protected-media/ { internal; alias /usr/src/app/media/; }
+# and with "x-sendfile" Apache mod_xsendfile / lighttpd does. Unset, Django streams it.
+MEDIA_SERVE_BACKEND = os.environ.get("MEDIA_SERVE_BACKEND", "")
+MEDIA_INTERNAL_URL = os.environ.get("MEDIA_INTERNAL_URL", "/protected-media/")
+
+# Uploads are hashed while they stream in and stored once per content (see app_budget.models.Blob)
+FILE_UPLOAD_HANDLERS = [
+    "app_budget.uploadhandlers.HashingMemoryFileUploadHandler",
+    "app_budget.uploadhandlers.HashingTemporaryFileUploadHandler",
+]
+
+# Large attachments can also arrive in resumable chunks at /api/uploads/ (tus 1.0.0, see
+# app_budget.resumable). File.file_size is a PositiveIntegerField, hence the size limit;
+# unfinished uploads are removed by `manage.py prune_blobs` once they have been idle
+# for RESUMABLE_UPLOAD_EXPIRY_HOURS.
+RESUMABLE_UPLOAD_MAX_SIZE = int(os.environ.get("RESUMABLE_UPLOAD_MAX_SIZE", 2**31 - 1))
+RESUMABLE_UPLOAD_EXPIRY_HOURS = int(os.environ.get("RESUMABLE_UPLOAD_EXPIRY_HOURS", 24))
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The docker-compose Redis service when REDIS_URL is set, per-process memory otherwise.
+
+REDIS_URL = os.environ.get("REDIS_URL", "")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "budget",
+            "TIMEOUT": 60 * 60 * 24,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "budget",
+        }
+    }
+
+# Sessions and authentication
+# Each admin request reads its session and user from the cache instead of the database.
+# With SESSION_WRITE_THROUGH (the default) sessions are also written to the database so
+# they survive a cache flush; turn it off to keep them in Redis only.
+
+SESSION_WRITE_THROUGH = os.environ.get("SESSION_WRITE_THROUGH", "1") == "1"
+SESSION_ENGINE = (
+    "django.contrib.sessions.backends.cached_db" if SESSION_WRITE_THROUGH
+    else "django.contrib.sessions.backends.cache"
+)
+AUTHENTICATION_BACKENDS = ["app_budget.auth_backends.CachedModelBackend"]
+AUTH_USER_CACHE_TIMEOUT = 60 * 5
+
+# Admin search
+# Dotted path of the app_budget.search backend; empty picks one for the database vendor
+# (pg_trgm-indexed LIKE on PostgreSQL, an FTS5 trigram table on SQLite).
+
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND") or None
+
+# Changelists with keyset pagination show the planner's row estimate instead of an exact
+# COUNT(*) once the estimate reaches this many rows (PostgreSQL only).
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.environ.get("ADMIN_ESTIMATED_COUNT_THRESHOLD", 100_000))
+
+# The invoice sync API (/api/invoices/) only returns rows whose updated_at is at least this
+# old, so a slow transaction cannot commit a row behind a client's cursor.
+INVOICE_SYNC_SETTLE_SECONDS = int(os.environ.get("INVOICE_SYNC_SETTLE_SECONDS", 60))
+
+# Background jobs
+# Uploaded images are converted to WebP by `manage.py process_images`, using the
+# docker-compose Redis service as the queue. Without REDIS_URL they run in-process.
+
+IMAGE_PROCESSING_BACKEND = os.environ.get("IMAGE_PROCESSING_BACKEND", "redis" if REDIS_URL else "inline")
+IMAGE_PROCESSING_MAX_ATTEMPTS = 3
+# Seconds before a failed job is retried, doubled after each attempt, and after which a
+# row still marked 'processing' is taken to belong to a dead worker.
+IMAGE_PROCESSING_RETRY_DELAY = int(os.environ.get("IMAGE_PROCESSING_RETRY_DELAY", 60))
+IMAGE_PROCESSING_STALE_AFTER = int(os.environ.get("IMAGE_PROCESSING_STALE_AFTER", 15 * 60))
+
+# WebP derivatives: longest side in pixels, largest original accepted (decompression
+# bomb guard), encoder quality, and the size above which the encoded output is
+# spooled to a temporary file instead of RAM.
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 2560))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 80_000_000))
+IMAGE_WEBP_QUALITY = int(os.environ.get("IMAGE_WEBP_QUALITY", 80))
+IMAGE_SPOOL_MAX_SIZE = 2 * 1024 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
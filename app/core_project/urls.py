@@ -1,10 +1,12 @@
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from app_budget.views import serve_media
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    path("api/", include("app_budget.urls")),
+    # In production too: access is checked here, the bytes go out through MEDIA_SERVE_BACKEND
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", serve_media, name="media"),
+]
\ No newline at end of file